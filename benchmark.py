@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""This script benchmarks the hot paths of cipher.py"""
+# -*- coding: utf-8 -*-
+#
+# Cipher Benchmarks
+# Copyright (c) 2020 Peter Robards
+#
+##########################################################################################
+#
+# Times caesar_cipher(), vigenere_cipher(), substitution_cipher(), file_cipher() and
+#  input_from_file() over a range of input sizes, line lengths, key lengths, shift
+#  directions and alphabet sizes (up to 20K CJK characters), reporting throughput (MB/s), per call latency percentiles and peak
+#  memory. Results can be saved to JSON and compared against a committed baseline,
+#  in which case any case slower (or hungrier) than the baseline by more than the
+#  threshold is reported as a regression and the script exits with status 1.
+#
+#   python3 benchmark.py                                  # run and compare to baseline
+#   python3 benchmark.py --sizes 1K,1M,1G --output out.json
+#   python3 benchmark.py --save-baseline                  # record a new baseline
+#
+##########################################################################################
+
+import io
+import os
+import sys
+import json
+import string
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import time
+import tracemalloc
+
+import cipher
+
+# Baseline results committed alongside this script
+BASELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"
+)
+
+# Default benchmark parameters - sizes up to 1G can be requested with --sizes
+DEFAULT_SIZES = "1K,64K,1M,16M"
+DEFAULT_LINE_LENGTHS = "80,4096"
+DEFAULT_KEY_LENGTHS = "3,64"
+DEFAULT_SHIFTS = "right,left"
+DEFAULT_ALPHABETS = "95,1K,20K"
+
+# Fraction a result may fall behind the baseline before it counts as a regression
+DEFAULT_THRESHOLD = 0.25
+
+# Total bytes processed per case is capped so large inputs aren't repeated endlessly
+REPEAT_BUDGET = 1 << 26
+
+# Same 95 character set used by cipher.py
+CHARACTER_SET = (
+    string.ascii_lowercase
+    + string.ascii_uppercase
+    + string.digits
+    + " "
+    + string.punctuation
+)
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+# Method to convert a size such as "64K" or "1G" into a number of bytes
+def parse_size(size):
+    """Convert a size with an optional K, M or G suffix into bytes"""
+    size = size.strip().upper()
+    if size[-1:] in UNITS:
+        return int(size[:-1]) * UNITS[size[-1]]
+
+    return int(size)
+
+
+# Method to describe a number of bytes as a short size such as "64K"
+def format_size(size):
+    """Describe a number of bytes with a K, M or G suffix"""
+    for suffix in "GMK":
+        if size >= UNITS[suffix] and size % UNITS[suffix] == 0:
+            return "{}{}".format(size // UNITS[suffix], suffix)
+
+    return str(size)
+
+
+# Method to generate reproducible text from the character set, with a line break
+#  every line_length characters (or none at all)
+def make_text(size, line_length=None, seed=0, characters=CHARACTER_SET):
+    """Generate size characters of reproducible text"""
+    generator = random.Random(seed)
+    # build one 64K chunk and repeat it, generating 1G characters one at a time is slow
+    chunk = "".join(generator.choices(characters, k=min(size, 1 << 16)))
+    text = (chunk * (size // len(chunk) + 1))[:size]
+
+    if not line_length:
+        return text
+
+    lines = [text[i : i + line_length - 1] for i in range(0, size, line_length)]
+
+    return "\n".join(lines)[:size]
+
+
+# Method to build an alphabet of size distinct characters - the 95 character set for
+#  small sizes, then a run of code points from Cyrillic onwards (up to 4K characters)
+#  or from the CJK ideographs onwards for larger alphabets
+def make_alphabet(size):
+    """Build an alphabet of size distinct characters"""
+    if size <= len(CHARACTER_SET):
+        return CHARACTER_SET[:size]
+
+    start = 0x400 if size <= 0x1000 else 0x4E00
+
+    return "".join(map(chr, range(start, start + size)))
+
+
+# Method to time repeated calls of a function, returning the latency of each call
+#  along with the peak memory of one extra call traced by tracemalloc
+def measure(function, repeat):
+    """Time repeated calls of a function and trace the memory of one more"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+
+    # tracing slows everything down, so memory is measured on its own call
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return latencies, peak
+
+
+# Method to find a percentile of a list of latencies
+def percentile(values, fraction):
+    """Nearest rank percentile of a list of values"""
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(fraction * len(values) + 0.5) - 1))
+
+    return values[rank]
+
+
+# Method to summarise the measurements of one benchmark case
+def summarise(size, latencies, peak):
+    """Throughput, latency percentiles and peak memory of one case"""
+    median = percentile(latencies, 0.5)
+
+    return {
+        "bytes": size,
+        "calls": len(latencies),
+        "mb_s": round(size / (1 << 20) / median, 2) if median else None,
+        "p50_ms": round(median * 1000, 4),
+        "p90_ms": round(percentile(latencies, 0.9) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "peak_bytes": peak,
+    }
+
+
+# Method to build every benchmark case - a name plus the setup that returns the
+#  function to time (setup runs before timing so generated inputs aren't counted)
+def benchmark_cases(sizes, line_lengths, key_lengths, shifts, directory, alphabets=()):
+    """Yield (name, size, setup) for every benchmark case"""
+    generator = random.Random(1)
+    alphabet = list(CHARACTER_SET)
+    generator.shuffle(alphabet)
+    alphabet = "".join(alphabet)
+
+    for size in sizes:
+        label = format_size(size)
+
+        for shift in shifts:
+
+            def caesar(size=size, shift=shift):
+                text = make_text(size)
+                return lambda: cipher.caesar_cipher(
+                    text, 7, CHARACTER_SET, False, shift
+                )
+
+            yield "caesar/{}/{}".format(label, shift), size, caesar
+
+            for key_length in key_lengths:
+
+                def vigenere(size=size, shift=shift, key_length=key_length):
+                    text = make_text(size)
+                    key = make_text(key_length, seed=2)
+                    return lambda: cipher.vigenere_cipher(
+                        text, key, CHARACTER_SET, False, shift
+                    )
+
+                name = "vigenere/{}/key{}/{}".format(label, key_length, shift)
+                yield name, size, vigenere
+
+        def substitution(size=size):
+            text = make_text(size)
+            return lambda: cipher.substitution_cipher(text, alphabet, CHARACTER_SET)
+
+        yield "substitution/{}".format(label), size, substitution
+
+        # large alphabets - sizes are in characters, which take 2 or 4 bytes each
+        for alphabet_size in alphabets:
+            characters = make_alphabet(alphabet_size)
+            prefix = "alphabet{}/{}".format(format_size(alphabet_size), label)
+
+            def wide_caesar(size=size, characters=characters):
+                text = make_text(size, characters=characters)
+                return lambda: cipher.caesar_cipher(text, 7, characters)
+
+            yield prefix + "/caesar", size, wide_caesar
+
+            def wide_vigenere(size=size, characters=characters):
+                text = make_text(size, characters=characters)
+                key = make_text(64, seed=2, characters=characters)
+                return lambda: cipher.vigenere_cipher(text, key, characters)
+
+            yield prefix + "/vigenere/key64", size, wide_vigenere
+
+            def wide_substitution(size=size, characters=characters):
+                text = make_text(size, characters=characters)
+                shuffled = list(characters)
+                random.Random(1).shuffle(shuffled)
+                shuffled = "".join(shuffled)
+                return lambda: cipher.substitution_cipher(text, shuffled, characters)
+
+            yield prefix + "/substitution", size, wide_substitution
+
+        for line_length in line_lengths:
+            file_name = os.path.join(
+                directory, "input_{}_{}.txt".format(label, line_length)
+            )
+
+            def write_input(size=size, line_length=line_length, file_name=file_name):
+                if not os.path.exists(file_name):
+                    with open(file_name, "w") as file:
+                        file.write(make_text(size, line_length))
+
+            for mode, block_size in (
+                ("lines", None),
+                ("stream", cipher.FILE_BLOCK_SIZE),
+            ):
+
+                # results are written to os.devnull, so the timings measure the
+                #  cipher rather than how quickly the disk truncates the last output
+                def file_case(
+                    file_name=file_name, block_size=block_size, write=write_input
+                ):
+                    write()
+                    return lambda: cipher.file_cipher(
+                        file_name,
+                        os.devnull,
+                        "key",
+                        CHARACTER_SET,
+                        enc_type="Vigenere",
+                        block_size=block_size,
+                        verbose=False,
+                    )
+
+                name = "file_cipher/{}/line{}/{}".format(label, line_length, mode)
+                yield name, size, file_case
+
+            def read_case(file_name=file_name, write=write_input):
+                write()
+
+                def read():
+                    # input_from_file() reports where the text came from - keep it quiet
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        cipher.input_from_file(file_name)
+
+                return read
+
+            yield "input_from_file/{}/line{}".format(
+                label, line_length
+            ), size, read_case
+
+
+# Method to run the benchmark cases whose names contain the filter text
+def run_benchmarks(cases, repeat, name_filter=None):
+    """Run benchmark cases, returning their results by name"""
+    results = {}
+    for name, size, setup in cases:
+        if name_filter and name_filter not in name:
+            continue
+
+        function = setup()
+        # warm up once, so table building and caching aren't counted in the timings
+        function()
+
+        calls = max(1, min(repeat, REPEAT_BUDGET // max(size, 1)))
+        results[name] = summarise(size, *measure(function, calls))
+        print_result(name, results[name])
+
+    return results
+
+
+# Method to display the result of one benchmark case
+def print_result(name, result):
+    """Print the result of one benchmark case"""
+    print(
+        "{:<40} {:>10} MB/s  p50 {:>10.3f} ms  p99 {:>10.3f} ms  peak {:>12,} B".format(
+            name,
+            result["mb_s"],
+            result["p50_ms"],
+            result["p99_ms"],
+            result["peak_bytes"],
+        )
+    )
+
+
+# Method to compare results against a baseline, returning a description of each
+#  case that fell behind the baseline by more than the threshold
+def compare(results, baseline, threshold):
+    """Find the regressions of results against a baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        before = baseline[name]
+        if before["mb_s"] and result["mb_s"] < before["mb_s"] * (1 - threshold):
+            regressions.append(
+                "{}: {} MB/s, baseline {} MB/s".format(
+                    name, result["mb_s"], before["mb_s"]
+                )
+            )
+        # small allocations are noisy, so memory is only compared above 1 MB
+        if result["peak_bytes"] > 1 << 20 and result["peak_bytes"] > before[
+            "peak_bytes"
+        ] * (1 + threshold):
+            regressions.append(
+                "{}: peak {:,} B, baseline {:,} B".format(
+                    name, result["peak_bytes"], before["peak_bytes"]
+                )
+            )
+
+    return regressions
+
+
+#########################################################################################
+#                                  Main Function                                        #
+#########################################################################################
+
+
+def main():
+    """Run the benchmarks and compare them against the baseline"""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--sizes",
+        dest="sizes",
+        default=DEFAULT_SIZES,
+        help="Comma separated input sizes, e.g. 1K,1M,1G. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--line-lengths",
+        dest="line_lengths",
+        default=DEFAULT_LINE_LENGTHS,
+        help="Comma separated line lengths of file inputs. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--key-lengths",
+        dest="key_lengths",
+        default=DEFAULT_KEY_LENGTHS,
+        help="Comma separated Vigenere key lengths. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--shifts",
+        dest="shifts",
+        default=DEFAULT_SHIFTS,
+        help="Comma separated shift directions. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--alphabets",
+        dest="alphabets",
+        default=DEFAULT_ALPHABETS,
+        help="Comma separated alphabet sizes for the large alphabet cases. "
+        "Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=20,
+        help="Most timed calls per case. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--filter",
+        dest="filter",
+        help="Only run cases whose name contains this text.",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        help="Save the results as JSON to the provided file name.",
+    )
+    parser.add_argument(
+        "--baseline",
+        dest="baseline",
+        default=BASELINE_FILE,
+        help="Baseline JSON file the results are compared against.",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        dest="save_baseline",
+        action="store_true",
+        help="Save the results as the new baseline instead of comparing.",
+    )
+    parser.add_argument(
+        "--threshold",
+        dest="threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Fraction slower than the baseline that counts as a regression. "
+        "Default = %(default)s ",
+    )
+
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    line_lengths = [int(length) for length in args.line_lengths.split(",")]
+    key_lengths = [int(length) for length in args.key_lengths.split(",")]
+    shifts = args.shifts.split(",")
+    alphabets = [parse_size(size) for size in args.alphabets.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cases = benchmark_cases(
+            sizes, line_lengths, key_lengths, shifts, directory, alphabets
+        )
+        results = run_benchmarks(cases, args.repeat, args.filter)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": cipher.np is not None,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print("\nThe results have been saved to: {}".format(args.output))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print("\nThe baseline has been saved to: {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline found at: {}".format(args.baseline))
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\nRegressions against {}:".format(args.baseline))
+        for regression in regressions:
+            print("\t" + regression)
+        return 1
+
+    print("\nNo regressions against {}".format(args.baseline))
+    return 0
+
+
+###########################################################################################
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,22 +8,141 @@
 ##########################################################################################
 #
 # usage: Cipher.py [-h] [-E] [-D] [-f] [-i INPUTFILE] [-o OUTPUTFILE]
-#                    [-S {left,right}] [-T {Caesar,Substitution,Vigenere}]
+#                 [-S {left,right}] [-T TYPE] [--key KEY] [--key-file KEY_FILE]
+#                 [--alphabet-file ALPHABET_FILE] [--keystore FILE]
+#                 [--key-id ID] [--generate-keys COUNT]
+#                 [--key-length KEY_LENGTH] [--charset-file CHARSET_FILE]
+#                 [--stream] [--block-size BLOCK_SIZE] [--workers WORKERS]
+#                 [--in-place] [--fsync] [--atomic] [--range START:END]
+#                 [--lines START:END] [--index] [--batch BATCH] [--processes]
+#                 [--skip-unchanged] [--crack] [--recover-key PLAINFILE]
+#                 [--sample SAMPLE] [--top TOP] [--wordlist WORDLIST]
+#                 [--checkpoint FILE] [--max-key-length MAX_KEY_LENGTH]
+#                 [--corpus CORPUS] [--train CORPUS] [--restarts RESTARTS]
+#                 [--time-limit TIME_LIMIT] [--jobs PATH] [--serve [HOST:]PORT]
+#                 [--serve-timeout SERVE_TIMEOUT] [--loadgen [HOST:]PORT]
+#                 [--requests REQUESTS] [--concurrency CONCURRENCY]
+#                 [--payload-size PAYLOAD_SIZE] [--stats [{text,json}]]
+#                 [--stats-profile STATS_PROFILE]
+#                 [--backend {auto,python,numpy}]
 #
 # optional arguments:
 #  -h, --help            show this help message and exit
 #  -E, --encrypt         Signals that user wants to encrypt text.
 #  -D, --decrypt         Signals that user wants to decrypt text.
 #  -f, --file            File used as source with results saved to new File.
-#  -i INPUTFILE, --input_from_file INPUTFILE
-#                        Load text from the provided file name.
-#  -o OUTPUTFILE, --output_to_file OUTPUTFILE
+#  -i INPUTFILE, --inputfile INPUTFILE
+#                        Load text from the provided file name, or "-" to
+#                        stream stdin to stdout.
+#  -o OUTPUTFILE, --outputfile OUTPUTFILE
 #                        Save results to the provided file name.
 #  -S {left,right}, --shift {left,right}
 #                        Choose between 'right' or 'left' direction for key
 #                        shift. Default = "right"
-#  -T {Caesar,Substitution,Vigenere}, --type {Caesar,Substitution,Vigenere}
-#                       Choose between encryption methods. Default = "Caesar"
+#  -T TYPE, --type TYPE  Choose between encryption methods - Caesar,
+#                        Substitution, Vigenere, Columnar or RailFence - or
+#                        chain them into a pipeline of Type:key stages such as
+#                        Caesar:3,Substitution:@alpha.txt,Vigenere:@key.txt (@
+#                        reads a key from a file). Default = "Caesar"
+#  --key KEY             Key for the cipher - an integer for Caesar, a word or
+#                        phrase for Vigenere or Columnar, the number of rails
+#                        for RailFence or a cipher alphabet for Substitution.
+#  --key-file KEY_FILE   Load the key for the cipher from the provided file
+#                        name.
+#  --alphabet-file ALPHABET_FILE
+#                        Load the Substitution cipher alphabet from the
+#                        provided file name.
+#  --keystore FILE       Key store file for --key-id and --generate-keys, and
+#                        for the key_id of jobs and the X-Cipher-Key-Id header
+#                        of service requests.
+#  --key-id ID           Use key ID of the --keystore, whose cipher type
+#                        replaces -T.
+#  --generate-keys COUNT
+#                        Generate COUNT random -T Substitution or Vigenere keys
+#                        with the secrets module and add them to the
+#                        --keystore.
+#  --key-length KEY_LENGTH
+#                        Length of the Vigenere keys made by --generate-keys.
+#                        Default = 16
+#  --charset-file CHARSET_FILE
+#                        Load the character set from the provided file name
+#                        (UTF-8) instead of the 95 character default - any
+#                        alphabet of distinct characters can be used.
+#  --stream              Stream files in fixed size blocks instead of lines,
+#                        keeping the Vigenere key position across lines.
+#  --block-size BLOCK_SIZE
+#                        Number of characters read per block when streaming.
+#                        Default = 1048576
+#  --workers WORKERS     Translate files in byte ranges across this many worker
+#                        processes.
+#  --in-place            Translate the input file in place via a memory map
+#                        instead of a new file.
+#  --fsync               Flush in place results to disk before finishing.
+#  --atomic              Translate in place via a temporary copy that replaces
+#                        the original file.
+#  --range START:END     Only translate the bytes from START to END of the
+#                        input file, seeking straight to START. Use --stream
+#                        for files translated as one stream.
+#  --lines START:END     Only translate lines START to END (counted from 0) of
+#                        the input file, found through its .idx line index.
+#  --index               Build the .idx line index of the input file used by
+#                        --range and --lines.
+#  --batch BATCH         Translate a directory tree (into the -o directory) or
+#                        a manifest of input<TAB>output file pairs.
+#  --processes           Use worker processes rather than threads for --batch.
+#  --skip-unchanged      Skip --batch files whose output is newer and the same
+#                        size.
+#  --crack               Recover the most likely keys for the ciphertext
+#                        instead of decrypting it.
+#  --recover-key PLAINFILE
+#                        Recover the key from this plaintext and its ciphertext
+#                        (-i), saving it to -o when complete. Use --stream for
+#                        files translated as one stream.
+#  --sample SAMPLE       Only analyse the first SAMPLE characters of the input
+#                        when cracking.
+#  --top TOP             Number of candidate keys to report when cracking.
+#                        Default = 5
+#  --wordlist WORDLIST   Crack a Vigenere key by trying every word of this file
+#                        as the key, scored across --workers processes.
+#  --checkpoint FILE     Save the progress of a --wordlist attack to FILE, and
+#                        carry on from it when the attack is run again.
+#  --max-key-length MAX_KEY_LENGTH
+#                        Longest Vigenere key considered when cracking. Default
+#                        = 20
+#  --corpus CORPUS       Plaintext file, or model file saved by --train, giving
+#                        the language statistics used when cracking - required
+#                        for Substitution.
+#  --train CORPUS        Count the 1 to 4-grams of a plaintext corpus and save
+#                        them as a model file (-o) for --corpus.
+#  --restarts RESTARTS   Number of hill climbs when cracking Substitution.
+#                        Default = 16
+#  --time-limit TIME_LIMIT
+#                        Seconds allowed for cracking Substitution. Default =
+#                        60.0
+#  --jobs PATH           Run the JSON jobs in this file (or "-" for stdin), one
+#                        per line, writing a JSON result per line.
+#  --serve [HOST:]PORT   Run as an HTTP service on this address (localhost
+#                        unless a HOST is given).
+#  --serve-timeout SERVE_TIMEOUT
+#                        Seconds --serve waits for a client to send more of a
+#                        request before closing its connection. Default = 30.0
+#  --loadgen [HOST:]PORT
+#                        Measure the requests per second and latency of a
+#                        running service.
+#  --requests REQUESTS   Number of requests sent by --loadgen. Default = 1000
+#  --concurrency CONCURRENCY
+#                        Number of connections used by --loadgen. Default = 16
+#  --payload-size PAYLOAD_SIZE
+#                        Bytes in each --loadgen request body. Default = 1024
+#  --stats [{text,json}]
+#                        Report the time, CPU, bytes and memory of each phase
+#                        on stderr as text or json. Default = "text"
+#  --stats-profile STATS_PROFILE
+#                        With --stats, save a cProfile profile of the transform
+#                        to this file name.
+#  --backend {auto,python,numpy}
+#                        Choose how text is translated, "numpy" requires NumPy.
+#                        Default = "auto"
 #
 ##########################################################################################
 #
@@ -34,17 +153,536 @@
 #
 ##########################################################################################
 
+import io
+import os
 import sys
+import mmap
+import array
+import shutil
+import struct
+import bisect
 import string
 import random
 import argparse
+import tempfile
+import gzip
+import secrets
+import heapq
+import hashlib
+import collections
+import math
+import time
+import json
+import atexit
+import codecs
+import asyncio
+import cProfile
+import functools
+import itertools
+import threading
+import contextlib
+import tracemalloc
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 
+# bz2 and lzma are left out of some Python builds - compressed files in those formats
+#  can only be read and written when they are available
+try:
+    import bz2
+except ImportError:
+    bz2 = None
 
-# Method to Encrypt and/or Decrypt Text via a Caesar Cipher
-def caesar_cipher(
-    text, key, characters=string.ascii_lowercase, decrypt=False, shift_type="right"
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# NumPy is optional - when it is installed, large inputs are translated with
+#  vectorized lookup tables instead of str.translate()
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Backends available for the ciphers:
+#  "python" always uses str.translate(), "numpy" uses NumPy lookup tables when possible
+#  and "auto" picks NumPy for large inputs where it beats str.translate()
+BACKENDS = ["auto", "python", "numpy"]
+
+# Minimum number of characters before the "auto" backend hands text to NumPy
+NUMPY_THRESHOLD = 1 << 20
+
+# Statistics about the current run, collected while --stats is used or after
+#  enable_stats() is called. None otherwise, so collecting them costs nothing when off
+STATS = None
+
+# Phases of a run, in the order they are reported
+STATS_PHASES = ["key", "tables", "read", "transform", "write"]
+
+# Context used in place of a phase when statistics aren't being collected
+NO_STATS = contextlib.nullcontext()
+
+
+# Statistics about a run: the wall and CPU time of each phase, the bytes read and
+#  written, the number of calls made to the cipher functions and the peak memory.
+#  Phases can be nested - the time of a nested phase isn't counted again by the phase
+#  around it, so reading and writing inside a transform loop are reported separately
+class Stats:
+    """Per phase timings, byte counts and calls collected during a run"""
+
+    __slots__ = (
+        "phases",
+        "calls",
+        "bytes_in",
+        "bytes_out",
+        "peak",
+        "started",
+        "profiler",
+        "local",
+        "lock",
+    )
+
+    def __init__(self, profile=False):
+        # name: [entries, wall seconds, CPU seconds]
+        self.phases = {}
+        self.calls = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak = None
+        self.started = (time.perf_counter(), time.process_time())
+        # with profile=True the transform phase is profiled with cProfile
+        self.profiler = cProfile.Profile() if profile else None
+        # each thread keeps its own stack of the phases it is in
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase, leaving out the time spent in phases nested inside it"""
+        stack = self.local.__dict__.setdefault("stack", [])
+        # only the outermost transform of the main thread is profiled - a profiler
+        #  can't be enabled twice or from several threads at once
+        profile = (
+            self.profiler is not None
+            and name == "transform"
+            and threading.current_thread() is threading.main_thread()
+            and all(outer[0] != "transform" for outer in stack)
+        )
+
+        # [name, wall seconds, CPU seconds] of the phases nested inside this one
+        nested = [name, 0.0, 0.0]
+        stack.append(nested)
+
+        if profile:
+            self.profiler.enable()
+
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+
+            if profile:
+                self.profiler.disable()
+
+            stack.pop()
+            if stack:
+                stack[-1][1] += wall
+                stack[-1][2] += cpu
+
+            with self.lock:
+                totals = self.phases.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += wall - nested[1]
+                totals[2] += cpu - nested[2]
+
+    def count(self, name):
+        """Count a call to one of the cipher functions"""
+        with self.lock:
+            self.calls[name] += 1
+
+    def add_bytes(self, read=0, written=0):
+        """Count bytes (or characters, for text) read and written"""
+        with self.lock:
+            self.bytes_in += read
+            self.bytes_out += written
+
+    def report(self):
+        """Return the statistics collected so far as a dict"""
+        wall = time.perf_counter() - self.started[0]
+        cpu = time.process_time() - self.started[1]
+
+        peak = self.peak
+        if peak is None and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+
+        names = [name for name in STATS_PHASES if name in self.phases]
+        names += sorted(name for name in self.phases if name not in STATS_PHASES)
+        phases = {}
+        for name in names:
+            entries, phase_wall, phase_cpu = self.phases[name]
+            phases[name] = {"calls": entries, "wall": phase_wall, "cpu": phase_cpu}
+
+        return {
+            "wall": wall,
+            "cpu": cpu,
+            "other_wall": wall - sum(phase["wall"] for phase in phases.values()),
+            "phases": phases,
+            "calls": dict(self.calls),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "peak_memory": peak,
+        }
+
+
+# Method to start collecting statistics about everything the module does from now on
+#  profile=True also profiles the transform phase with cProfile, while memory=True
+#  traces allocations with tracemalloc to find the peak memory (which slows things down)
+def enable_stats(profile=False, memory=True):
+    """Start collecting statistics, returning the Stats object they are collected in"""
+    global STATS
+    STATS = Stats(profile)
+
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    return STATS
+
+
+# Method to stop collecting statistics - returns the Stats object, whose report()
+#  still holds everything collected up to this point
+def disable_stats():
+    """Stop collecting statistics"""
+    global STATS
+    stats = STATS
+    STATS = None
+
+    if stats is not None and tracemalloc.is_tracing():
+        stats.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return stats
+
+
+# Method to time a phase of the run when statistics are being collected
+def stats_phase(name):
+    """Context that times a phase when statistics are being collected"""
+    if STATS is None:
+        return NO_STATS
+
+    return STATS.phase(name)
+
+
+# Decorator that counts the calls made to a function and times them as a phase,
+#  when statistics are being collected
+def record_stats(phase):
+    """Count and time calls to the decorated function as a phase"""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if STATS is None:
+                return function(*args, **kwargs)
+
+            STATS.count(function.__name__)
+            with STATS.phase(phase):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+# File wrapper that times reads and writes as phases and counts the bytes they move
+#  only used while statistics are being collected, see stats_file()
+class StatsFile:
+    """Wrap a file so reads and writes are timed and counted"""
+
+    __slots__ = ("file",)
+
+    def __init__(self, file):
+        self.file = file
+
+    def read(self, *args):
+        with STATS.phase("read"):
+            data = self.file.read(*args)
+        STATS.add_bytes(read=len(data))
+        return data
+
+    def read1(self, *args):
+        with STATS.phase("read"):
+            data = self.file.read1(*args)
+        STATS.add_bytes(read=len(data))
+        return data
+
+    def write(self, data):
+        with STATS.phase("write"):
+            written = self.file.write(data)
+        STATS.add_bytes(written=len(data))
+        return written
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with STATS.phase("read"):
+            line = next(self.file)
+        STATS.add_bytes(read=len(line))
+        return line
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+# Method to wrap a file so its reads and writes are recorded when statistics are
+#  being collected - otherwise the file is returned as it is
+def stats_file(file):
+    """Wrap a file for statistics, if they are being collected"""
+    if STATS is None:
+        return file
+
+    return StatsFile(file)
+
+
+# Method to display the statistics collected about a run as text or JSON on stderr
+#  and save the profile of the transform phase when a profile file is provided
+def print_stats(stats, output="text", profile_file=None):
+    """Report the statistics of a run on stderr"""
+    report = stats.report()
+
+    if output == "json":
+        print(json.dumps(report, indent=2), file=sys.stderr)
+    else:
+        lines = [
+            "\n**** STATISTICS ****\n",
+            "{:<12} {:>8} {:>12} {:>12}".format(
+                "phase", "calls", "wall (s)", "cpu (s)"
+            ),
+        ]
+        for name, phase in report["phases"].items():
+            lines.append(
+                "{:<12} {:>8} {:>12.6f} {:>12.6f}".format(
+                    name, phase["calls"], phase["wall"], phase["cpu"]
+                )
+            )
+        lines.append("{:<12} {:>8} {:>12.6f}".format("other", "", report["other_wall"]))
+        lines.append(
+            "{:<12} {:>8} {:>12.6f} {:>12.6f}\n".format(
+                "total", "", report["wall"], report["cpu"]
+            )
+        )
+        lines.append("Bytes in:    {:,}".format(report["bytes_in"]))
+        lines.append("Bytes out:   {:,}".format(report["bytes_out"]))
+        if report["peak_memory"] is not None:
+            lines.append("Peak memory: {:,} bytes".format(report["peak_memory"]))
+        for name, calls in sorted(report["calls"].items()):
+            lines.append("Calls to {}: {:,}".format(name, calls))
+
+        print("\n".join(lines), file=sys.stderr)
+
+    if profile_file and stats.profiler is not None:
+        stats.profiler.dump_stats(profile_file)
+        print(
+            "\nThe transform profile has been saved to: {}".format(profile_file),
+            file=sys.stderr,
+        )
+
+
+# Method run when the program exits with --stats - stops collecting and reports
+def finish_stats(output="text", profile_file=None):
+    """Stop collecting statistics and report them"""
+    stats = disable_stats()
+
+    if stats is not None:
+        print_stats(stats, output, profile_file)
+
+
+# Alphabets of at least this many characters get compact translation tables...
+COMPACT_TABLE_SIZE = 256
+
+# ...as long as their code points aren't spread out more than this many per character
+COMPACT_TABLE_SPREAD = 16
+
+
+# Method to find the position of every character of a character set (or cipher
+#  alphabet) in a single pass, so looking up a character is O(1) however large the
+#  alphabet is. A repeated character would make the cipher ambiguous, so is rejected
+@functools.lru_cache(maxsize=32)
+def character_index(characters, name="Character set"):
+    """Map each character of an alphabet to its position"""
+    index = {}
+
+    for i, character in enumerate(characters):
+        if index.setdefault(character, i) != i:
+            raise CipherError(
+                "{} contains {!r} more than once (positions {} and {})".format(
+                    name, character, index[character], i
+                )
+            )
+
+    return index
+
+
+# Method to build a translation table that maps each character of source to the
+#  character at the same position of target. Small alphabets get a str.maketrans() dict,
+#  while large ones get a compact str holding the translation of every code point up to
+#  the highest in source - str.translate() accepts either, and leaves characters past
+#  the end of the str untouched. For 20,000 CJK characters that is 80 KB rather than 1 MB
+def translation_table(source, target):
+    """Build a translation table from source to target for str.translate()"""
+    if len(source) < COMPACT_TABLE_SIZE:
+        return str.maketrans(source, target)
+
+    if np is not None:
+        # NumPy builds the table as an array of code points, without a dict in between
+        sources = np.frombuffer(source.encode("utf-32-le", "surrogatepass"), np.uint32)
+        top = int(sources.max()) + 1
+        if top > COMPACT_TABLE_SPREAD * len(source):
+            return str.maketrans(source, target)
+
+        lookup = np.arange(top, dtype=np.uint32)
+        lookup[sources] = np.frombuffer(
+            target.encode("utf-32-le", "surrogatepass"), np.uint32
+        )
+
+        return lookup.tobytes().decode("utf-32-le", "surrogatepass")
+
+    table = str.maketrans(source, target)
+    top = max(table) + 1
+    if top > COMPACT_TABLE_SPREAD * len(source):
+        return table
+
+    return "".join(map(chr, range(top))).translate(table)
+
+
+# Method to list the (source, target) code points a translation table changes
+#  accepts both the dicts and the compact str tables built by translation_table()
+def table_items(table):
+    """The (source, target) code point pairs of a translation table"""
+    if isinstance(table, dict):
+        return table.items()
+
+    return [
+        (source, ord(target))
+        for source, target in enumerate(table)
+        if ord(target) != source
+    ]
+
+
+# Method to convert a translation table into a NumPy lookup table covering all 256
+#  Latin-1 code points - characters outside the table map to themselves
+def numpy_lookup_table(table):
+    """Convert a translation table into a 256 entry NumPy lookup table"""
+    lookup = np.arange(256, dtype=np.uint8)
+
+    for source, target in table_items(table):
+        if source < 256:
+            # a Latin-1 character that maps outside Latin-1 can't be stored in a byte
+            if target >= 256:
+                return None
+            lookup[source] = target
+
+    return lookup
+
+
+# Method to decide whether a piece of text should be translated via NumPy
+def use_numpy(text, characters, backend="auto"):
+    """Decide whether the NumPy backend should be used for the provided text"""
+    if np is None or backend == "python":
+        return False
+
+    if backend == "numpy":
+        return True
+
+    # str.translate() already has a very fast path for pure ASCII text, so NumPy is
+    #  only worth it for large inputs that fall outside that path
+    return len(text) >= NUMPY_THRESHOLD and not (
+        text.isascii() and characters.isascii()
+    )
+
+
+# Method to translate text with NumPy lookup tables - one table per key letter
+#  (a single table for Caesar and Substitution Ciphers). Returns None if the text
+#  or tables fall outside Latin-1, in which case the pure Python path must be used
+def numpy_translate(text, tables):
+    """Translate text via NumPy lookup tables, one table for each column"""
+    try:
+        data = np.frombuffer(text.encode("latin-1"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        return numpy_translate_wide(text, tables)
+
+    lookups = [numpy_lookup_table(table) for table in tables]
+
+    if any(lookup is None for lookup in lookups):
+        return None
+
+    size = len(lookups)
+
+    if size == 1:
+        translated = lookups[0][data]
+    else:
+        # every size-th byte (a column) is translated with the lookup for its key letter
+        translated = np.empty_like(data)
+        for i in range(size):
+            translated[i::size] = lookups[i][data[i::size]]
+
+    return translated.tobytes().decode("latin-1")
+
+
+# Method to convert a translation table into a NumPy lookup table of code points,
+#  covering every code point up to the highest one the table changes
+def numpy_codepoint_table(table):
+    """Convert a translation table into a uint32 NumPy lookup table of code points"""
+    if isinstance(table, str):
+        # a compact table already holds the translation of every code point in order
+        return np.frombuffer(table.encode("utf-32-le", "surrogatepass"), np.uint32)
+
+    pairs = np.array(list(table.items()), dtype=np.uint32).reshape(-1, 2)
+    lookup = np.arange(int(pairs[:, 0].max(initial=0)) + 1, dtype=np.uint32)
+    lookup[pairs[:, 0]] = pairs[:, 1]
+
+    return lookup
+
+
+# Method to translate text that falls outside Latin-1 with NumPy - the text is handled
+#  as an array of code points, translated by uint32 lookup tables. Each lookup table is
+#  extended to the highest code point in the text, leaving the extra code points as they are
+def numpy_translate_wide(text, tables):
+    """Translate text via NumPy code point lookup tables, one for each column"""
+    data = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    top = int(data.max(initial=0)) + 1
+
+    lookups = []
+    for table in tables:
+        lookup = numpy_codepoint_table(table)
+        if len(lookup) < top:
+            extra = np.arange(len(lookup), top, dtype=np.uint32)
+            lookup = np.concatenate([lookup, extra])
+        lookups.append(lookup)
+
+    size = len(lookups)
+
+    if size == 1:
+        translated = lookups[0][data]
+    else:
+        translated = np.empty_like(data)
+        for i in range(size):
+            translated[i::size] = lookups[i][data[i::size]]
+
+    return translated.tobytes().decode("utf-32-le", "surrogatepass")
+
+
+# Method to build the translation table used by the Caesar Cipher
+def caesar_table(
+    key, characters=string.ascii_lowercase, decrypt=False, shift_type="right"
 ):
-    """Encrypt and/or Decrypt Text via a Caesar Cipher"""
+    """Build the translation table for a Caesar Cipher key"""
     if key < 0:
 
         print("ERROR - Key value: ", key, " cannot be negative!")
@@ -66,43 +704,60 @@ def caesar_cipher(
     #  in the intab (string with original characters) into the character at the same position
     #  in the outtab (string with corresponding mapping character).
     #  Returns a translate table to be used translate() function - called below.
-    table = str.maketrans(characters, characters[key:] + characters[:key])
+    return translation_table(characters, characters[key:] + characters[:key])
+
+
+# Method to Encrypt and/or Decrypt Text via a Caesar Cipher
+@record_stats("transform")
+def caesar_cipher(
+    text,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    backend="auto",
+):
+    """Encrypt and/or Decrypt Text via a Caesar Cipher"""
+    if key < 0:
 
-    # Python string method translate() returns a copy of the string in which all characters
-    #  have been translated using table (constructed with the maketrans() method used above)
-    translated_text = text.translate(table)
+        print("ERROR - Key value: ", key, " cannot be negative!")
 
-    return translated_text
+        return None
 
+    cipher = compile_cipher(key, characters, shift_type, "Caesar", backend)
+
+    return cipher.translate(text, decrypt)
 
-# Method to Encrypt and/or Decrypt Text via a complex substitution with a keyword
-# via a Vigenere Cipher
-def vigenere_cipher(
-    text, key, characters=string.ascii_lowercase, decrypt=False, shift_type="right"
-):
-    """Encrypt and/or Decrypt Text with a keyword via a Vigenere Cipher"""
 
-    translated_text = ""
+# Number of characters processed at once by the Vigenere Cipher - this keeps the
+#  temporary list used to interleave the columns back together at a bounded size
+VIGENERE_BLOCK_SIZE = 1 << 20
+
+
+# Method to build the translation tables used by the Vigenere Cipher
+#  one table is built for each letter in the key, rather than one per character of text
+def vigenere_tables(
+    key, characters=string.ascii_lowercase, decrypt=False, shift_type="right"
+):
+    """Build one translation table for each letter of a Vigenere keyword"""
+    tables = []
 
     # Determine length of key
     size = len(key)
-    # Initialize array for our key values the same size as the key
-    key_values = [0] * size
+
+    # position of each character, so every key letter is found in O(1)
+    index = character_index(characters)
+    missing = sorted(set(key) - index.keys())
+    if missing:
+        raise CipherError(
+            "Vigenere key letters {} are not in the character set".format(
+                ", ".join(repr(letter) for letter in missing)
+            )
+        )
 
     # Iterate through each of the letters in the key string
-    i = 0  # used to assign track position in key_values array
     for letter in key:
-        # find() returns first occurrence of letter in our characters lookup table
-        #  assigns index value to key_values
-        key_values[i] = characters.find(letter)
-
-        i += 1
-
-    # iterate over each character in the plain text
-    j = 0  # used to record the count of characters within plain text processed so far
-    for letter in text:
-
-        k_shift = key_values[j % size]  # decide which key value is to be used
+        k_shift = index[letter]
 
         if decrypt:
             ## if decrypt is desired, we simply inverse they sign of the key
@@ -115,16 +770,137 @@ def vigenere_cipher(
         # Python string method maketrans() returns a translation table that maps each character
         #  in the intab (string with original characters) into the character at the same position
         #  in the outtab (string with corresponding mapping character).
-        #  Returns a translate table to be used translate() function - called below.
-        table = str.maketrans(characters, characters[k_shift:] + characters[:k_shift])
+        tables.append(
+            translation_table(characters, characters[k_shift:] + characters[:k_shift])
+        )
+
+    return tables
+
+
+# Method to translate text with one translation table per column - a single table for
+#  Caesar and substitution Ciphers, or one per key letter for the Vigenere Cipher.
+#  offset is the position of the first character of text within the whole message,
+#  so a message translated in pieces picks up the key from the right letter
+def translate_with_tables(
+    text, tables, characters=string.ascii_lowercase, backend="auto", offset=0
+):
+    """Translate text with one translation table for each column"""
+    size = len(tables)
+
+    # start the key from the letter that lines up with the first character of text
+    shift = offset % size
+    tables = tables[shift:] + tables[:shift]
 
+    if use_numpy(text, characters, backend):
+        translated_text = numpy_translate(text, tables)
+        if translated_text is not None:
+            return translated_text
+
+    # A single table (or single letter key) translates the whole text in one go
+    if size == 1:
         # Python string method translate() returns a copy of the string in which all characters
-        #  have been translated using table (constructed with the maketrans() method used above)
-        translated_text += letter.translate(table)
+        #  have been translated using table (constructed with the maketrans() method)
+        return text.translate(tables[0])
+
+    # Every k-th character of the text (a column) is shifted by the same key letter, so
+    #  each column is translated with a single call to translate() and the columns are
+    #  then interleaved back into place via extended slice assignment.
+    #  Blocks are always a multiple of the key length so every block starts on key letter 0
+    block_size = size * max(1, VIGENERE_BLOCK_SIZE // size)
+    ascii_only = characters.isascii()
+    translated_blocks = []
+
+    for start in range(0, len(text), block_size):
+        block = text[start : start + block_size]
+
+        if ascii_only and block.isascii():
+            # Pure ASCII text stays ASCII after translation, so the columns can be
+            #  interleaved in a bytearray - much cheaper than a list of characters
+            letters = bytearray(len(block))
+
+            for i in range(size):
+                letters[i::size] = block[i::size].translate(tables[i]).encode("ascii")
+
+            translated_blocks.append(letters.decode("ascii"))
+        else:
+            # Other text is interleaved as UTF-32 - every character takes exactly 4 bytes,
+            #  so the columns are moved as 4 byte words rather than a list of characters
+            letters = bytearray(4 * len(block))
+            words = memoryview(letters).cast("I")
+
+            for i in range(size):
+                column = block[i::size].translate(tables[i])
+                words[i::size] = memoryview(
+                    column.encode("utf-32-le", "surrogatepass")
+                ).cast("I")
+
+            translated_blocks.append(letters.decode("utf-32-le", "surrogatepass"))
+
+    return "".join(translated_blocks)
+
+
+# Method to convert a translation table built by str.maketrans() into a 256 byte table
+#  for bytes.translate() - bytes outside the character set map to themselves
+def byte_table(table):
+    """Convert a str.maketrans() table into a 256 byte table for bytes.translate()"""
+    translated = bytearray(range(256))
+
+    for source, target in table_items(table):
+        if source < 256:
+            if target >= 256:
+                raise CipherError(
+                    "Character set must only contain Latin-1 characters to translate bytes"
+                )
+            translated[source] = target
+
+    return bytes(translated)
+
+
+# Method to translate bytes with one 256 byte table per column - offset is the position of
+#  the first byte within the whole message, so the Vigenere key starts from the right letter
+def translate_bytes(data, tables, offset=0):
+    """Translate bytes with one 256 byte table for each column"""
+    # a memoryview has no translate() method, so take a copy of the bytes it points to
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+
+    size = len(tables)
+
+    if size == 1:
+        return data.translate(tables[0])
+
+    shift = offset % size
+    tables = tables[shift:] + tables[:shift]
+
+    translated = bytearray(len(data))
+    for i in range(size):
+        translated[i::size] = data[i::size].translate(tables[i])
+
+    return translated
+
+
+# Method to Encrypt and/or Decrypt Text via a complex substitution with a keyword
+# via a Vigenere Cipher
+@record_stats("transform")
+def vigenere_cipher(
+    text,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    backend="auto",
+    offset=0,
+):
+    """Encrypt and/or Decrypt Text with a keyword via a Vigenere Cipher"""
+    if not key:
+
+        print("ERROR - Vigenere key cannot be empty!")
+
+        return None
 
-        j += 1
+    cipher = compile_cipher(key, characters, shift_type, "Vigenere", backend)
 
-    return translated_text
+    return cipher.translate(text, decrypt, offset)
 
 
 # Method that creates a slice that starts at the end of provided string,
@@ -137,21 +913,48 @@ def reverse_string(text):
 
 
 # Method that converts a string to list and shuffle it to mix letters and digits
-#  Depends on random library
+#  Depends on secrets library, as the result is used as a cipher alphabet
 def shuffle(sample_str):
     """ converts a string to list and shuffle it to mix letters and digits"""
     sample_list = list(sample_str)
-    random.shuffle(sample_list)
+    secrets.SystemRandom().shuffle(sample_list)
     final_string = "".join(sample_list)
 
     return final_string
 
 
-# Method to Encrypt and/or Decrypt Text via a simple or complex substitution Cipher
-def substitution_cipher(
-    text, cipher_alphabet, characters=string.ascii_lowercase, decrypt=False
+# Method to build the translation table used by the substitution Cipher
+def substitution_table(
+    cipher_alphabet, characters=string.ascii_lowercase, decrypt=False
 ):
-    """Encrypt and/or Decrypt Text via a simple or complex substitution Cipher"""
+    """Build the translation table for a substitution Cipher alphabet"""
+    check_cipher_alphabet(cipher_alphabet, characters)
+
+    # if default cipher alphabet is used and it matches the character set exactly,
+    #  reverse it for some security
+    if characters == cipher_alphabet:
+        cipher_alphabet = reverse_string(cipher_alphabet)
+
+    if decrypt:
+        # Python string method maketrans() returns a translation table that maps each character
+        #  in the intab (string with original characters) into the character at the same position
+        #  in the outtab (string with corresponding mapping character).
+        #  Returns a translate table to be used translate() function - called below.
+        table = translation_table(cipher_alphabet, characters)
+    else:
+        # Python string method maketrans() returns a translation table that maps each character
+        #  in the intab (string with original characters) into the character at the same position
+        #  in the outtab (string with corresponding mapping character).
+        #  Returns a translate table to be used translate() function - called below.
+        table = translation_table(characters, cipher_alphabet)
+
+    return table
+
+
+# Method to check that a cipher alphabet can be used with the character set
+#  reports the problem and exits the program if it can't
+def check_cipher_alphabet(cipher_alphabet, characters=string.ascii_lowercase):
+    """Check that cipher alphabet and character set have the same number of elements"""
     # Check that cipher alphabet and character set has the same number of elements
     if len(characters) != len(cipher_alphabet):
         print(
@@ -170,46 +973,706 @@ def substitution_cipher(
             cipher_alphabet,
         )
         sys.exit("\nPlease check both settings and retry - thank you!\n")
-    # if default cipher alphabet is used and it matches the character set exactly,
-    #  reverse it for some security
-    if characters == cipher_alphabet:
-        cipher_alphabet = reverse_string(cipher_alphabet)
 
-    if decrypt:
-        # Python string method maketrans() returns a translation table that maps each character
-        #  in the intab (string with original characters) into the character at the same position
-        #  in the outtab (string with corresponding mapping character).
-        #  Returns a translate table to be used translate() function - called below.
-        table = str.maketrans(cipher_alphabet, characters)
-    else:
-        # Python string method maketrans() returns a translation table that maps each character
-        #  in the intab (string with original characters) into the character at the same position
-        #  in the outtab (string with corresponding mapping character).
-        #  Returns a translate table to be used translate() function - called below.
-        table = str.maketrans(characters, cipher_alphabet)
 
-    # Python string method translate() returns a copy of the string in which all characters
-    #  have been translated using table (constructed with the maketrans() method used above)
-    translated_text = text.translate(table)
+# Method to Encrypt and/or Decrypt Text via a simple or complex substitution Cipher
+@record_stats("transform")
+def substitution_cipher(
+    text,
+    cipher_alphabet,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    backend="auto",
+):
+    """Encrypt and/or Decrypt Text via a simple or complex substitution Cipher"""
+    check_cipher_alphabet(cipher_alphabet, characters)
 
-    return translated_text
+    cipher = compile_cipher(
+        cipher_alphabet, characters, "right", "Substitution", backend
+    )
 
+    return cipher.translate(text, decrypt)
 
-# Method to get KEY number from user
-def get_cipher_alphabet(characters=string.ascii_lowercase):
-    """get KEY number from user"""
-    cipher_alphabet = ""
 
-    print("\nPlease select one of the following options for your Cipher Alphabet:")
-    print("\n\t1. Generate Simple Reversed Character set [1].")
-    print("\n\t2. Generate an original Random  Character set [2].")
-    print("\n\t3. Enter Your Own Custom Character set [3].")
+# Method to Encrypt and/or Decrypt Text via a pipeline of ciphers applied in order -
+#  stages is a spec such as "Caesar:3,Vigenere:key" or a tuple of (type, key) pairs
+@record_stats("transform")
+def pipeline_cipher(
+    text,
+    stages,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    backend="auto",
+):
+    """Encrypt and/or Decrypt Text via a pipeline of ciphers applied in order"""
+    if isinstance(stages, str):
+        stages = parse_pipeline(stages)
 
-    while True:
-        num = input("\nPlease make your choice [1, 2, or 3]: ")
-        try:
-            choice = int(num)
-            print("\nThank You!\n")
+    cipher = compile_cipher(tuple(stages), characters, shift_type, "Pipeline", backend)
+
+    return cipher.translate(text, decrypt)
+
+
+# Method to Encrypt and/or Decrypt Text via a Columnar Transposition with a keyword
+@record_stats("transform")
+def columnar_cipher(
+    text, key, characters=string.ascii_lowercase, decrypt=False, backend="auto"
+):
+    """Encrypt and/or Decrypt Text via a Columnar Transposition"""
+    cipher = compile_cipher(key, characters, "right", "Columnar", backend)
+
+    return cipher.translate(text, decrypt)
+
+
+# Method to Encrypt and/or Decrypt Text via a Rail Fence Cipher with the number of rails
+@record_stats("transform")
+def rail_fence_cipher(
+    text, rails, characters=string.ascii_lowercase, decrypt=False, backend="auto"
+):
+    """Encrypt and/or Decrypt Text via a Rail Fence Cipher"""
+    cipher = compile_cipher(rails, characters, "right", "RailFence", backend)
+
+    return cipher.translate(text, decrypt)
+
+
+# Error raised when a cipher can't be built from the key or character set provided
+class CipherError(ValueError):
+    """Raised when a cipher can't be built from the key or character set provided"""
+
+
+# Base class for the precompiled ciphers - subclasses validate their key and build both
+#  the encrypt and decrypt translation tables once, when the object is created,
+#  so the same object can be reused for any number of messages
+class Cipher:
+    """Encrypt and/or Decrypt Text with translation tables built once"""
+
+    __slots__ = ("characters", "backend", "encrypt_tables", "decrypt_tables", "bytes")
+
+    # characters of the character set a transposition moves about together - None for
+    #  the ciphers that replace every character on its own
+    block = None
+
+    def __init__(self, characters, encrypt_tables, decrypt_tables, backend="auto"):
+        # a repeated character would make the tables ambiguous
+        character_index(characters)
+        self.characters = characters
+        self.backend = backend
+        self.encrypt_tables = encrypt_tables
+        self.decrypt_tables = decrypt_tables
+        # 256 byte tables for bytes.translate() are only built if bytes are translated
+        self.bytes = None
+
+    def byte_tables(self, decrypt=False):
+        """Return the 256 byte tables used to translate bytes"""
+        if self.bytes is None:
+            with stats_phase("tables"):
+                self.bytes = (
+                    [byte_table(table) for table in self.encrypt_tables],
+                    [byte_table(table) for table in self.decrypt_tables],
+                )
+
+        return self.bytes[decrypt]
+
+    def translate(self, text, decrypt=False, offset=0):
+        """Encrypt and/or Decrypt text (str) or data (bytes, bytearray or memoryview)"""
+        if isinstance(text, str):
+            tables = self.decrypt_tables if decrypt else self.encrypt_tables
+            return translate_with_tables(
+                text, tables, self.characters, self.backend, offset
+            )
+
+        return bytes(translate_bytes(text, self.byte_tables(decrypt), offset))
+
+    @property
+    def period(self):
+        """Number of key positions the cipher cycles through - 1 if all are alike"""
+        return max(len(self.encrypt_tables), 1)
+
+    def translate_utf8(self, data, decrypt=False, offset=0, decoder=None, final=True):
+        """Translate UTF-8 data with the key position counted in characters, returning
+        the translated data and how far the key position moved"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+
+        # only a key that changes with the position has to know where characters start
+        pending = decoder is not None and decoder.getstate()[0]
+        if self.period == 1 or (data.isascii() and not pending):
+            return self.translate(data, decrypt, offset), len(data)
+
+        if decoder is None:
+            text = data.decode("utf-8", "surrogateescape")
+        else:
+            text = decoder.decode(data, final)
+
+        translated = self.translate(text, decrypt, offset)
+
+        return translated.encode("utf-8", "surrogateescape"), len(text)
+
+    def encrypt(self, text, offset=0):
+        """Encrypt text or data"""
+        return self.translate(text, False, offset)
+
+    def decrypt(self, text, offset=0):
+        """Decrypt text or data"""
+        return self.translate(text, True, offset)
+
+    def encrypt_iter(self, chunks, decrypt=False):
+        """Encrypt an iterable of chunks as one continuous message"""
+        if self.block is not None:
+            chunks = whole_blocks(chunks, self.characters, self.block)
+
+        # the offset carries the Vigenere key position from one chunk on to the next -
+        #  counted in characters for UTF-8 data, just as it is for text, with a character
+        #  split between two chunks held back by the decoder until it is whole
+        offset = 0
+        decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                yield self.translate(chunk, decrypt, offset)
+                offset += len(chunk)
+                continue
+
+            chunk, moved = self.translate_utf8(chunk, decrypt, offset, decoder, False)
+            offset += moved
+            if chunk:
+                yield chunk
+
+        if decoder.getstate()[0]:
+            yield self.translate_utf8(b"", decrypt, offset, decoder)[0]
+
+    def decrypt_iter(self, chunks):
+        """Decrypt an iterable of chunks as one continuous message"""
+        return self.encrypt_iter(chunks, True)
+
+
+# Precompiled Caesar Cipher
+class CaesarCipher(Cipher):
+    """Caesar Cipher with its translation tables built once"""
+
+    __slots__ = ()
+
+    def __init__(
+        self, key, characters=string.ascii_lowercase, shift_type="right", backend="auto"
+    ):
+        if key < 0:
+            raise CipherError("Key value: {} cannot be negative!".format(key))
+
+        super().__init__(
+            characters,
+            [caesar_table(key, characters, False, shift_type)],
+            [caesar_table(key, characters, True, shift_type)],
+            backend,
+        )
+
+
+# Precompiled Vigenere Cipher
+class VigenereCipher(Cipher):
+    """Vigenere Cipher with its translation tables built once"""
+
+    __slots__ = ()
+
+    def __init__(
+        self, key, characters=string.ascii_lowercase, shift_type="right", backend="auto"
+    ):
+        if not key:
+            raise CipherError("Vigenere key cannot be empty!")
+
+        super().__init__(
+            characters,
+            vigenere_tables(key, characters, False, shift_type),
+            vigenere_tables(key, characters, True, shift_type),
+            backend,
+        )
+
+
+# Precompiled substitution Cipher - shift_type is accepted for a common signature
+#  with the other ciphers, but has no effect
+class SubstitutionCipher(Cipher):
+    """Substitution Cipher with its translation tables built once"""
+
+    __slots__ = ()
+
+    def __init__(
+        self,
+        cipher_alphabet,
+        characters=string.ascii_lowercase,
+        shift_type="right",
+        backend="auto",
+    ):
+        if len(cipher_alphabet) != len(characters):
+            raise CipherError(
+                "Cipher Alphabet must contain the same number of elements "
+                "as character set! ({} != {})".format(
+                    len(cipher_alphabet), len(characters)
+                )
+            )
+
+        # a repeated letter couldn't be decrypted - it would stand for two characters
+        character_index(cipher_alphabet, "Cipher alphabet")
+
+        super().__init__(
+            characters,
+            [substitution_table(cipher_alphabet, characters, False)],
+            [substitution_table(cipher_alphabet, characters, True)],
+            backend,
+        )
+
+
+# Most translation tables a fused pipeline may hold - stages whose key lengths have a
+#  least common multiple above this are applied in separate passes instead
+PIPELINE_MAX_TABLES = 1 << 12
+
+
+# Method to check whether a -T / --type value describes a pipeline of stages
+def is_pipeline(spec):
+    """Check whether a cipher type is a pipeline spec such as Caesar:3,Vigenere:key"""
+    return isinstance(spec, str) and (":" in spec or "," in spec)
+
+
+# Method to parse a pipeline spec - comma separated Type:key stages applied in order,
+#  where a key starting with @ is read from that file (a key containing a comma must
+#  come from a file). Returns a tuple of (type, key) stages
+def parse_pipeline(spec, allow_files=True):
+    """Parse a pipeline spec such as Caesar:3,Substitution:@alpha.txt,Vigenere:@key"""
+    stages = []
+
+    for part in spec.split(","):
+        enc_type, separator, key = part.strip().partition(":")
+
+        if enc_type not in CIPHERS or enc_type == "Pipeline":
+            raise CipherError("Unknown cipher type {!r} in pipeline".format(enc_type))
+        if not separator or not key:
+            raise CipherError(
+                "Pipeline stage {!r} needs a key, e.g. Caesar:3".format(part.strip())
+            )
+
+        if key.startswith("@"):
+            if not allow_files:
+                raise CipherError("Pipeline keys can't be read from files here")
+            key = key_from_file(key[1:])
+
+        if enc_type in INTEGER_KEYS:
+            try:
+                key = int(key)
+            except ValueError:
+                raise CipherError(
+                    "{} key {!r} is not a valid integer!".format(enc_type, key)
+                )
+
+        stages.append((enc_type, key))
+
+    return tuple(stages)
+
+
+# Method to fuse the encryption tables of consecutive stages into as few passes as
+#  possible. Column i of a fused pass applies column i of every stage in turn, so a
+#  pass needs the least common multiple of its stages' table counts - monoalphabetic
+#  stages (one table) fold straight into their neighbours
+def fuse_tables(stage_tables, characters, limit=PIPELINE_MAX_TABLES):
+    """Fuse the tables of consecutive cipher stages into the fewest passes"""
+    passes = []
+    fused = None
+
+    for tables in stage_tables:
+        if fused is None:
+            fused = list(tables)
+            continue
+
+        period = math.lcm(len(fused), len(tables))
+        if period > limit:
+            passes.append(fused)
+            fused = list(tables)
+            continue
+
+        # every table maps the character set, so translating the character set through
+        #  each table in turn gives where each character finally ends up
+        fused = [
+            translation_table(
+                characters,
+                characters.translate(fused[i % len(fused)]).translate(
+                    tables[i % len(tables)]
+                ),
+            )
+            for i in range(period)
+        ]
+
+    passes.append(fused)
+
+    return passes
+
+
+# Method to invert translation tables, so they undo exactly what the tables do
+def inverse_tables(tables, characters=string.ascii_lowercase):
+    """Build the tables that undo the provided translation tables"""
+    return [
+        translation_table(characters.translate(table), characters) for table in tables
+    ]
+
+
+# Precompiled pipeline of ciphers applied one after another, with the stages fused into
+#  as few passes over the text as possible - usually one. Decryption inverts the fused
+#  encryption tables, so decrypting always undoes encrypting exactly. A transposition
+#  stage can't be fused into tables, so it runs as a pass of its own
+class PipelineCipher(Cipher):
+    """Chain of ciphers fused into as few passes as possible"""
+
+    __slots__ = ("passes", "block")
+
+    def __init__(
+        self,
+        stages,
+        characters=string.ascii_lowercase,
+        shift_type="right",
+        backend="auto",
+    ):
+        # the stages are a tuple of (type, key) pairs, or a spec for parse_pipeline()
+        if isinstance(stages, str):
+            stages = parse_pipeline(stages, allow_files=False)
+        if not stages:
+            raise CipherError("A pipeline needs at least one stage")
+
+        self.passes = []
+        self.block = None
+        stage_tables = []
+
+        for enc_type, key in stages:
+            cipher = compile_cipher(key, characters, shift_type, enc_type, backend)
+            if cipher.block is None:
+                stage_tables.append(cipher.encrypt_tables)
+                continue
+
+            self.passes.extend(self.fused_passes(stage_tables, characters, backend))
+            self.passes.append(cipher)
+            self.block = cipher.block
+            stage_tables = []
+
+        self.passes.extend(self.fused_passes(stage_tables, characters, backend))
+
+        super().__init__(
+            characters,
+            self.passes[0].encrypt_tables,
+            self.passes[0].decrypt_tables,
+            backend,
+        )
+
+    @staticmethod
+    def fused_passes(stage_tables, characters, backend="auto"):
+        """Fuse the tables of consecutive stages into passes that undo themselves"""
+        if not stage_tables:
+            return []
+
+        return [
+            Cipher(characters, tables, inverse_tables(tables, characters), backend)
+            for tables in fuse_tables(stage_tables, characters)
+        ]
+
+    def byte_tables(self, decrypt=False):
+        """Return the 256 byte tables used to translate bytes"""
+        if self.block is not None:
+            raise CipherError(
+                "Pipelines with a transposition stage have no translation tables"
+            )
+        if len(self.passes) > 1:
+            raise CipherError(
+                "Pipeline keys are too long to fuse into one pass over bytes "
+                "({} passes) - use shorter keys".format(len(self.passes))
+            )
+
+        return super().byte_tables(decrypt)
+
+    @property
+    def period(self):
+        """Number of key positions the pipeline cycles through - 1 if all are alike"""
+        return math.lcm(*(cipher.period for cipher in self.passes))
+
+    def translate(self, text, decrypt=False, offset=0):
+        """Encrypt and/or Decrypt text or data through every pass of the pipeline"""
+        if len(self.passes) == 1 and self.block is None:
+            return super().translate(text, decrypt, offset)
+
+        for cipher in reversed(self.passes) if decrypt else self.passes:
+            text = cipher.translate(text, decrypt, offset)
+
+        return text
+
+
+# Number of characters of the character set a transposition rearranges at a time - the
+#  text is transposed in blocks of this many, so memory stays bounded however big the
+#  file, and every full block reuses the same precomputed permutation
+TRANSPOSITION_BLOCK_SIZE = 1 << 16
+
+
+# Method to build the permutation of a Columnar Transposition - the text is written in
+#  rows as wide as the keyword, then read column by column in the alphabetical order of
+#  the keyword's letters. Item i of the permutation is the position of the character
+#  that ends up at position i
+@functools.lru_cache(maxsize=256)
+def columnar_permutation(key, length):
+    """Permutation of a Columnar Transposition of length characters"""
+    columns = len(key)
+    order = sorted(range(columns), key=key.__getitem__)
+
+    if np is not None:
+        permutation = np.concatenate(
+            [np.arange(column, length, columns) for column in order]
+        )
+        permutation.flags.writeable = False
+        return permutation
+
+    return [i for column in order for i in range(column, length, columns)]
+
+
+# Method to build the permutation of a Rail Fence Cipher - the text zigzags down and up
+#  across the rails, which are then read one after another
+@functools.lru_cache(maxsize=256)
+def rail_fence_permutation(rails, length):
+    """Permutation of a Rail Fence Cipher of length characters"""
+    cycle = max(2 * (rails - 1), 1)
+
+    if np is not None:
+        phase = np.arange(length) % cycle
+        permutation = np.argsort(np.minimum(phase, cycle - phase), kind="stable")
+        permutation.flags.writeable = False
+        return permutation
+
+    return sorted(range(length), key=lambda i: min(i % cycle, cycle - i % cycle))
+
+
+# Method to move the characters of the character set within text (str or bytes) to
+#  their transposed positions, block by block - every other character stays where it
+#  is, so line breaks and the like keep their place. All the full blocks are moved at
+#  once with a single NumPy index of the permutation
+def transpose(
+    text,
+    permutation,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    block=TRANSPOSITION_BLOCK_SIZE,
+):
+    """Transpose the characters of the character set within text"""
+    indices = character_indices(text, characters)
+
+    if np is not None:
+        if isinstance(text, str):
+            data = np.frombuffer(
+                text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+            )
+        else:
+            data = np.frombuffer(text, dtype=np.uint8)
+
+        found = np.flatnonzero(np.asarray(indices) >= 0)
+        whole = len(found) // block * block
+        moved = data.copy()
+
+        # rows of positions - the full blocks, then the short block at the end
+        for positions in (found[:whole].reshape(-1, block), found[whole:][None, :]):
+            if not positions.size:
+                continue
+            sources = positions[:, permutation(positions.shape[1])]
+            if decrypt:
+                moved[sources] = data[positions]
+            else:
+                moved[positions] = data[sources]
+
+        if isinstance(text, str):
+            return moved.tobytes().decode("utf-32-le", "surrogatepass")
+        return moved.tobytes()
+
+    found = [i for i, index in enumerate(indices) if index >= 0]
+    moved = list(text) if isinstance(text, str) else bytearray(text)
+
+    for start in range(0, len(found), block):
+        positions = found[start : start + block]
+        sources = [positions[i] for i in permutation(len(positions))]
+        if decrypt:
+            for source, position in zip(sources, positions):
+                moved[source] = text[position]
+        else:
+            for source, position in zip(sources, positions):
+                moved[position] = text[source]
+
+    return "".join(moved) if isinstance(text, str) else bytes(moved)
+
+
+# Method to find where the last full block of a transposition in a chunk of text ends -
+#  at the first character of the character set after it, so the characters before the
+#  cut can be transposed now and the rest carried on to the next chunk. count is the
+#  number of characters of the character set carried over from the chunks before, so
+#  the carried text never has to be joined to the chunk and counted again. Returns the
+#  cut, or None if no block ends in the chunk, and the count carried on past it
+def block_boundary(chunk, characters=string.ascii_lowercase, block=None, count=0):
+    """Position in a chunk just after its last full transposition block"""
+    indices = character_indices(chunk, characters)
+
+    if np is not None and isinstance(indices, np.ndarray):
+        found = np.flatnonzero(indices >= 0)
+    else:
+        found = [i for i, index in enumerate(indices) if index >= 0]
+
+    total = count + len(found)
+    whole = total // block * block - count
+    if whole <= 0:
+        return None, total
+
+    return int(found[whole]) if whole < len(found) else len(chunk), total % block
+
+
+# Method to regroup chunks of text so each one ends on a transposition block boundary -
+#  a block split across two chunks would otherwise be transposed as two short blocks.
+#  The chunks of a block still being filled are kept as they are and joined just once
+def whole_blocks(chunks, characters=string.ascii_lowercase, block=None):
+    """Regroup chunks of text so they end on transposition block boundaries"""
+    carry = []
+    count = 0
+
+    for chunk in chunks:
+        cut, count = block_boundary(chunk, characters, block, count)
+        if cut is None:
+            carry.append(chunk)
+            continue
+
+        carry.append(chunk[:cut])
+        yield chunk[:0].join(carry)
+        carry = [chunk[cut:]]
+
+    if any(carry):
+        yield carry[0][:0].join(carry)
+
+
+# Base class for the transposition ciphers - rather than replacing characters through
+#  translation tables they move the characters of the character set about, in blocks of
+#  TRANSPOSITION_BLOCK_SIZE, with a permutation that is built once per block length
+class TranspositionCipher(Cipher):
+    """Transposition cipher with its permutations built once per block length"""
+
+    __slots__ = ("key",)
+
+    block = TRANSPOSITION_BLOCK_SIZE
+
+    def __init__(self, key, characters=string.ascii_lowercase, backend="auto"):
+        super().__init__(characters, [], [], backend)
+        self.key = key
+
+    def permutation(self, length):
+        """Return the permutation of length characters"""
+        raise NotImplementedError
+
+    def byte_tables(self, decrypt=False):
+        """Transposition ciphers have no translation tables"""
+        raise CipherError(
+            "{} moves characters rather than replacing them - it has no "
+            "translation tables".format(type(self).__name__)
+        )
+
+    def translate(self, text, decrypt=False, offset=0):
+        """Encrypt and/or Decrypt text (str) or data (bytes, bytearray or memoryview)"""
+        # offset is accepted for a common signature - text must start on a block
+        #  boundary, which encrypt_iter() makes sure of for a message in chunks
+        return transpose(text, self.permutation, self.characters, decrypt, self.block)
+
+
+# Precompiled Columnar Transposition - shift_type is accepted for a common signature
+#  with the other ciphers, but has no effect
+class ColumnarCipher(TranspositionCipher):
+    """Columnar Transposition with its permutations built once"""
+
+    __slots__ = ()
+
+    def __init__(
+        self, key, characters=string.ascii_lowercase, shift_type="right", backend="auto"
+    ):
+        if not key:
+            raise CipherError("Columnar key cannot be empty!")
+
+        super().__init__(key, characters, backend)
+
+    def permutation(self, length):
+        """Return the permutation of length characters"""
+        return columnar_permutation(self.key, length)
+
+
+# Precompiled Rail Fence Cipher - the key is the number of rails, and shift_type is
+#  accepted for a common signature with the other ciphers, but has no effect
+class RailFenceCipher(TranspositionCipher):
+    """Rail Fence Cipher with its permutations built once"""
+
+    __slots__ = ()
+
+    def __init__(
+        self, key, characters=string.ascii_lowercase, shift_type="right", backend="auto"
+    ):
+        if key < 1:
+            raise CipherError("Number of rails: {} must be at least 1!".format(key))
+
+        super().__init__(key, characters, backend)
+
+    def permutation(self, length):
+        """Return the permutation of length characters"""
+        return rail_fence_permutation(self.key, length)
+
+
+# Registry of the ciphers available via the -T / --type option
+CIPHERS = {
+    "Caesar": CaesarCipher,
+    "Substitution": SubstitutionCipher,
+    "Vigenere": VigenereCipher,
+    "Columnar": ColumnarCipher,
+    "RailFence": RailFenceCipher,
+    "Pipeline": PipelineCipher,
+}
+
+# Cipher types whose key is a whole number
+INTEGER_KEYS = ("Caesar", "RailFence")
+
+
+# Method to check a -T / --type value - the name of a cipher, or a pipeline spec
+def cipher_type(value):
+    """Check the value of the -T / --type option"""
+    if is_pipeline(value) or (value in CIPHERS and value != "Pipeline"):
+        return value
+
+    raise argparse.ArgumentTypeError(
+        "choose from {} or a pipeline such as Caesar:3,Vigenere:key".format(
+            ", ".join(name for name in CIPHERS if name != "Pipeline")
+        )
+    )
+
+
+# Method to build (or reuse) a precompiled cipher for whichever cipher is selected by
+#  enc_type - recently used ciphers are cached, so repeated calls with the same key
+#  don't rebuild the translation tables. A Cipher object passed as key is used as is
+@functools.lru_cache(maxsize=64)
+@record_stats("tables")
+def compile_cipher(
+    key,
+    characters=string.ascii_lowercase,
+    shift_type="right",
+    enc_type="Caesar",
+    backend="auto",
+):
+    """Build the precompiled cipher selected by enc_type"""
+    if isinstance(key, Cipher):
+        return key
+
+    return CIPHERS[enc_type](key, characters, shift_type, backend)
+
+
+# Method to get KEY number from user
+def get_cipher_alphabet(characters=string.ascii_lowercase):
+    """get KEY number from user"""
+    cipher_alphabet = ""
+
+    print("\nPlease select one of the following options for your Cipher Alphabet:")
+    print("\n\t1. Generate Simple Reversed Character set [1].")
+    print("\n\t2. Generate an original Random  Character set [2].")
+    print("\n\t3. Enter Your Own Custom Character set [3].")
+
+    while True:
+        num = input("\nPlease make your choice [1, 2, or 3]: ")
+        try:
+            choice = int(num)
+            print("\nThank You!\n")
 
             if choice == 1:
                 cipher_alphabet = reverse_string(characters)
@@ -253,89 +1716,3878 @@ def get_cipher_alphabet(characters=string.ascii_lowercase):
             print("\nERROR - your response", answer, " is invalid!\n")
             print('\nPlease type either "Yes" or "No"!\n')
 
-    return cipher_alphabet
+    return cipher_alphabet
+
+
+# Number of characters read at a time when a file is streamed in blocks (1 MiB)
+FILE_BLOCK_SIZE = 1 << 20
+
+# Compressed file formats, by extension, with the bytes every file of the format starts
+#  with and the standard library module that reads and writes it
+COMPRESSIONS = {
+    ".gz": (b"\x1f\x8b", gzip),
+    ".bz2": (b"BZh", bz2),
+    ".xz": (b"\xfd7zXZ\x00", lzma),
+}
+
+# Level used to write .gz files - the default of the gzip tool, which is several times
+#  quicker than the module's level 9 for files that are barely bigger
+GZIP_LEVEL = 6
+
+
+# Method to find the compression format a file name's extension stands for
+def extension_compression(file_name):
+    """Return the compression format of a file name's extension, or None"""
+    file_name = os.fspath(file_name).lower()
+
+    for extension in COMPRESSIONS:
+        if file_name.endswith(extension):
+            return extension
+
+    return None
+
+
+# Method to check whether the start of a file open for reading decompresses with a
+#  compression module, leaving the file where it was
+def decompresses(file, module):
+    """Check whether an open file decompresses with a compression module"""
+    position = file.tell()
+
+    try:
+        with module.open(file, "rb") as compressed:
+            compressed.read(1)
+        return True
+    except Exception:
+        return False
+    finally:
+        file.seek(position)
+
+
+# Method to find the compression format of a file open for reading from its first bytes.
+#  Plain text (or ciphertext) can happen to start with the same bytes as a compressed
+#  format, so a format other than the one the extension stands for is only trusted when
+#  the start of the file really decompresses. Returns None for plain files
+def sniff_compression(file, file_name):
+    """Return the compression format of an open file, or None when it isn't compressed"""
+    head = file.peek(8)[:8]
+
+    for extension, (magic, module) in COMPRESSIONS.items():
+        if not head.startswith(magic):
+            continue
+        if extension == extension_compression(file_name) or (
+            module is not None and decompresses(file, module)
+        ):
+            return extension
+
+    return None
+
+
+# Method to find which compression a file uses - a file being read is recognised by its
+#  first bytes, and a file being written (or one that can't be peeked at, like a pipe)
+#  by its extension. Returns the extension of the format, or None for plain files
+def compression(file_name, mode="r"):
+    """Return the compression format of a file, or None when it isn't compressed"""
+    if "r" in mode and os.path.isfile(file_name):
+        with open(file_name, "rb") as file:
+            return sniff_compression(file, file_name)
+
+    return extension_compression(file_name)
+
+
+# Method to open a file like open() does, decompressing it as it is read or compressing
+#  it as it is written when it is a .gz, .bz2 or .xz file. The data streams through the
+#  (de)compressor in small chunks, so memory stays bounded whatever the size of the file
+def open_file(file_name, mode="r"):
+    """Open a file, decompressing or compressing it as needed"""
+    if "r" not in mode or extension_compression(file_name):
+        extension = compression(file_name, mode)
+    else:
+        # any other input is opened once, with its first bytes peeked at through the
+        #  file that is returned - a pipe can't be checked without losing them, so it
+        #  is read as it is
+        file = open(file_name, "rb")
+        try:
+            extension = sniff_compression(file, file_name) if file.seekable() else None
+        except BaseException:
+            file.close()
+            raise
+
+        if extension is None:
+            return file if "b" in mode else io.TextIOWrapper(file)
+        file.close()
+
+    if extension is None:
+        return open(file_name, mode)
+
+    module = COMPRESSIONS[extension][1]
+    if module is None:
+        raise CipherError("This Python can't read or write {} files".format(extension))
+
+    # the compression modules open files in binary mode unless asked for text
+    if "b" not in mode:
+        mode += "t"
+
+    if module is gzip and "r" not in mode:
+        return gzip.open(file_name, mode, compresslevel=GZIP_LEVEL)
+
+    return module.open(file_name, mode)
+
+
+# Method to Encrypt and/or Decrypt bytes via a Caesar Cipher - accepts bytes, bytearray
+#  or memoryview and only moves the bytes of the character set (which must be Latin-1)
+@record_stats("transform")
+def caesar_cipher_bytes(
+    data, key, characters=string.ascii_lowercase, decrypt=False, shift_type="right"
+):
+    """Encrypt and/or Decrypt bytes via a Caesar Cipher"""
+    if key < 0:
+
+        print("ERROR - Key value: ", key, " cannot be negative!")
+
+        return None
+
+    return compile_cipher(key, characters, shift_type, "Caesar").translate(
+        data, decrypt
+    )
+
+
+# Method to Encrypt and/or Decrypt bytes with a keyword via a Vigenere Cipher
+#  offset is the position of the first byte within the whole message
+@record_stats("transform")
+def vigenere_cipher_bytes(
+    data,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    offset=0,
+):
+    """Encrypt and/or Decrypt bytes with a keyword via a Vigenere Cipher"""
+    if not key:
+
+        print("ERROR - Vigenere key cannot be empty!")
+
+        return None
+
+    return compile_cipher(key, characters, shift_type, "Vigenere").translate(
+        data, decrypt, offset
+    )
+
+
+# Method to Encrypt and/or Decrypt bytes via a simple or complex substitution Cipher
+@record_stats("transform")
+def substitution_cipher_bytes(
+    data, cipher_alphabet, characters=string.ascii_lowercase, decrypt=False
+):
+    """Encrypt and/or Decrypt bytes via a simple or complex substitution Cipher"""
+    check_cipher_alphabet(cipher_alphabet, characters)
+
+    return compile_cipher(
+        cipher_alphabet, characters, "right", "Substitution"
+    ).translate(data, decrypt)
+
+
+# Method to Encrypt and/or Decrypt a File filled with text via a simple substitution (Caesar) Cipher
+def file_cipher(
+    file_name,
+    output_file_name,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    enc_type="Caesar",
+    backend="auto",
+    block_size=None,
+    workers=None,
+    in_place=False,
+    sync=False,
+    atomic=False,
+    verbose=True,
+):
+    """Encrypt and/or Decrypt a File filled with text via a simple substitution (Caesar) Cipher"""
+    # the translation tables (or transposition permutations) are built once for the file
+    cipher = compile_cipher(key, characters, shift_type, enc_type, backend)
+
+    if in_place:
+        if compression(file_name):
+            raise CipherError("Compressed files can't be translated in place")
+        if cipher.block is not None:
+            raise CipherError("Transposition ciphers can't translate files in place")
+
+        inplace_file_cipher(
+            file_name,
+            key,
+            characters,
+            decrypt,
+            shift_type,
+            enc_type,
+            block_size or FILE_BLOCK_SIZE,
+            sync,
+            atomic,
+            verbose,
+            per_line=block_size is None,
+        )
+        return
+
+    # the byte ranges of a compressed file can't be read or written on their own, and
+    #  a character set that isn't ASCII may change how many bytes a character takes,
+    #  so those files are translated by this process instead. The input is only peeked
+    #  at when there are workers, otherwise open_file() finds its format as it opens it
+    split = (
+        workers
+        and characters.isascii()
+        and not compression(output_file_name, "w")
+        and not compression(file_name)
+    )
+    if split and cipher.block is not None:
+        # a transposition block can span any number of bytes, so rather than splitting
+        #  the file into byte ranges it is streamed in blocks by this process
+        block_size = block_size or FILE_BLOCK_SIZE
+    elif split:
+        parallel_file_cipher(
+            file_name,
+            output_file_name,
+            key,
+            characters,
+            decrypt,
+            shift_type,
+            enc_type,
+            workers,
+            block_size or FILE_BLOCK_SIZE,
+            verbose,
+            per_line=block_size is None,
+        )
+        return
+
+    # an ASCII character set can be applied to the raw bytes of the file, which skips
+    #  decoding and re-encoding the text and copes with files that aren't valid UTF-8.
+    #  The Vigenere key still advances once per character, as it does for text
+    if characters.isascii():
+        binary_file_cipher(
+            file_name,
+            output_file_name,
+            cipher,
+            characters,
+            decrypt,
+            shift_type,
+            enc_type,
+            block_size,
+            verbose,
+        )
+        return
+
+    with open_file(file_name, "r") as f_in:
+
+        with open_file(output_file_name, "w") as f_out:
+
+            # time spent reading and writing is recorded apart from the transform
+            f_in = stats_file(f_in)
+            f_out = stats_file(f_out)
+
+            with stats_phase("transform"):
+
+                if block_size:
+                    # stream the file in fixed size blocks rather than lines, so memory stays
+                    #  bounded however long the lines are. The Vigenere key position carries on
+                    #  from one block to the next, just as if the whole file was read at once
+                    blocks = iter(lambda: f_in.read(block_size), "")
+
+                    for block_new in cipher.encrypt_iter(blocks, decrypt):
+                        f_out.write(block_new)
+
+                else:
+                    # iterate over each line in input file
+                    #  note - the Vigenere key starts again from its first letter on every line
+                    for line in f_in:
+
+                        # encrypt/decrypt the line
+                        line_new = cipher.translate(line, decrypt)
+
+                        # write the new line to output file
+                        f_out.write(line_new)
+
+    if verbose:
+        print(
+            "The file {} has been translated successfully and saved to {}".format(
+                file_name, output_file_name
+            )
+        )
+
+
+# Method to Encrypt and/or Decrypt a File as raw bytes, either line by line or
+#  in fixed size blocks when block_size is provided
+def binary_file_cipher(
+    file_name,
+    output_file_name,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    enc_type="Caesar",
+    block_size=None,
+    verbose=True,
+):
+    """Encrypt and/or Decrypt a File as raw bytes"""
+    # the cipher translates the bytes itself, so a pipeline too long to fuse into one
+    #  set of byte tables still runs pass by pass, and a transposition moves the bytes
+    cipher = compile_cipher(key, characters, shift_type, enc_type)
+
+    # a cipher that fuses into one pass over bytes translates ASCII data straight
+    #  through its byte tables, as the key position moves once per byte there - and
+    #  any data at all when every key position is alike
+    try:
+        tables = cipher.byte_tables(decrypt)
+    except CipherError:
+        tables = None
+    whole = tables is not None and cipher.period == 1
+
+    with open_file(file_name, "rb") as f_in:
+
+        with open_file(output_file_name, "wb") as f_out:
+
+            f_in = stats_file(f_in)
+            f_out = stats_file(f_out)
+
+            with stats_phase("transform"):
+
+                if block_size and tables is None:
+                    # the Vigenere key position carries on from one block to the next
+                    blocks = iter(lambda: f_in.read(block_size), b"")
+
+                    for block_new in cipher.encrypt_iter(blocks, decrypt):
+                        f_out.write(block_new)
+
+                elif block_size:
+                    # as encrypt_iter() does, the decoder holds back a character split
+                    #  between two blocks until it is whole
+                    offset = 0
+                    decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+                    for block in iter(lambda: f_in.read(block_size), b""):
+
+                        if whole or (block.isascii() and not decoder.getstate()[0]):
+                            f_out.write(translate_bytes(block, tables, offset))
+                            offset += len(block)
+                            continue
+
+                        block, moved = cipher.translate_utf8(
+                            block, decrypt, offset, decoder, False
+                        )
+                        f_out.write(block)
+                        offset += moved
+
+                    if decoder.getstate()[0]:
+                        f_out.write(
+                            cipher.translate_utf8(b"", decrypt, offset, decoder)[0]
+                        )
+
+                else:
+                    # the Vigenere key starts again from its first letter on every line
+                    for line in f_in:
+
+                        if whole or (tables is not None and line.isascii()):
+                            f_out.write(translate_bytes(line, tables))
+                        else:
+                            f_out.write(cipher.translate_utf8(line, decrypt)[0])
+
+    if verbose:
+        print(
+            "The file {} has been translated successfully and saved to {}".format(
+                file_name, output_file_name
+            )
+        )
+
+
+# Method to translate one byte range of a file into the same range of the output file
+#  runs inside the worker processes started by parallel_file_cipher(). phase is the key
+#  position of the first byte of the range, or None to work it out from the start of
+#  its line, as the key restarts on every line of a file translated line by line
+def cipher_file_range(
+    file_name,
+    output_file_name,
+    cipher,
+    start,
+    end,
+    decrypt=False,
+    phase=None,
+    block_size=FILE_BLOCK_SIZE,
+):
+    """Translate the bytes between start and end of a file into the output file"""
+    with open(file_name, "rb") as f_in:
+
+        with open(output_file_name, "r+b") as f_out:
+
+            # only a key that changes with the position needs to know where it is
+            per_line = phase is None
+            if per_line:
+                phase = 0
+                if cipher.period > 1:
+                    phase = key_phase(f_in, start, True, True, block_size=block_size)[1]
+
+            f_in.seek(start)
+            f_out.seek(start)
+
+            def blocks():
+                position = start
+                while position < end:
+                    data = f_in.read(min(block_size, end - position))
+                    if not data:
+                        break
+                    position += len(data)
+                    yield data
+
+            for data in translate_blocks(cipher, blocks(), decrypt, phase, per_line):
+                f_out.write(data)
+
+    return end - start
+
+
+# Method to Encrypt and/or Decrypt a File by splitting it into byte ranges that are
+#  translated by a pool of worker processes, each writing straight into its own range
+#  of a preallocated output file. The ranges start on character boundaries and the key
+#  position of each is worked out from its line (or with per_line=False from every
+#  character before it), so the output is exactly that of this process on its own
+def parallel_file_cipher(
+    file_name,
+    output_file_name,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    enc_type="Caesar",
+    workers=None,
+    block_size=FILE_BLOCK_SIZE,
+    verbose=True,
+    per_line=True,
+):
+    """Encrypt and/or Decrypt a File in parallel byte ranges across worker processes"""
+    cipher = compile_cipher(key, characters, shift_type, enc_type)
+    if not characters.isascii():
+        raise CipherError(
+            "The character set must be ASCII to translate a file in byte ranges"
+        )
+
+    if os.path.exists(output_file_name) and os.path.samefile(
+        file_name, output_file_name
+    ):
+        raise ValueError("Input and output files must be different files")
+
+    file_size = os.path.getsize(file_name)
+    workers = workers or os.cpu_count() or 1
+
+    # preallocate the output file so every worker can write into its own range
+    with open(output_file_name, "wb") as f_out:
+        f_out.truncate(file_size)
+
+    # a few ranges per worker keeps the pool busy if some ranges finish early, and
+    #  every range starts on the first byte of a character
+    range_size = max(block_size, -(-file_size // (workers * 4)))
+    with open(file_name, "rb") as f_in:
+        bounds = sorted(
+            {
+                character_boundary(f_in, start, block_size)
+                for start in range(range_size, file_size, range_size)
+            }
+            | {0, file_size}
+        )
+
+        # a key running on through the lines is at the number of characters before
+        #  each range, counted here in one pass over the file
+        phases = [None if per_line else 0] * len(bounds)
+        if not per_line and cipher.period > 1:
+            f_in.seek(0)
+            for i in range(1, len(bounds)):
+                phases[i] = phases[i - 1] + read_utf8_length(
+                    f_in, bounds[i] - bounds[i - 1], block_size
+                )
+
+    ranges = list(zip(bounds, bounds[1:], phases))
+
+    # the worker processes don't collect statistics, so reading, translating and
+    #  writing the ranges is all recorded as the transform
+    with stats_phase("transform"):
+        if workers == 1 or len(ranges) <= 1:
+            for start, end, phase in ranges:
+                cipher_file_range(
+                    file_name,
+                    output_file_name,
+                    cipher,
+                    start,
+                    end,
+                    decrypt,
+                    phase,
+                    block_size,
+                )
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(
+                        cipher_file_range,
+                        file_name,
+                        output_file_name,
+                        cipher,
+                        start,
+                        end,
+                        decrypt,
+                        phase,
+                        block_size,
+                    )
+                    for start, end, phase in ranges
+                ]
+
+                for future in futures:
+                    future.result()
+
+    if STATS is not None:
+        STATS.add_bytes(file_size, file_size)
+
+    if verbose:
+        print(
+            "The file {} has been translated successfully and saved to {}".format(
+                file_name, output_file_name
+            )
+        )
+
+
+# Method to translate a file in place through a memory map, one block at a time
+#  so files bigger than the available memory can be handled. The key position is
+#  counted just as file_cipher() counts it - per line unless per_line is False
+def mmap_translate(
+    file_name,
+    cipher,
+    decrypt=False,
+    block_size=FILE_BLOCK_SIZE,
+    sync=False,
+    per_line=True,
+):
+    """Translate a file in place through a memory map"""
+    with open(file_name, "r+b") as file:
+
+        # an empty file can't be memory mapped - and there is nothing to translate
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0) as mapped:
+
+            # the memory map pages the file in and out as it is translated, so
+            #  reading and writing are recorded as part of the transform
+            with stats_phase("transform"):
+                blocks = (
+                    mapped[start : start + block_size]
+                    for start in range(0, len(mapped), block_size)
+                )
+
+                # a character split between blocks is written with the next block, so
+                #  the translated bytes never get ahead of the bytes read
+                position = 0
+                for data in translate_blocks(cipher, blocks, decrypt, 0, per_line):
+                    mapped[position : position + len(data)] = data
+                    position += len(data)
+
+            if STATS is not None:
+                STATS.add_bytes(len(mapped), len(mapped))
+
+            if sync:
+                # make sure the changes have reached the disk before returning
+                with stats_phase("write"):
+                    mapped.flush()
+                    os.fsync(file.fileno())
+
+
+# Method to Encrypt and/or Decrypt a File in place via a memory map, rather than
+#  writing a second file. With atomic=True the file is translated in a temporary copy
+#  which then replaces the original, so a crash never leaves it half translated
+def inplace_file_cipher(
+    file_name,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    enc_type="Caesar",
+    block_size=FILE_BLOCK_SIZE,
+    sync=False,
+    atomic=False,
+    verbose=True,
+    per_line=True,
+):
+    """Encrypt and/or Decrypt a File in place via a memory map"""
+    cipher = compile_cipher(key, characters, shift_type, enc_type)
+    # every translated character has to take as many bytes as the original
+    if not characters.isascii():
+        raise CipherError("The character set must be ASCII to translate files in place")
+
+    if not atomic:
+        mmap_translate(file_name, cipher, decrypt, block_size, sync, per_line)
+    else:
+        directory = os.path.dirname(os.path.abspath(file_name))
+        handle, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(handle)
+
+        try:
+            shutil.copy2(file_name, temp_name)
+            mmap_translate(temp_name, cipher, decrypt, block_size, sync, per_line)
+            os.replace(temp_name, file_name)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            raise
+
+        if sync and os.name == "posix":
+            # flush the rename itself by syncing the directory entry
+            handle = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(handle)
+            finally:
+                os.close(handle)
+
+    if verbose:
+        print("The file {} has been translated successfully in place".format(file_name))
+
+
+# Sidecar index of line offsets saved next to a file as <file>.idx - a header holding
+#  the size and modification time of the file it describes and its number of entries,
+#  then the byte offset and character offset of the start of each line as pairs of
+#  unsigned 64 bit integers, ending with an entry for the end of the file
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"CIPHIDX1"
+INDEX_HEADER = struct.Struct("=8sQQQ")
+INDEX_ENTRY = struct.Struct("=QQ")
+
+# UTF-8 continuation bytes - UTF-8 data holds one byte outside this range per character
+UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+
+
+# Method to count the characters in UTF-8 data as the surrogateescape decoder of
+#  file_cipher() counts them, with every byte that isn't part of a whole character
+#  counted on its own. Data that may start or end part way through a character is
+#  counted with the decoder that read the data before it, which holds back the start
+#  of an unfinished character until final
+def utf8_length(data, decoder=None, final=True):
+    """Count the characters in UTF-8 data"""
+    if decoder is None:
+        return len(data.decode("utf-8", "surrogateescape"))
+
+    return len(decoder.decode(data, final))
+
+
+# Method to find the byte and character offsets of the lines starting in a block of
+#  a file, given the byte and character offsets of the start of the block and the
+#  decoder that read the blocks before it. Returns them with the character offset of
+#  the end of the block
+def line_starts(block, position, characters, decoder):
+    """Return the (byte, character) offsets of the lines starting in a block"""
+    if np is not None:
+        data = np.frombuffer(block, dtype=np.uint8)
+        starts = np.flatnonzero(data == 10) + 1
+
+        # the newlines are found again in the decoded text for their character offsets
+        whole_ascii = block.isascii() and not decoder.getstate()[0]
+        text = decoder.decode(block)
+        text_starts = starts
+        if not whole_ascii:
+            codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), np.uint32)
+            text_starts = np.flatnonzero(codes == 10) + 1
+
+        return (
+            zip((position + starts).tolist(), (characters + text_starts).tolist()),
+            characters + len(text),
+        )
+
+    starts = []
+    begin = 0
+    newline = block.find(b"\n")
+    while newline >= 0:
+        characters += utf8_length(block[begin : newline + 1], decoder, False)
+        begin = newline + 1
+        starts.append((position + begin, characters))
+        newline = block.find(b"\n", begin)
+
+    return starts, characters + utf8_length(block[begin:], decoder, False)
+
+
+# Method to write the sidecar index of line offsets for a file, reading it one block
+#  at a time and writing the offsets out as they are found, so memory stays bounded
+def build_line_index(file_name, index_name=None, block_size=FILE_BLOCK_SIZE):
+    """Write the sidecar index of line offsets for a file"""
+    index_name = index_name or file_name + INDEX_SUFFIX
+
+    if compression(file_name):
+        raise CipherError("{} is compressed - it can't be indexed".format(file_name))
+
+    with open(file_name, "rb") as f_in:
+
+        with open(index_name, "wb") as f_index:
+
+            status = os.fstat(f_in.fileno())
+            f_index.write(bytes(INDEX_HEADER.size))
+            f_index.write(INDEX_ENTRY.pack(0, 0))
+
+            decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+            position = 0
+            characters = 0
+            ends_with_newline = True
+            for block in iter(lambda: f_in.read(block_size), b""):
+                starts, characters = line_starts(block, position, characters, decoder)
+                f_index.write(b"".join(INDEX_ENTRY.pack(*start) for start in starts))
+
+                position += len(block)
+                ends_with_newline = block.endswith(b"\n")
+
+            # a file ending in a newline already has an entry for its end
+            if not ends_with_newline:
+                characters += utf8_length(b"", decoder)
+                f_index.write(INDEX_ENTRY.pack(position, characters))
+
+            entries = (f_index.tell() - INDEX_HEADER.size) // INDEX_ENTRY.size
+
+            f_index.seek(0)
+            f_index.write(
+                INDEX_HEADER.pack(
+                    INDEX_MAGIC, status.st_size, status.st_mtime_ns, entries
+                )
+            )
+
+    return index_name
+
+
+# Sidecar index of line offsets loaded through a memory map, so a file of any size
+#  is ready to use at once and a line is found without reading the file
+class LineIndex:
+    """Byte and character offsets of the lines of a file"""
+
+    __slots__ = ("offsets", "characters")
+
+    def __init__(self, index_name):
+        with open(index_name, "rb") as f_index:
+            magic, size, mtime, entries = INDEX_HEADER.unpack(
+                f_index.read(INDEX_HEADER.size)
+            )
+            if magic != INDEX_MAGIC:
+                raise CipherError("{} is not a line index".format(index_name))
+
+            mapped = mmap.mmap(f_index.fileno(), 0, access=mmap.ACCESS_READ)
+
+        end = INDEX_HEADER.size + entries * INDEX_ENTRY.size
+        pairs = memoryview(mapped)[INDEX_HEADER.size : end].cast("Q")
+
+        self.offsets = pairs[0::2]
+        self.characters = pairs[1::2]
+
+    def __len__(self):
+        """Number of lines in the file"""
+        return len(self.offsets) - 1
+
+    def line_range(self, start=None, end=None):
+        """Return the byte range holding lines start to end, counted like a slice"""
+        start, end, _ = slice(start, end).indices(len(self))
+
+        return self.offsets[start], self.offsets[max(start, end)]
+
+    def line_of(self, position):
+        """Return the number of the line holding the byte at position"""
+        return max(bisect.bisect_right(self.offsets, position) - 1, 0)
+
+
+# Method to load the sidecar index of line offsets for a file - returns None when there
+#  is no index or the file has changed since it was built, unless build is True in
+#  which case a fresh index is built
+def load_line_index(file_name, index_name=None, build=False):
+    """Load the sidecar index of line offsets for a file"""
+    index_name = index_name or file_name + INDEX_SUFFIX
+    status = os.stat(file_name)
+
+    try:
+        with open(index_name, "rb") as f_index:
+            header = f_index.read(INDEX_HEADER.size)
+        magic, size, mtime, _ = INDEX_HEADER.unpack(header)
+        current = (magic, size, mtime) == (
+            INDEX_MAGIC,
+            status.st_size,
+            status.st_mtime_ns,
+        )
+    except (OSError, struct.error):
+        current = False
+
+    if not current:
+        if not build:
+            return None
+        build_line_index(file_name, index_name)
+
+    return LineIndex(index_name)
+
+
+# Method to find the start of the line holding the byte at position, by reading the
+#  file backwards one block at a time from that position
+def find_line_start(f_in, position, block_size=FILE_BLOCK_SIZE):
+    """Return the byte offset of the start of the line holding position"""
+    while position > 0:
+        begin = max(position - block_size, 0)
+        f_in.seek(begin)
+        newline = f_in.read(position - begin).rfind(b"\n")
+
+        if newline >= 0:
+            return begin + newline + 1
+
+        position = begin
+
+    return 0
+
+
+# Method to find the first byte at or after position of a file that isn't a UTF-8
+#  continuation byte. The decoder never holds back part of a character in front of
+#  such a byte, so a file split there counts and translates its characters just as
+#  it would in one piece, whatever the bytes around it are
+def character_boundary(f_in, position, block_size=FILE_BLOCK_SIZE):
+    """Return the offset of the first byte at or after position starting a character"""
+    f_in.seek(position)
+    for data in iter(lambda: f_in.read(block_size), b""):
+        skipped = len(data) - len(data.lstrip(UTF8_CONTINUATION))
+        position += skipped
+        if skipped < len(data):
+            break
+
+    return position
+
+
+# Method to count the UTF-8 characters in the next length bytes of a file - given a
+#  decoder, a character left unfinished at the end is held back in it, not counted
+def read_utf8_length(f_in, length, block_size=FILE_BLOCK_SIZE, decoder=None):
+    """Count the characters in the next length bytes of a file"""
+    final = decoder is None
+    decoder = decoder or codecs.getincrementaldecoder("utf-8")("surrogateescape")
+    characters = 0
+    while length > 0:
+        data = f_in.read(min(block_size, length))
+        if not data:
+            break
+        length -= len(data)
+        characters += utf8_length(data, decoder, False)
+
+    return characters + (utf8_length(b"", decoder) if final else 0)
+
+
+# Method to work out how far through the key the byte at start of a file is - per_line
+#  restarts the key on every line, and count_characters counts UTF-8 characters rather
+#  than bytes, just as the decoder of file_cipher() counts them. A start part way
+#  through a character is moved back to its first byte, and returned with its key
+#  position. The index avoids reading the file back to the start of the line (or the
+#  file) - only the part of the line before start is read when an index is provided
+def key_phase(
+    f_in,
+    start,
+    per_line=True,
+    count_characters=False,
+    index=None,
+    block_size=FILE_BLOCK_SIZE,
+):
+    """Return the first byte of the character at start of a file and its key position"""
+    if not per_line and not count_characters:
+        return start, start
+
+    if index is not None:
+        line = index.line_of(start)
+        begin = index.offsets[line]
+        phase = 0 if per_line else index.characters[line]
+    elif per_line:
+        begin = find_line_start(f_in, start, block_size)
+        phase = 0
+    else:
+        # without an index every character before start has to be counted
+        begin = 0
+        phase = 0
+
+    if not count_characters:
+        return start, phase + start - begin
+
+    # lines start where the decoder holds nothing back, so it counts from there just
+    #  as it does reading the whole file
+    decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+    f_in.seek(begin)
+    phase += read_utf8_length(f_in, start - begin, block_size, decoder)
+
+    # the bytes held back are the start of the character at start only if the bytes
+    #  from start carry it on - otherwise each of them is a character of its own
+    held = len(decoder.getstate()[0])
+    if held:
+        following = f_in.read(1)
+        text = decoder.decode(following, not following)
+        if text and "\udc80" <= text[0] <= "\udcff":
+            return start, phase + held
+
+    return start - held, phase
+
+
+# Method to Encrypt and/or Decrypt one piece of a file from the given key position -
+#  with per_line the key restarts after every newline, as it does when whole files are
+#  translated line by line. Returns the translated piece and the key position after it
+def translate_piece(cipher, data, decrypt=False, phase=0, per_line=True):
+    """Translate a piece of a file from a key position, returning the next position"""
+    if not per_line:
+        return cipher.translate(data, decrypt, phase), phase + len(data)
+
+    newline = b"\n" if isinstance(data, bytes) else "\n"
+    pieces = []
+    begin = 0
+    end = data.find(newline)
+
+    while end >= 0:
+        pieces.append(cipher.translate(data[begin : end + 1], decrypt, phase))
+        phase = 0
+        begin = end + 1
+        end = data.find(newline, begin)
+
+    pieces.append(cipher.translate(data[begin:], decrypt, phase))
+
+    return data[:0].join(pieces), phase + len(data) - begin
+
+
+# Method to translate the blocks of a UTF-8 file from the key position phase, just as
+#  file_cipher() translates the whole file - with per_line the key restarts on every
+#  line, and the key position is counted in characters. ASCII blocks of an ASCII
+#  character set are translated as they are, anything else is decoded first, with a
+#  character split between two blocks held back until it is whole
+def translate_blocks(cipher, blocks, decrypt=False, phase=0, per_line=True):
+    """Translate the blocks of a UTF-8 file from a key position"""
+    binary = cipher.characters.isascii()
+    decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+
+    for block in blocks:
+        if binary and cipher.period == 1:
+            yield cipher.translate(block, decrypt)
+        elif binary and block.isascii() and not decoder.getstate()[0]:
+            block, phase = translate_piece(cipher, block, decrypt, phase, per_line)
+            yield block
+        else:
+            text = decoder.decode(block)
+            text, phase = translate_piece(cipher, text, decrypt, phase, per_line)
+            yield text.encode("utf-8", "surrogateescape")
+
+    if decoder.getstate()[0]:
+        text = decoder.decode(b"", True)
+        text = translate_piece(cipher, text, decrypt, phase, per_line)[0]
+        yield text.encode("utf-8", "surrogateescape")
+
+
+# Method to Encrypt and/or Decrypt just the bytes between start and end of a File,
+#  seeking straight to start and working out the key position from the offset, rather
+#  than translating everything before it. Yields the translated bytes block by block.
+#  per_line matches files translated line by line (the default) - use per_line=False
+#  for files translated as one continuous stream (--stream)
+def file_range_cipher(
+    file_name,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=True,
+    shift_type="right",
+    enc_type="Caesar",
+    backend="auto",
+    start=None,
+    end=None,
+    per_line=True,
+    index=None,
+    block_size=FILE_BLOCK_SIZE,
+):
+    """Encrypt and/or Decrypt the bytes between start and end of a File"""
+    if compression(file_name):
+        raise CipherError(
+            "{} is compressed - decompress it to seek within it".format(file_name)
+        )
+
+    cipher = compile_cipher(key, characters, shift_type, enc_type, backend)
+    if cipher.block is not None:
+        raise CipherError(
+            "Transposition ciphers move characters across whole blocks - "
+            "a range can't be translated on its own"
+        )
+    # the Vigenere key position is counted in characters, so only a cipher that treats
+    #  every position alike is applied straight to the bytes of an ASCII character set
+    binary = characters.isascii() and cipher.period == 1
+
+    # start and end are counted like a slice, so negative offsets count from the end
+    start, end, _ = slice(start, end).indices(os.path.getsize(file_name))
+
+    with open(file_name, "rb") as f_in:
+
+        # begin at the first byte of the character holding the byte at start
+        begin, phase = key_phase(f_in, start, per_line, not binary, index, block_size)
+        if start < end:
+            start = begin
+
+        f_in = stats_file(f_in)
+        f_in.seek(start)
+
+        # anything else is applied to the text, and a character split by start or end of
+        #  the range is passed through untouched
+        decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+
+        position = start
+        while position < end:
+            data = f_in.read(min(block_size, end - position))
+            if not data:
+                break
+            position += len(data)
+
+            with stats_phase("transform"):
+                if not binary:
+                    data = decoder.decode(data, position >= end)
+
+                data, phase = translate_piece(cipher, data, decrypt, phase, per_line)
+
+                if not binary:
+                    data = data.encode("utf-8", "surrogateescape")
+
+            yield data
+
+
+# Method to parse a START:END range from the command line - counted like a slice, so
+#  either end may be left out and negative values count back from the end
+def parse_range(value):
+    """Parse a START:END range from the command line"""
+    start, separator, end = value.partition(":")
+
+    try:
+        if not separator:
+            raise ValueError
+        return (int(start) if start else None, int(end) if end else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected START:END, e.g. 1000:2000")
+
+
+# Cipher shared by the worker processes of batch_file_cipher() - set once per process
+#  by batch_worker_init(), so the tables aren't sent along with every file
+BATCH_CIPHER = None
+
+
+# Method run when each batch worker process starts
+def batch_worker_init(cipher):
+    """Store the cipher shared by every file a batch worker process translates"""
+    global BATCH_CIPHER
+    BATCH_CIPHER = cipher
+
+
+# Method to translate a single file of a batch, creating the output directory as needed
+#  returns the number of bytes in the input file
+def batch_translate_file(
+    file_name, output_file_name, decrypt=False, block_size=None, cipher=None
+):
+    """Translate a single file of a batch"""
+    cipher = cipher or BATCH_CIPHER
+
+    directory = os.path.dirname(output_file_name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    file_cipher(
+        file_name,
+        output_file_name,
+        cipher,
+        cipher.characters,
+        decrypt,
+        block_size=block_size,
+        verbose=False,
+    )
+
+    return os.path.getsize(file_name)
+
+
+# Method to collect the (input, output) file pairs for a batch - a directory tree is
+#  mirrored into output_dir, otherwise source is a manifest with one
+#  "input<TAB>output" pair per line (blank lines and lines starting with # are ignored)
+def batch_pairs(source, output_dir=None):
+    """Collect the (input, output) file pairs for a batch"""
+    pairs = []
+
+    if os.path.isdir(source):
+        if not output_dir:
+            raise CipherError("An output directory is needed to translate a directory")
+
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                file_name = os.path.join(root, name)
+                relative = os.path.relpath(file_name, source)
+                pairs.append((file_name, os.path.join(output_dir, relative)))
+
+        return pairs
+
+    with open(source, "r") as manifest:
+        for number, line in enumerate(manifest, 1):
+            line = line.rstrip("\r\n")
+
+            if not line.strip() or line.startswith("#"):
+                continue
+
+            pair = line.split("\t")
+            if len(pair) != 2:
+                raise CipherError(
+                    "Manifest line {} should be: input<TAB>output".format(number)
+                )
+
+            pairs.append(tuple(pair))
+
+    return pairs
+
+
+# Method to check whether an output file is already up to date with its input file
+#  (the ciphers never change the size of a file, so the sizes must match - unless the
+#  file is compressed or decompressed on the way, when only the times are compared)
+def is_unchanged(file_name, output_file_name):
+    """Check whether the output file is newer than, and the same size as, the input"""
+    try:
+        output_stat = os.stat(output_file_name)
+    except FileNotFoundError:
+        return False
+
+    input_stat = os.stat(file_name)
+
+    if output_stat.st_mtime < input_stat.st_mtime:
+        return False
+
+    return (
+        output_stat.st_size == input_stat.st_size
+        or compression(file_name) is not None
+        or compression(output_file_name, "w") is not None
+    )
+
+
+# Method to Encrypt and/or Decrypt a batch of files on a pool of threads (or processes)
+#  The cipher tables are built once and shared by every file in the batch
+def batch_file_cipher(
+    pairs,
+    key,
+    characters=string.ascii_lowercase,
+    decrypt=False,
+    shift_type="right",
+    enc_type="Caesar",
+    backend="auto",
+    block_size=None,
+    workers=None,
+    processes=False,
+    skip_unchanged=False,
+):
+    """Encrypt and/or Decrypt a batch of (input, output) file pairs"""
+    cipher = compile_cipher(key, characters, shift_type, enc_type, backend)
+    started = time.perf_counter()
+
+    todo = pairs
+    if skip_unchanged:
+        todo = [pair for pair in pairs if not is_unchanged(*pair)]
+
+    if processes:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=batch_worker_init, initargs=(cipher,)
+        )
+        shared = None
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        shared = cipher
+
+    with pool:
+        futures = [
+            pool.submit(
+                batch_translate_file,
+                file_name,
+                output_file_name,
+                decrypt,
+                block_size,
+                shared,
+            )
+            for file_name, output_file_name in todo
+        ]
+        total_bytes = sum(future.result() for future in futures)
+
+    seconds = time.perf_counter() - started
+    summary = {
+        "files": len(todo),
+        "skipped": len(pairs) - len(todo),
+        "bytes": total_bytes,
+        "seconds": seconds,
+    }
+
+    print(
+        "\nTranslated {} files ({} skipped as unchanged), {} bytes in {:.3f} seconds"
+        " - {:.2f} MB/s".format(
+            summary["files"],
+            summary["skipped"],
+            total_bytes,
+            seconds,
+            total_bytes / 1e6 / seconds if seconds else 0.0,
+        )
+    )
+
+    return summary
+
+
+# Method to read input from a specified file
+def input_from_file(file_name):
+    """reads input from a specified file"""
+    # read raw bytes and drop the line breaks before decoding - any bytes that aren't
+    #  valid UTF-8 are kept as surrogates so they survive the round trip back to a file
+    with open_file(file_name, "rb") as file:
+        data = stats_file(file).read().replace(b"\r", b"").replace(b"\n", b"")
+
+    text = data.decode("utf-8", "surrogateescape")
+
+    print("\nYour text has been retreived from: {}".format(file_name))
+
+    return text
+
+
+# Method to save output to a specified file
+def output_to_file(file_name, text):
+    """write output to a specified file"""
+    with open_file(file_name, "wb") as file:
+        # write the new line to output file
+        stats_file(file).write(text.encode("utf-8", "surrogateescape"))
+
+    print("\nThe results have been saved to: {}".format(file_name))
+
+
+# Method to get KEY number from user and check to make sure it is valid
+def get_key(key_type):
+    """get KEY number from user and check to make sure it is valid"""
+    if key_type in INTEGER_KEYS:
+        while True:
+            num = input("\nPlease enter an integer for Cipher to utilize as a key : ")
+            try:
+                key = int(num)
+                print("\nThank You!")
+                break
+            except ValueError:
+                print("\nERROR - Input", num, " is invalid!\n")
+                print("Please enter a valid integer!")
+
+    elif key_type in ("Vigenere", "Columnar"):
+        key = input(
+            "\nPlease enter word or phrase for the Cipher to utilize as a key : "
+        )
+
+    return key
+
+
+# Method to read a key (or cipher alphabet) from a file - only the line break at the
+#  end is removed, as spaces can be part of the key
+def key_from_file(file_name):
+    """read a key or cipher alphabet from a file"""
+    with open(file_name, "r") as file:
+        return file.read().rstrip("\r\n")
+
+
+# Method to get the KEY from the command line options (--key, --key-file or
+#  --alphabet-file), falling back to asking the user when interactive is True
+@record_stats("key")
+def resolve_key(args, key_type, characters=string.ascii_lowercase, interactive=True):
+    """get KEY from the command line options or from the user"""
+    # a pipeline carries the keys of its stages in the -T / --type option
+    if key_type == "Pipeline":
+        return parse_pipeline(args.type)
+
+    if args.key is not None:
+        key = args.key
+    elif args.key_file:
+        key = key_from_file(args.key_file)
+    elif args.alphabet_file:
+        if key_type != "Substitution":
+            raise CipherError("--alphabet-file can only be used with Substitution")
+        key = key_from_file(args.alphabet_file)
+    elif not interactive:
+        raise CipherError(
+            "A key must be provided via --key, --key-file or --alphabet-file"
+        )
+    elif key_type == "Substitution":
+        return get_cipher_alphabet(characters)
+    else:
+        return get_key(key_type)
+
+    if key_type in INTEGER_KEYS:
+        try:
+            key = int(key)
+        except ValueError:
+            raise CipherError(
+                "{} key {!r} is not a valid integer!".format(key_type, key)
+            )
+
+    return key
+
+
+# Method to Encrypt and/or Decrypt a stream (such as stdin) into another stream (such
+#  as stdout) block by block, so memory stays constant however much data flows through.
+#  ASCII character sets are applied to the raw bytes of binary streams
+def stream_cipher(f_in, f_out, cipher, decrypt=False, block_size=FILE_BLOCK_SIZE):
+    """Encrypt and/or Decrypt a stream into another stream block by block"""
+    if cipher.characters.isascii() and hasattr(f_in, "buffer"):
+        f_in = f_in.buffer
+        f_out = f_out.buffer
+
+    empty = f_in.read(0)
+    has_read1 = hasattr(f_in, "read1")
+
+    f_in = stats_file(f_in)
+    f_out = stats_file(f_out)
+
+    # read1() hands over whatever data is available, rather than waiting for a full block
+    read = f_in.read1 if has_read1 else f_in.read
+    blocks = iter(lambda: read(block_size), empty)
+
+    with stats_phase("transform"):
+        for block in cipher.encrypt_iter(blocks, decrypt):
+            f_out.write(block)
+
+    f_out.flush()
+
+
+###############################################################
+
+########################## Key Store ##########################
+
+# Length of the Vigenere keys made by generate_keys() unless another is given
+KEY_LENGTH = 16
+
+# Number of ciphers built from key store records that are kept ready to use - each one
+#  holds the encrypt and decrypt tables of its key
+KEYSTORE_CACHE_SIZE = 1024
+
+# Layout of a key store file - a header of magic, record width and length of the
+#  character set, the character set (UTF-8), then one fixed width record per key: its
+#  cipher type and length, followed by the key (UTF-8) padded to the record width. Every
+#  record starts on an 8 byte boundary, so key ID n is found at once at a fixed offset
+KEYSTORE_MAGIC = b"CIPHKEY1"
+KEYSTORE_HEADER = struct.Struct("=8sII")
+KEYSTORE_RECORD = struct.Struct("=12sI")
+
+
+# Method to generate substitution cipher alphabets with the secrets module - every
+#  alphabet is the character set sorted by a secure random number per character, so
+#  NumPy shuffles all of them at once
+def generate_alphabets(count, characters=string.ascii_lowercase):
+    """Generate count random cipher alphabets"""
+    size = len(characters)
+
+    if np is None:
+        generator = secrets.SystemRandom()
+        alphabets = []
+        for _ in range(count):
+            letters = list(characters)
+            generator.shuffle(letters)
+            alphabets.append("".join(letters))
+        return alphabets
+
+    codes = np.frombuffer(characters.encode("utf-32-le"), dtype=np.uint32)
+    weights = np.frombuffer(secrets.token_bytes(8 * count * size), dtype=np.uint64)
+    order = weights.reshape(count, size).argsort(axis=1)
+    text = codes[order].tobytes().decode("utf-32-le")
+
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+# Method to generate Vigenere keys of length characters with the secrets module. Random
+#  numbers from the top of the range that would favour some characters are thrown away,
+#  so every character of the character set is equally likely
+def generate_keywords(count, characters=string.ascii_lowercase, length=KEY_LENGTH):
+    """Generate count random Vigenere keys"""
+    if length < 1:
+        raise CipherError("Key length: {} must be at least 1!".format(length))
+
+    if np is None:
+        return [
+            "".join(secrets.choice(characters) for _ in range(length))
+            for _ in range(count)
+        ]
+
+    size = len(characters)
+    total = count * length
+    limit = (1 << 32) - (1 << 32) % size
+    values = np.zeros(0, dtype=np.uint32)
+    while len(values) < total:
+        needed = total - len(values)
+        drawn = np.frombuffer(secrets.token_bytes(4 * needed + 64), dtype=np.uint32)
+        values = np.concatenate([values, drawn[drawn < limit][:needed]])
+
+    codes = np.frombuffer(characters.encode("utf-32-le"), dtype=np.uint32)
+    text = codes[values % size].tobytes().decode("utf-32-le")
+
+    return [text[i : i + length] for i in range(0, len(text), length)]
+
+
+# Method to generate count random keys for a cipher type
+def generate_keys(
+    count, enc_type="Vigenere", characters=string.ascii_lowercase, length=KEY_LENGTH
+):
+    """Generate count random keys for Substitution or Vigenere"""
+    if enc_type == "Substitution":
+        return generate_alphabets(count, characters)
+    if enc_type == "Vigenere":
+        return generate_keywords(count, characters, length)
+
+    raise CipherError("Keys can only be generated for Substitution and Vigenere")
+
+
+# Keys of a key store file loaded through a memory map, so a store of any size is ready
+#  to use at once and the record of a key ID is read straight from its offset
+class KeyStore:
+    """Fixed width key records of a key store file"""
+
+    __slots__ = ("mapped", "characters", "width", "start", "size")
+
+    def __init__(self, file_name):
+        with open(file_name, "rb") as file:
+            try:
+                magic, width, length = KEYSTORE_HEADER.unpack(
+                    file.read(KEYSTORE_HEADER.size)
+                )
+            except struct.error:
+                magic = None
+            if magic != KEYSTORE_MAGIC:
+                raise CipherError("{} is not a key store".format(file_name))
+
+            self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        position = KEYSTORE_HEADER.size
+        self.characters = self.mapped[position : position + length].decode("utf-8")
+        self.width = width
+        self.start = position + aligned(length)
+        self.size = aligned(KEYSTORE_RECORD.size + width)
+
+    def __len__(self):
+        """Number of keys in the store"""
+        return (len(self.mapped) - self.start) // self.size
+
+    def __getitem__(self, key_id):
+        """Return the (cipher type, key) of a key ID"""
+        if not 0 <= key_id < len(self):
+            raise CipherError(
+                "Key ID {} is not in the key store ({} keys)".format(key_id, len(self))
+            )
+
+        position = self.start + key_id * self.size
+        enc_type, length = KEYSTORE_RECORD.unpack_from(self.mapped, position)
+        position += KEYSTORE_RECORD.size
+
+        return (
+            enc_type.rstrip(b"\0").decode("ascii"),
+            self.mapped[position : position + length].decode("utf-8"),
+        )
+
+
+# Method to add keys to a key store file, creating it if needed. Returns the key IDs of
+#  the new keys
+def save_keys(file_name, keys, enc_type="Vigenere", characters=string.ascii_lowercase):
+    """Add keys to a key store file"""
+    encoded = [str(key).encode("utf-8") for key in keys]
+    width = max(map(len, encoded), default=0)
+    first = 0
+
+    if os.path.exists(file_name):
+        store = KeyStore(file_name)
+        if store.characters != characters:
+            raise CipherError(
+                "{} holds keys for a different character set".format(file_name)
+            )
+        if width > store.width:
+            raise CipherError(
+                "{} holds keys of up to {} bytes - these need {}".format(
+                    file_name, store.width, width
+                )
+            )
+        width = store.width
+        first = len(store)
+    else:
+        # the records of a new store are wide enough for a cipher alphabet, or a key of
+        #  KEY_LENGTH of the widest characters, whatever keys are added to it first -
+        #  so one store can hold keys of both types
+        encoded_set = characters.encode("utf-8")
+        widest = max((len(c.encode("utf-8")) for c in characters), default=1)
+        width = max(width, len(encoded_set), KEY_LENGTH * widest)
+        with open(file_name, "wb") as file:
+            file.write(KEYSTORE_HEADER.pack(KEYSTORE_MAGIC, width, len(encoded_set)))
+            file.write(encoded_set.ljust(aligned(len(encoded_set)), b"\0"))
+
+    size = aligned(KEYSTORE_RECORD.size + width)
+    name = enc_type.encode("ascii")
+
+    with open(file_name, "ab") as file:
+        file.write(
+            b"".join(
+                (KEYSTORE_RECORD.pack(name, len(key)) + key).ljust(size, b"\0")
+                for key in encoded
+            )
+        )
+
+    return range(first, first + len(encoded))
+
+
+# Method to open a key store - it stays loaded until the file changes, so looking up a
+#  key costs a stat of the file rather than opening and mapping it again
+def load_keystore(file_name):
+    """Load a key store file"""
+    status = os.stat(file_name)
+
+    return open_keystore(os.path.abspath(file_name), status.st_size, status.st_mtime_ns)
+
+
+# Method to open a key store of a given size and modification time, so a store that
+#  has changed is opened afresh
+@functools.lru_cache(maxsize=8)
+def open_keystore(file_name, size, mtime):
+    """Open a key store file"""
+    return KeyStore(file_name)
+
+
+# Method to build (or reuse) the cipher of a key ID of a key store file - the encrypt
+#  and decrypt tables of a key are built the first time it is used, and the most
+#  recently used ciphers are kept, so a busy key is looked up in O(1) without
+#  rebuilding them
+def keystore_cipher(
+    file_name,
+    key_id,
+    characters=string.ascii_lowercase,
+    shift_type="right",
+    backend="auto",
+):
+    """Return the cipher of a key ID of a key store file"""
+    status = os.stat(file_name)
+
+    return stored_cipher(
+        os.path.abspath(file_name),
+        status.st_size,
+        status.st_mtime_ns,
+        key_id,
+        characters,
+        shift_type,
+        backend,
+    )
+
+
+# Method to build the cipher of a key ID of a key store of a given size and modification
+#  time - the cache holds the ciphers rather than the store, so a store that has
+#  changed isn't kept mapped by the ciphers of its old keys
+@functools.lru_cache(maxsize=KEYSTORE_CACHE_SIZE)
+@record_stats("tables")
+def stored_cipher(
+    file_name,
+    size,
+    mtime,
+    key_id,
+    characters=string.ascii_lowercase,
+    shift_type="right",
+    backend="auto",
+):
+    """Build the cipher of a key ID of a key store file"""
+    store = open_keystore(file_name, size, mtime)
+    if store.characters != characters:
+        raise CipherError("The key store holds keys for a different character set")
+
+    enc_type, key = store[key_id]
+    if enc_type in INTEGER_KEYS:
+        key = int(key)
+
+    return CIPHERS[enc_type](key, characters, shift_type, backend)
+
+
+###############################################################
+
+########################### Service ###########################
+
+# Size of the chunks request bodies are read and translated in by the service
+SERVE_CHUNK_SIZE = 1 << 16
+
+# Address the service listens on when --serve is given just a port
+SERVE_HOST = "127.0.0.1"
+
+# Seconds the service waits on each read of a request before closing the connection, so
+#  a client that stops part way through a request (or sits idle between requests on a
+#  keep-alive connection) doesn't hold its connection open for good
+SERVE_TIMEOUT = 30.0
+
+# Request headers that choose the cipher used for a request - any header left out
+#  falls back to the -T, --key, -S and -E/-D options the service was started with.
+#  X-Cipher-Key-Id picks a key of the service's --keystore by its ID
+SERVE_HEADERS = {
+    "type": "x-cipher-type",
+    "key": "x-cipher-key",
+    "key_id": "x-cipher-key-id",
+    "shift": "x-cipher-shift",
+    "op": "x-cipher-op",
+}
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 405: "Method Not Allowed"}
+
+
+# Method to split a "[HOST:]PORT" address into its host and port
+def parse_address(address, default_host=SERVE_HOST):
+    """Split a [HOST:]PORT address into (host, port)"""
+    host, _, port = address.rpartition(":")
+
+    try:
+        return host or default_host, int(port)
+    except ValueError:
+        raise CipherError("{!r} is not a valid [HOST:]PORT address".format(address))
+
+
+# Reader of one service connection that closes the connection once a read has waited
+#  timeout seconds for its client. A single timer checks the connection every timeout
+#  seconds, which costs far less than a timer (or with asyncio.wait_for() a task) for
+#  every read of a busy connection - a read that stalls is closed after between one
+#  and two timeouts, and then fails as if the client had closed the connection
+class TimedReader:
+    """StreamReader that closes its connection once a read has stalled"""
+
+    __slots__ = (
+        "reader",
+        "transport",
+        "timeout",
+        "reads",
+        "checked",
+        "waiting",
+        "timer",
+    )
+
+    def __init__(self, reader, transport, timeout):
+        self.reader = reader
+        self.transport = transport
+        self.timeout = timeout
+        self.reads = 0
+        self.checked = 0
+        self.waiting = False
+        self.timer = asyncio.get_running_loop().call_later(timeout, self.check)
+
+    def check(self):
+        """Close the connection if a read has waited since the last check"""
+        if self.waiting and self.reads == self.checked:
+            self.transport.abort()
+            return
+
+        self.checked = self.reads
+        self.timer = asyncio.get_running_loop().call_later(self.timeout, self.check)
+
+    def close(self):
+        """Stop checking the connection"""
+        self.timer.cancel()
+
+    async def readuntil(self, separator=b"\n"):
+        """Read up to and including separator"""
+        self.reads += 1
+        self.waiting = True
+        data = await self.reader.readuntil(separator)
+        self.waiting = False
+
+        return data
+
+    async def readexactly(self, n):
+        """Read exactly n bytes"""
+        self.reads += 1
+        self.waiting = True
+        data = await self.reader.readexactly(n)
+        self.waiting = False
+
+        return data
+
+
+# Method to read the request line and headers of an HTTP request - returns
+#  (method, path, headers) with lower case header names, or None once the client
+#  has closed the connection
+async def read_http_head(reader):
+    """Read the request line and headers of an HTTP request"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as error:
+        if error.partial.strip():
+            raise CipherError("Incomplete HTTP request")
+        return None
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, path, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise CipherError("Malformed HTTP request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    return method, path, headers
+
+
+# Method to read the body of an HTTP request chunk by chunk, whether it was sent with
+#  a Content-Length or with chunked transfer encoding
+async def read_http_body(reader, headers, chunk_size=SERVE_CHUNK_SIZE):
+    """Yield the body of an HTTP request in chunks"""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            try:
+                size = int(size_line.split(b";")[0], 16)
+            except ValueError:
+                size = -1
+            if size < 0:
+                raise CipherError("Invalid chunk size {!r}".format(size_line.strip()))
+
+            if size == 0:
+                # skip any trailers up to the blank line that ends the body
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return
+
+            while size:
+                chunk = await reader.readexactly(min(size, chunk_size))
+                size -= len(chunk)
+                yield chunk
+
+            await reader.readexactly(2)
+
+    try:
+        remaining = int(headers.get("content-length", 0))
+    except ValueError:
+        remaining = -1
+    if remaining < 0:
+        raise CipherError(
+            "Invalid Content-Length {!r}".format(headers.get("content-length"))
+        )
+
+    while remaining:
+        chunk = await reader.readexactly(min(remaining, chunk_size))
+        remaining -= len(chunk)
+        yield chunk
+
+
+# Method to start reading the body of an HTTP request - its first chunk is read before
+#  the response starts, so a body with broken framing can still be answered with 400
+#  rather than with a cut off 200. Returns an async iterator over the whole body
+async def start_http_body(reader, headers):
+    """Read the first chunk of a request body, returning an iterator over all of it"""
+    body = read_http_body(reader, headers)
+    try:
+        first = await body.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def chunks():
+        if first is not None:
+            yield first
+        async for chunk in body:
+            yield chunk
+
+    return chunks()
+
+
+# Method to write a complete (not streamed) HTTP response
+async def write_http_response(writer, status, body=b"", keep_alive=True):
+    """Write an HTTP response with a Content-Length body"""
+    writer.write(
+        "HTTP/1.1 {} {}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+        "Content-Length: {}\r\nConnection: {}\r\n\r\n".format(
+            status,
+            HTTP_REASONS[status],
+            len(body),
+            "keep-alive" if keep_alive else "close",
+        ).encode("latin-1")
+        + body
+    )
+    await writer.drain()
+
+
+# Method to choose the cipher of a request from its headers, falling back to the
+#  defaults the service was started with
+def request_cipher(headers, characters, defaults):
+    """Return (cipher, decrypt) for the headers of a request"""
+    options = dict(defaults)
+    for option, header in SERVE_HEADERS.items():
+        if header in headers:
+            options[option] = headers[header]
+
+    return options_cipher(options, characters)
+
+
+# Method to build the cipher described by a dict of type, key, shift, op and backend
+#  options - or key_id and keystore in place of type and key. compile_cipher() and
+#  keystore_cipher() cache the tables of recently used keys, so a repeated key costs a
+#  lookup rather than a rebuild. Returns (cipher, decrypt)
+def options_cipher(options, characters=string.ascii_lowercase, allow_files=False):
+    """Return (cipher, decrypt) for a dict of cipher options"""
+    enc_type = options["type"]
+    key = options["key"]
+
+    # options from a JSON job can be of any type, so they are checked before use
+    if not isinstance(enc_type, str):
+        raise CipherError("Cipher type {!r} must be a string".format(enc_type))
+
+    # a pipeline carries its keys in the type, e.g. Caesar:3,Vigenere:key
+    if is_pipeline(enc_type):
+        key = parse_pipeline(enc_type, allow_files)
+        enc_type = "Pipeline"
+    elif enc_type not in CIPHERS or enc_type == "Pipeline":
+        raise CipherError("Unknown cipher type {!r}".format(enc_type))
+    if options["shift"] not in ("left", "right"):
+        raise CipherError("Shift must be 'left' or 'right'")
+    if options["op"] not in ("encrypt", "decrypt"):
+        raise CipherError("Op must be 'encrypt' or 'decrypt'")
+
+    # a key ID picks a key (and its cipher type) from the key store instead
+    if options.get("key_id") is not None:
+        if not options.get("keystore"):
+            raise CipherError("A key ID needs a key store (--keystore)")
+        try:
+            key_id = int(options["key_id"])
+        except (TypeError, ValueError):
+            raise CipherError(
+                "Key ID {!r} is not a valid integer!".format(options["key_id"])
+            )
+
+        cipher = keystore_cipher(
+            options["keystore"],
+            key_id,
+            characters,
+            options["shift"],
+            options.get("backend", "auto"),
+        )
+        return cipher, options["op"] == "decrypt"
+
+    if key is None:
+        raise CipherError("A key must be provided")
+
+    if enc_type in INTEGER_KEYS:
+        try:
+            if isinstance(key, (bool, float)):
+                raise TypeError
+            key = int(key)
+        except (TypeError, ValueError):
+            raise CipherError(
+                "{} key {!r} is not a valid integer!".format(enc_type, key)
+            )
+    elif enc_type != "Pipeline" and not isinstance(key, str):
+        raise CipherError("{} key {!r} must be a string!".format(enc_type, key))
+
+    backend = options.get("backend", "auto")
+    cipher = compile_cipher(key, characters, options["shift"], enc_type, backend)
+
+    return cipher, options["op"] == "decrypt"
+
+
+# Method to stream the body of a request through a cipher into a chunked response.
+#  Every chunk is drained before the next is read, so a slow client holds back the
+#  reading of its request rather than letting the translated data pile up in memory
+async def stream_http_body(body, writer, cipher, decrypt):
+    """Translate a request body into a chunked response, chunk by chunk"""
+    binary = cipher.characters.isascii()
+    # non ASCII character sets work on text - a character can be split between chunks
+    decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+    offset = 0
+    # a transposition translates whole blocks, so the rest waits for the next chunk
+    carry = []
+    count = 0
+
+    async def send(chunk, final=False):
+        nonlocal offset
+        if binary:
+            # the Vigenere key still moves once per character of UTF-8 data
+            translated, moved = cipher.translate_utf8(
+                chunk, decrypt, offset, decoder, final
+            )
+        else:
+            translated = cipher.translate(chunk, decrypt, offset)
+            translated = translated.encode("utf-8", "surrogateescape")
+            moved = len(chunk)
+        offset += moved
+
+        if translated:
+            writer.write(b"%x\r\n%s\r\n" % (len(translated), translated))
+            await writer.drain()
+
+    async for chunk in body:
+        if not binary:
+            chunk = decoder.decode(chunk)
+
+        if cipher.block is not None:
+            cut, count = block_boundary(chunk, cipher.characters, cipher.block, count)
+            if cut is None:
+                carry.append(chunk)
+                continue
+
+            carry.append(chunk[:cut])
+            chunk, carry = chunk[:0].join(carry), [chunk[cut:]]
+
+        await send(chunk)
+
+    if not binary:
+        carry.append(decoder.decode(b"", True))
+    carry = (b"" if binary else "").join(carry)
+    if carry:
+        await send(carry)
+    if binary:
+        await send(b"", True)
+
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+# Method to serve every request made on one connection to the service, closing it
+#  once its client has sent nothing for timeout seconds
+async def handle_connection(
+    reader, writer, characters, defaults, timeout=SERVE_TIMEOUT
+):
+    """Serve the requests of one connection"""
+    reader = TimedReader(reader, writer.transport, timeout)
+    try:
+        while True:
+            try:
+                request = await read_http_head(reader)
+            except (CipherError, asyncio.LimitOverrunError) as error:
+                await write_http_response(writer, 400, str(error).encode(), False)
+                return
+
+            if request is None:
+                return
+
+            method, path, headers = request
+            keep_alive = headers.get("connection", "").lower() != "close"
+
+            if method != "POST":
+                await write_http_response(writer, 405, b"Use POST\n", False)
+                return
+
+            try:
+                cipher, decrypt = request_cipher(headers, characters, defaults)
+            except CipherError as error:
+                # the body hasn't been read, so the connection can't be reused
+                await write_http_response(
+                    writer, 400, "ERROR - {}\n".format(error).encode(), False
+                )
+                return
+
+            if headers.get("expect", "").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+            try:
+                body = await start_http_body(reader, headers)
+            except (CipherError, asyncio.LimitOverrunError) as error:
+                await write_http_response(
+                    writer, 400, "ERROR - {}\n".format(error).encode(), False
+                )
+                return
+
+            writer.write(
+                "HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n"
+                "Transfer-Encoding: chunked\r\nConnection: {}\r\n\r\n".format(
+                    "keep-alive" if keep_alive else "close"
+                ).encode("latin-1")
+            )
+            await stream_http_body(body, writer, cipher, decrypt)
+
+            if not keep_alive:
+                return
+
+    except (ConnectionError, asyncio.IncompleteReadError):
+        # the client went away, or stopped sending, part way through a request
+        pass
+    except (CipherError, asyncio.LimitOverrunError):
+        # the framing broke after the response had started - the connection is closed
+        #  without the last chunk, so the client sees the response was cut off
+        pass
+    finally:
+        reader.close()
+        writer.close()
+
+
+# Method to run the service on host:port until interrupted. Ciphers are chosen by the
+#  X-Cipher-Type, X-Cipher-Key, X-Cipher-Shift and X-Cipher-Op headers of each POST
+#  request, and the request body is returned translated. A connection is closed once
+#  its client has sent nothing for timeout seconds
+async def serve(
+    host,
+    port,
+    characters=string.ascii_lowercase,
+    defaults=None,
+    timeout=SERVE_TIMEOUT,
+):
+    """Run the cipher service"""
+    defaults = dict(
+        {"type": "Caesar", "key": None, "shift": "right", "op": "encrypt"},
+        **(defaults or {}),
+    )
+    defaults.setdefault("backend", "auto")
+
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(
+            reader, writer, characters, defaults, timeout
+        ),
+        host,
+        port,
+    )
+
+    for sock in server.sockets:
+        print("Serving ciphers on http://{}:{}/".format(*sock.getsockname()[:2]))
+
+    async with server:
+        await server.serve_forever()
+
+
+# Method to send requests over one keep-alive connection for the load generator,
+#  recording the latency of each one
+async def load_connection(host, port, requests, payload, headers, latencies):
+    """Send requests over one connection, recording their latencies"""
+    reader, writer = await asyncio.open_connection(host, port)
+    header_lines = "".join(
+        "{}: {}\r\n".format(name, value) for name, value in headers.items()
+    )
+    request = (
+        "POST / HTTP/1.1\r\nHost: {}\r\nContent-Length: {}\r\n{}\r\n".format(
+            host, len(payload), header_lines
+        ).encode("latin-1")
+        + payload
+    )
+
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+
+            status = (await reader.readuntil(b"\r\n")).decode("latin-1")
+            response_headers = {}
+            while True:
+                line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+
+            async for _ in read_http_body(reader, response_headers):
+                pass
+
+            if " 200 " not in status:
+                raise CipherError("Service replied: {}".format(status.strip()))
+
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+# Method to load the service with concurrent connections and measure how many requests
+#  per second it handles, along with the latency percentiles of those requests
+async def load_generator(
+    host, port, requests=1000, concurrency=16, payload_size=1024, headers=None
+):
+    """Measure the requests per second and latency of a running service"""
+    payload = "".join(random.Random(0).choices(string.ascii_letters, k=payload_size))
+    payload = payload.encode("latin-1")
+    latencies = []
+    per_connection = [requests // concurrency] * concurrency
+    for i in range(requests % concurrency):
+        per_connection[i] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            load_connection(host, port, count, payload, headers or {}, latencies)
+            for count in per_connection
+            if count
+        )
+    )
+    seconds = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    summary = {
+        "requests": len(latencies),
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds if seconds else 0.0,
+        "p50_ms": percentile(0.5) * 1000 if latencies else None,
+        "p90_ms": percentile(0.9) * 1000 if latencies else None,
+        "p99_ms": percentile(0.99) * 1000 if latencies else None,
+    }
+
+    print(
+        "\n{} requests in {:.3f} seconds - {:.1f} requests/s"
+        "\nLatency p50 {:.3f} ms, p90 {:.3f} ms, p99 {:.3f} ms".format(
+            summary["requests"],
+            seconds,
+            summary["requests_per_second"],
+            summary["p50_ms"] or 0.0,
+            summary["p90_ms"] or 0.0,
+            summary["p99_ms"] or 0.0,
+        )
+    )
+
+    return summary
+
+
+# Method to run a single job of a jobs file - a JSON object with op, type, key (or the
+#  key_id of a key in the --keystore) and shift (any of which fall back to defaults)
+#  and either "text" to translate or the "input" and "output" file names to translate
+#  between. Returns the JSON result, which always reports the line number, "ok" and how
+#  many seconds the job took
+def run_job(line, number=None, characters=string.ascii_lowercase, defaults=None):
+    """Run one job of a jobs file, returning its result as a JSON line"""
+    started = time.perf_counter()
+    result = {"line": number}
+
+    try:
+        job = json.loads(line)
+        if not isinstance(job, dict):
+            raise CipherError("A job must be a JSON object")
+        if "id" in job:
+            result["id"] = job["id"]
+
+        options = dict(defaults or {})
+        for option in ("type", "key", "key_id", "shift", "op"):
+            if option in job:
+                options[option] = job[option]
+        cipher, decrypt = options_cipher(options, characters, allow_files=True)
+
+        if "text" in job:
+            if not isinstance(job["text"], str):
+                raise CipherError('The "text" of a job must be a string')
+            result["text"] = cipher.translate(job["text"], decrypt)
+        elif "input" in job and "output" in job:
+            if not isinstance(job["input"], str) or not isinstance(job["output"], str):
+                raise CipherError(
+                    'The "input" and "output" of a job must be file names'
+                )
+            file_cipher(
+                job["input"],
+                job["output"],
+                cipher,
+                characters,
+                decrypt,
+                block_size=options.get("block_size"),
+                verbose=False,
+            )
+            result["output"] = job["output"]
+            result["bytes"] = os.path.getsize(job["input"])
+        else:
+            raise CipherError('A job needs "text" or both "input" and "output"')
+
+        result["ok"] = True
+    except (CipherError, OSError, ValueError, TypeError) as error:
+        result["ok"] = False
+        result["error"] = str(error)
+
+    result["seconds"] = time.perf_counter() - started
+
+    return json.dumps(result)
+
+
+# Number of jobs sent to a worker process at a time - small jobs take less time than
+#  handing them to another process, so they travel in batches
+JOBS_BATCH_SIZE = 64
+
+
+# Method to run a batch of (line number, line) jobs in a worker process
+def run_job_batch(batch, characters=string.ascii_lowercase, defaults=None):
+    """Run a batch of jobs, returning their JSON result lines"""
+    return [run_job(line, number, characters, defaults) for number, line in batch]
+
+
+# Method to run every job of a jobs file (one JSON object per line) in one process,
+#  writing one JSON result per line in the same order. Cipher tables are cached across
+#  jobs, and with workers the jobs are spread across a pool of worker processes -
+#  only a few batches per worker are in flight at once, so memory stays bounded
+def run_jobs(
+    f_in, f_out, characters=string.ascii_lowercase, defaults=None, workers=None
+):
+    """Run a jobs file, writing a JSON result line for every job"""
+    jobs = ((number, line) for number, line in enumerate(f_in, 1) if line.strip())
+
+    if not workers or workers == 1:
+        for number, line in jobs:
+            f_out.write(run_job(line, number, characters, defaults) + "\n")
+        f_out.flush()
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = collections.deque()
+        batch = []
+        for job in itertools.chain(jobs, [None]):
+            if job is not None:
+                batch.append(job)
+                if len(batch) < JOBS_BATCH_SIZE:
+                    continue
+
+            if batch:
+                pending.append(pool.submit(run_job_batch, batch, characters, defaults))
+                batch = []
+
+            while pending and (job is None or len(pending) >= workers * 4):
+                for result in pending.popleft().result():
+                    f_out.write(result + "\n")
+
+    f_out.flush()
+
+
+###############################################################
+
+######################## Cryptanalysis ########################
+
+# Relative frequency (per cent) of each letter in English text
+ENGLISH_LETTER_FREQUENCIES = {
+    "a": 8.167, "b": 1.492, "c": 2.782, "d": 4.253, "e": 12.702, "f": 2.228,
+    "g": 2.015, "h": 6.094, "i": 6.966, "j": 0.153, "k": 0.772, "l": 4.025,
+    "m": 2.406, "n": 6.749, "o": 7.507, "p": 1.929, "q": 0.095, "r": 5.987,
+    "s": 6.327, "t": 9.056, "u": 2.758, "v": 0.978, "w": 2.360, "x": 0.150,
+    "y": 1.974, "z": 0.074,
+}  # fmt: skip
+
+# Share of English text taken up by spaces, capital letters, digits and punctuation,
+#  plus the smallest probability given to any character so no score divides by zero
+ENGLISH_SPACE_SHARE = 0.17
+ENGLISH_CAPITAL_SHARE = 0.03
+ENGLISH_DIGIT_SHARE = 0.004
+ENGLISH_PUNCTUATION = {".": 0.009, ",": 0.009, "'": 0.002, '"': 0.002, "-": 0.002}
+ENGLISH_FLOOR = 0.0001
+
+
+# Method to build the expected frequency of each character of the character set
+#  in English text - used to score candidate decryptions
+def english_frequencies(characters=string.ascii_lowercase):
+    """Expected frequency of each character of the character set in English text"""
+    letter_share = 1 - ENGLISH_SPACE_SHARE - ENGLISH_DIGIT_SHARE
+    letter_share -= sum(ENGLISH_PUNCTUATION.values())
+    letter_total = sum(ENGLISH_LETTER_FREQUENCIES.values())
+
+    frequencies = []
+    for character in characters:
+        lower = character.lower()
+
+        if character == " ":
+            frequency = ENGLISH_SPACE_SHARE
+        elif lower in ENGLISH_LETTER_FREQUENCIES:
+            share = ENGLISH_CAPITAL_SHARE if character.isupper() else 1
+            share -= ENGLISH_CAPITAL_SHARE if character.islower() else 0
+            frequency = letter_share * share * ENGLISH_LETTER_FREQUENCIES[lower]
+            frequency /= letter_total
+        elif character in string.digits:
+            frequency = ENGLISH_DIGIT_SHARE / 10
+        else:
+            frequency = ENGLISH_PUNCTUATION.get(character, 0)
+
+        frequencies.append(max(frequency, ENGLISH_FLOOR))
+
+    total = sum(frequencies)
+
+    return [frequency / total for frequency in frequencies]
+
+
+# Method to read a file (or stdin when file_name is "-") in blocks for analysis,
+#  stopping after sample characters when a sample size is provided. ASCII character
+#  sets are analysed on the raw bytes of the file
+def read_blocks(file_name, characters=string.ascii_lowercase, sample=None):
+    """Read a file in blocks for analysis, optionally stopping after a sample"""
+    binary = characters.isascii()
+
+    if file_name == "-":
+        file = sys.stdin.buffer if binary else sys.stdin
+    else:
+        file = open_file(file_name, "rb" if binary else "r")
+
+    try:
+        remaining = sample
+        while remaining is None or remaining > 0:
+            size = FILE_BLOCK_SIZE
+            if remaining is not None:
+                size = min(remaining, FILE_BLOCK_SIZE)
+
+            block = file.read(size)
+
+            if not block:
+                break
+
+            if remaining is not None:
+                remaining -= len(block)
+
+            yield block
+    finally:
+        if file_name != "-":
+            file.close()
+
+
+# Method to join the start of an iterable of blocks (str or bytes) into one sample of
+#  at most sample characters, reading no more blocks than it needs
+def sample_blocks(blocks, sample):
+    """Join the first sample characters of an iterable of blocks"""
+    pieces = []
+    size = 0
+    for block in blocks:
+        pieces.append(block[: sample - size])
+        size += len(pieces[-1])
+        if size >= sample:
+            break
+
+    return pieces[0][:0].join(pieces) if pieces else ""
+
+
+# Method to count how often each character of the character set appears in text
+#  (str or bytes) - returns one count per character, in character set order
+def character_counts(text, characters=string.ascii_lowercase):
+    """Count how often each character of the character set appears in text"""
+    if isinstance(text, str):
+        counter = collections.Counter(text)
+        return [counter[character] for character in characters]
+
+    if np is not None:
+        counts = np.bincount(np.frombuffer(text, dtype=np.uint8), minlength=256)
+        return [int(counts[ord(character)]) for character in characters]
+
+    counter = collections.Counter(text)
+    return [counter[ord(character)] for character in characters]
+
+
+# Method to score every possible shift of a histogram of ciphertext characters with a
+#  chi-squared test against the expected English frequencies. Shifting the text by s
+#  just rotates its histogram by s, so all shifts cost O(size^2) rather than decrypting
+#  the text once per shift. Returns a list of (shift, score), lowest (best) score first
+def score_shifts(counts, expected):
+    """Chi-squared score of every rotation of a histogram against expected frequencies"""
+    size = len(counts)
+    total = sum(counts) or 1
+    expected_counts = [frequency * total for frequency in expected]
+
+    scores = []
+    for shift in range(size):
+        # plaintext character i shows up in the ciphertext as character i + shift
+        score = 0.0
+        for i in range(size):
+            difference = counts[(i + shift) % size] - expected_counts[i]
+            score += difference * difference / expected_counts[i]
+
+        scores.append((shift, score))
+
+    scores.sort(key=lambda item: item[1])
+
+    return scores
+
+
+# Method to turn a shift of the character set into the Caesar key that undoes it
+def shift_to_caesar_key(shift, size, shift_type="right"):
+    """Convert a shift of the character set into a Caesar Cipher key"""
+    if shift_type == "left":
+        return (size - shift) % size
+
+    return shift
+
+
+# Method to recover the most likely keys of a Caesar Cipher from the ciphertext
+#  blocks (str or bytes) - one histogram is built over the text, then every key is
+#  scored by rotating that histogram against the expected character frequencies
+#  (English, unless others are provided). Returns the best few (key, score) pairs
+def crack_caesar(
+    blocks,
+    characters=string.ascii_lowercase,
+    shift_type="right",
+    top=5,
+    expected=None,
+):
+    """Recover the most likely Caesar Cipher keys from ciphertext"""
+    if isinstance(blocks, (str, bytes, bytearray)):
+        blocks = [blocks]
+
+    counts = [0] * len(characters)
+    for block in blocks:
+        for i, count in enumerate(character_counts(block, characters)):
+            counts[i] += count
+
+    scores = score_shifts(counts, expected or english_frequencies(characters))
+
+    return [
+        (shift_to_caesar_key(shift, len(characters), shift_type), score)
+        for shift, score in scores[:top]
+    ]
+
+
+# Longest Vigenere key considered when the key length isn't known
+VIGENERE_MAX_KEY_LENGTH = 20
+
+# Number of characters searched for repeated n-grams (Kasiski examination) - repeats
+#  are plentiful long before this, and it bounds the memory used by the n-gram index
+KASISKI_SAMPLE = 1 << 20
+
+# Length of the repeated n-grams used by the Kasiski examination
+KASISKI_NGRAM = 3
+
+
+# Method to build the position of every byte value within a Latin-1 character set (-1
+#  if absent) as a NumPy lookup array - built once per character set, as short texts
+#  such as single lines would otherwise spend most of their time building it
+@functools.lru_cache(maxsize=32)
+def byte_indices(characters=string.ascii_lowercase):
+    """Position of every byte value within the character set (-1 if absent)"""
+    lookup = np.full(256, -1, dtype=np.int32)
+    for character, i in character_index(characters).items():
+        lookup[ord(character)] = i
+    lookup.flags.writeable = False
+
+    return lookup
+
+
+# Method to find the position of each character of text (str or bytes) within the
+#  character set, -1 for characters outside it. Returns a NumPy array when possible
+def character_indices(text, characters=string.ascii_lowercase):
+    """Position of each character of text within the character set (-1 if absent)"""
+    index = character_index(characters)
+
+    if np is not None and max(characters, default="") < "\u0100":
+        data = text
+        if isinstance(text, str):
+            try:
+                data = text.encode("latin-1")
+            except UnicodeEncodeError:
+                data = None
+
+        if data is not None:
+            return byte_indices(characters)[np.frombuffer(data, dtype=np.uint8)]
+
+    if not isinstance(text, str):
+        index = {ord(character): i for character, i in index.items()}
+
+    return [index.get(character, -1) for character in text]
+
+
+# Method to add the characters of one block of indices to the per column histograms
+#  of a candidate Vigenere key length (a NumPy array of shape length x size when NumPy
+#  is installed). positions holds the key position of each character, from key_positions()
+def add_column_counts(counts, indices, length, positions):
+    """Add one block of character indices to the histograms of each key column"""
+    size = len(counts[0])
+
+    if np is not None and isinstance(indices, np.ndarray):
+        valid = indices >= 0
+        columns = (np.asarray(positions, dtype=np.int64) % length)[valid]
+        codes = columns * size + indices[valid]
+        counts += np.bincount(codes, minlength=length * size).reshape(length, size)
+        return
+
+    for position, i in zip(positions, indices):
+        if i >= 0:
+            counts[position % length][i] += 1
+
+
+# Method to find every n-gram made up entirely of characters from the character set
+#  returns the position of each n-gram along with a code that identifies it
+#  (its characters' indices read as a number in base size)
+def ngram_codes(indices, size, ngram):
+    """Positions and codes of the n-grams of a sequence of character indices"""
+    if np is not None and isinstance(indices, np.ndarray):
+        if len(indices) < ngram:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        count = len(indices) - ngram + 1
+        valid = np.ones(count, dtype=bool)
+        codes = np.zeros(count, dtype=np.int64)
+        for j in range(ngram):
+            part = indices[j : count + j]
+            valid &= part >= 0
+            codes = codes * size + part
+
+        return np.nonzero(valid)[0], codes[valid]
+
+    positions = []
+    codes = []
+    for position in range(len(indices) - ngram + 1):
+        code = 0
+        for i in indices[position : position + ngram]:
+            if i < 0:
+                break
+            code = code * size + i
+        else:
+            positions.append(position)
+            codes.append(code)
+
+    return positions, codes
+
+
+# Method to measure the distances between repeats of the same n-gram (the Kasiski
+#  examination). Every n-gram is hashed into an index of where it was last seen, so a
+#  repeat costs O(1) to find - the distances between repeats tend to be multiples of
+#  the key length, as the same plaintext was encrypted by the same part of the key.
+#  When the key starts again on every line, lines holds the line number of each
+#  character and only repeats within a line are measured
+def kasiski_distances(indices, size, ngram=KASISKI_NGRAM, lines=None):
+    """Distances between repeated n-grams of character indices"""
+    positions, codes = ngram_codes(indices, size, ngram)
+
+    if np is not None and isinstance(codes, np.ndarray):
+        # sorting groups equal n-grams (of the same line) together, in order of position
+        if lines is None:
+            order = np.argsort(codes, kind="stable")
+        else:
+            lines = np.asarray(lines)[positions]
+            order = np.lexsort((positions, codes, lines))
+        codes = codes[order]
+        positions = positions[order]
+        repeats = codes[1:] == codes[:-1]
+        if lines is not None:
+            lines = lines[order]
+            repeats &= lines[1:] == lines[:-1]
+
+        return (positions[1:] - positions[:-1])[repeats]
+
+    last_seen = {}
+    distances = []
+    for position, code in zip(positions, codes):
+        if lines is not None:
+            code = (lines[position], code)
+        if code in last_seen:
+            distances.append(position - last_seen[code])
+        last_seen[code] = position
+
+    return distances
+
+
+# Method to calculate the index of coincidence of a histogram - the chance that two
+#  characters picked at random are the same. English text scores well above the
+#  1 / size of random text, and so does each column of Vigenere ciphertext once the
+#  text is split into columns by the right key length
+def index_of_coincidence(counts):
+    """Index of coincidence of a histogram"""
+    total = sum(counts)
+
+    if total < 2:
+        return 0.0
+
+    return sum(count * (count - 1) for count in counts) / (total * (total - 1))
+
+
+# Method to rank the likely Vigenere key lengths. Each length gets a score from the
+#  average index of coincidence of its columns (1.0 is as good as English text) plus
+#  how much more often than chance the Kasiski repeat distances divide by the length.
+#  Returns a list of (length, score), best first
+def rank_key_lengths(counts_by_length, distances, expected):
+    """Rank candidate Vigenere key lengths, best first"""
+    size = len(expected)
+    random_ioc = 1 / size
+    english_ioc = sum(frequency * frequency for frequency in expected)
+
+    ranking = []
+    for length, counts in counts_by_length.items():
+        ioc = sum(index_of_coincidence(column) for column in counts) / length
+        score = (ioc - random_ioc) / (english_ioc - random_ioc)
+
+        if length > 1 and len(distances):
+            if np is not None and isinstance(distances, np.ndarray):
+                divides = int(np.count_nonzero(distances % length == 0))
+            else:
+                divides = sum(1 for distance in distances if distance % length == 0)
+            score += (divides / len(distances) - 1 / length) / (1 - 1 / length)
+
+        ranking.append((length, score))
+
+    ranking.sort(key=lambda item: -item[1])
+
+    return ranking
+
+
+# Method to turn a shift of the character set into the Vigenere key letter that
+#  was used to encrypt with it
+def shift_to_vigenere_letter(shift, length, characters, shift_type="right"):
+    """Convert a shift of the character set into a Vigenere key letter"""
+    if shift_type == "left":
+        return characters[(length - shift) % len(characters)]
+
+    return characters[shift]
+
+
+# Method to recover the most likely keys of a Vigenere Cipher from the ciphertext
+#  blocks (str or bytes). Per column histograms for every candidate key length are
+#  built in a single streamed pass, the lengths are ranked (index of coincidence plus
+#  Kasiski examination) and each column of the best lengths is then solved like a
+#  Caesar Cipher, against English frequencies unless others are provided. per_line
+#  says the key started again on every line, as it does for files translated line by
+#  line. Returns the best few (key, score) pairs
+def crack_vigenere(
+    blocks,
+    characters=string.ascii_lowercase,
+    shift_type="right",
+    top=5,
+    max_length=VIGENERE_MAX_KEY_LENGTH,
+    expected=None,
+    per_line=True,
+):
+    """Recover the most likely Vigenere Cipher keys from ciphertext"""
+    if isinstance(blocks, (str, bytes, bytearray)):
+        blocks = [blocks]
+
+    size = len(characters)
+    expected = expected or english_frequencies(characters)
+    counts_by_length = {
+        length: (
+            np.zeros((length, size), dtype=np.int64)
+            if np is not None
+            else [[0] * size for _ in range(length)]
+        )
+        for length in range(1, max_length + 1)
+    }
+
+    # the key position of each character says which column it falls in - and when the
+    #  key starts again on every line, the line number of each sampled character keeps
+    #  the Kasiski repeats within a line
+    offset = 0
+    position = 0
+    line = 0
+    kasiski_sample = []
+    kasiski_lines = []
+    for block in blocks:
+        indices = character_indices(block, characters)
+        positions, position = key_positions(block, position, per_line)
+
+        for length, counts in counts_by_length.items():
+            add_column_counts(counts, indices, length, positions)
+
+        if offset < KASISKI_SAMPLE:
+            kasiski_sample.append(indices[: KASISKI_SAMPLE - offset])
+            if per_line:
+                # a line starts wherever the key position is back at 0
+                starts = positions[: KASISKI_SAMPLE - offset]
+                if np is not None:
+                    lines = line + np.cumsum(np.asarray(starts) == 0)
+                else:
+                    lines = [
+                        line + n for n in itertools.accumulate(p == 0 for p in starts)
+                    ]
+                kasiski_lines.extend(lines)
+                line = lines[-1] if len(lines) else line
+
+        offset += len(indices)
+
+    if np is not None:
+        counts_by_length = {
+            length: counts.tolist() for length, counts in counts_by_length.items()
+        }
+
+    if np is not None and all(isinstance(x, np.ndarray) for x in kasiski_sample):
+        sample = np.concatenate(kasiski_sample or [np.zeros(0, dtype=np.int32)])
+    else:
+        sample = [i for indices in kasiski_sample for i in indices]
+
+    distances = kasiski_distances(
+        sample, size, lines=kasiski_lines if per_line else None
+    )
+    ranking = rank_key_lengths(counts_by_length, distances, expected)
+
+    results = []
+    for length, score in ranking[:top]:
+        key = "".join(
+            shift_to_vigenere_letter(
+                score_shifts(column, expected)[0][0], length, characters, shift_type
+            )
+            for column in counts_by_length[length]
+        )
+        results.append((key, score))
+
+    return results
+
+
+# Method to decrypt a preview of Vigenere ciphertext - the encryption tables for the
+#  key are inverted, so this also undoes left shift encryption exactly
+def vigenere_preview(text, key, characters=string.ascii_lowercase, shift_type="right"):
+    """Decrypt text by inverting the Vigenere encryption tables for the key"""
+    tables = [
+        {target: source for source, target in table_items(table)}
+        for table in vigenere_tables(key, characters, False, shift_type)
+    ]
+
+    return translate_with_tables(text, tables, characters, "python")
+
+
+# Length of the n-grams scored by the substitution solver (quadgrams)
+QUADGRAM = 4
+
+# Number of ciphertext characters the substitution solver works on by default
+SUBSTITUTION_SAMPLE = 10000
+
+# Number of restarts of the substitution solver, and how many of them must reach the
+#  same best score before the solver decides it has converged and stops early
+SUBSTITUTION_RESTARTS = 16
+SUBSTITUTION_CONVERGED = 3
+
+# Default time budget (in seconds) for the substitution solver
+SUBSTITUTION_TIME_LIMIT = 60.0
+
+
+# Log probabilities of the n-grams of a character set, used to score how much a
+#  piece of text looks like the corpus the model was built from. N-grams that never
+#  appeared in the corpus score the floor value
+class NgramModel:
+    """Log probabilities of the n-grams of a character set"""
+
+    __slots__ = ("characters", "ngram", "codes", "scores", "floor")
+
+    def __init__(self, characters, ngram, codes, scores, floor):
+        self.characters = characters
+        self.ngram = ngram
+        # with NumPy, codes is a sorted array of n-gram codes and scores holds the
+        #  matching log probabilities - otherwise scores is a dict of code: log probability,
+        #  or both are memoryviews of a model file loaded without NumPy
+        self.codes = codes
+        self.scores = scores
+        self.floor = floor
+
+    def score_codes(self, codes):
+        """Log probability of each n-gram code"""
+        if self.codes is None:
+            return [self.scores.get(code, self.floor) for code in codes]
+
+        if np is None or not isinstance(self.codes, np.ndarray):
+            scores = []
+            for code in codes:
+                where = bisect.bisect_left(self.codes, code)
+                found = where < len(self.codes) and self.codes[where] == code
+                scores.append(self.scores[where] if found else self.floor)
+            return scores
+
+        where = np.searchsorted(self.codes, codes)
+        where[where == len(self.codes)] = 0
+        found = self.codes[where] == codes
+
+        return np.where(found, self.scores[where], self.floor)
+
+
+# Method to build an n-gram model from blocks of a plaintext corpus (str or bytes)
+def ngram_model(blocks, characters=string.ascii_lowercase, ngram=QUADGRAM):
+    """Build an n-gram model of a plaintext corpus"""
+    if isinstance(blocks, (str, bytes, bytearray)):
+        blocks = [blocks]
+
+    size = len(characters)
+    counter = collections.Counter()
+    codes = None
+    counts = None
+
+    for block in blocks:
+        block_codes = ngram_codes(character_indices(block, characters), size, ngram)[1]
+
+        if np is not None and isinstance(block_codes, np.ndarray):
+            # merge the codes of this block into the running counts
+            weights = np.ones(len(block_codes))
+            if codes is not None:
+                block_codes = np.concatenate([codes, block_codes])
+                weights = np.concatenate([counts, weights])
+
+            codes, inverse = np.unique(block_codes, return_inverse=True)
+            counts = np.bincount(inverse.ravel(), weights=weights)
+        else:
+            counter.update(block_codes)
+
+    if codes is not None:
+        total = counts.sum() or 1
+        return NgramModel(
+            characters, ngram, codes, np.log10(counts / total), np.log10(0.01 / total)
+        )
+
+    total = sum(counter.values()) or 1
+    scores = {code: math.log10(count / total) for code, count in counter.items()}
+
+    return NgramModel(characters, ngram, None, scores, math.log10(0.01 / total))
+
+
+# Highest n-gram order counted when a model is trained - 1 to 4-grams are counted
+TRAIN_ORDERS = QUADGRAM
+
+# N-gram orders with at most this many possible codes are counted in one dense array
+#  with np.bincount - longer n-grams of big character sets are counted sparsely
+DENSE_NGRAM_LIMIT = 1 << 22
+
+# Number of distinct sparse n-gram codes gathered from blocks before they are merged
+#  into the counts
+SPARSE_MERGE_SIZE = 1 << 20
+
+# Layout of a trained model file - a header of magic, number of orders and length of
+#  the character set, the character set (UTF-8), then one table per order: its order,
+#  number of entries and floor, followed by the sorted n-gram codes (int64) and their
+#  log probabilities (float32). Every part starts on an 8 byte boundary, so the arrays
+#  are used straight from a memory map of the file
+MODEL_MAGIC = b"CIPHNGM1"
+MODEL_HEADER = struct.Struct("=8sII")
+MODEL_TABLE = struct.Struct("=QQd")
+
+
+# Method to round a length up to the next 8 byte boundary
+def aligned(length):
+    """Round a length up to a multiple of 8"""
+    return -(-length // 8) * 8
+
+
+# Method to merge batches of (codes, counts) of sparse n-grams into the counts
+#  collected so far
+def merge_counts(codes, counts, pending):
+    """Merge batches of n-gram codes and counts into sorted codes and their counts"""
+    if codes is not None:
+        pending = [(codes, counts)] + pending
+
+    codes, inverse = np.unique(
+        np.concatenate([batch for batch, _ in pending]), return_inverse=True
+    )
+    counts = np.bincount(
+        inverse.ravel(), weights=np.concatenate([batch for _, batch in pending])
+    )
+
+    return codes, counts.astype(np.int64)
+
+
+# Method to count the 1-grams up to the orders-grams of blocks of a plaintext corpus,
+#  one block at a time so a corpus of any size can be streamed through. Short n-grams
+#  are counted with np.bincount into dense arrays, long ones are sorted and merged in
+#  batches. The last characters of each block are carried over to the next one, so
+#  the n-grams that span two blocks are counted too. Returns (codes, counts) per order
+def count_ngrams(blocks, characters=string.ascii_lowercase, orders=TRAIN_ORDERS):
+    """Count the n-grams of a plaintext corpus, from 1-grams up to orders-grams"""
+    if isinstance(blocks, (str, bytes, bytearray)):
+        blocks = [blocks]
+
+    size = len(characters)
+    dense = {n: size**n <= DENSE_NGRAM_LIMIT for n in range(1, orders + 1)}
+    counts = {n: None for n in dense}
+    codes = {n: None for n in dense}
+    pending = {n: [] for n in dense}
+    counters = {n: collections.Counter() for n in dense}
+    tail = []
+
+    for block in blocks:
+        indices = character_indices(block, characters)
+        carried = len(tail)
+
+        if np is not None and isinstance(indices, np.ndarray):
+            indices = np.concatenate([np.asarray(tail, dtype=indices.dtype), indices])
+        else:
+            indices = list(tail) + list(indices)
+
+        for n in dense:
+            # the n-grams that end in this block, skipping those counted already
+            block_codes = ngram_codes(indices[max(carried - n + 1, 0) :], size, n)[1]
+
+            if not isinstance(block_codes, list):
+                if dense[n]:
+                    block_counts = np.bincount(block_codes, minlength=size**n)
+                    if counts[n] is None:
+                        counts[n] = block_counts
+                    else:
+                        counts[n] += block_counts
+                else:
+                    pending[n].append(np.unique(block_codes, return_counts=True))
+                    if sum(len(batch) for batch, _ in pending[n]) >= SPARSE_MERGE_SIZE:
+                        codes[n], counts[n] = merge_counts(
+                            codes[n], counts[n], pending[n]
+                        )
+                        pending[n] = []
+            else:
+                counters[n].update(block_codes)
+
+        tail = indices[max(len(indices) - orders + 1, 0) :] if orders > 1 else []
+
+    tables = []
+    for n in dense:
+        if counters[n]:
+            found = sorted(counters[n])
+            tables.append((found, [counters[n][code] for code in found]))
+        elif pending[n]:
+            tables.append(merge_counts(codes[n], counts[n], pending[n]))
+        elif dense[n] and counts[n] is not None:
+            found = np.flatnonzero(counts[n])
+            tables.append((found, counts[n][found]))
+        elif codes[n] is not None:
+            tables.append((codes[n], counts[n]))
+        else:
+            tables.append(([], []))
+
+    return tables
+
+
+# Method to save n-gram counts (from count_ngrams) as a model file of log probabilities,
+#  which load_ngram_model() maps straight into memory
+def save_ngram_model(file_name, tables, characters=string.ascii_lowercase):
+    """Save n-gram counts as a model file of log probabilities"""
+    encoded = characters.encode("utf-8")
+
+    with open(file_name, "wb") as file:
+        file.write(MODEL_HEADER.pack(MODEL_MAGIC, len(tables), len(encoded)))
+        file.write(encoded.ljust(aligned(len(encoded)), b"\0"))
+
+        for order, (codes, counts) in enumerate(tables, 1):
+            total = sum(int(count) for count in counts) or 1
+            floor = math.log10(0.01 / total)
+
+            if np is not None:
+                codes = np.asarray(codes, dtype=np.int64).tobytes()
+                counts = np.asarray(counts, dtype=np.float64)
+                scores = np.log10(counts / total).astype(np.float32).tobytes()
+            else:
+                scores = array.array(
+                    "f", [math.log10(count / total) for count in counts]
+                ).tobytes()
+                codes = array.array("q", codes).tobytes()
+
+            file.write(MODEL_TABLE.pack(order, len(codes) // 8, floor))
+            file.write(codes)
+            file.write(scores.ljust(aligned(len(scores)), b"\0"))
+
+    return file_name
+
+
+# Method to check whether a file is a trained model file rather than plaintext
+def is_ngram_model(file_name):
+    """Check whether a file is a trained n-gram model file"""
+    try:
+        with open(file_name, "rb") as file:
+            return file.read(len(MODEL_MAGIC)) == MODEL_MAGIC
+    except OSError:
+        return False
+
+
+# Method to load one order of a trained model file through a memory map - the arrays
+#  are used where they lie in the file, so even a large model loads in milliseconds
+def load_ngram_model(file_name, characters=string.ascii_lowercase, ngram=QUADGRAM):
+    """Load the n-gram model of one order from a trained model file"""
+    with open(file_name, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, orders, length = MODEL_HEADER.unpack_from(mapped)
+    if magic != MODEL_MAGIC:
+        raise CipherError("{} is not a trained model file".format(file_name))
+
+    position = MODEL_HEADER.size
+    trained = mapped[position : position + length].decode("utf-8")
+    if trained != characters:
+        raise CipherError(
+            "{} was trained on a different character set".format(file_name)
+        )
+    position += aligned(length)
+
+    for _ in range(orders):
+        order, entries, floor = MODEL_TABLE.unpack_from(mapped, position)
+        position += MODEL_TABLE.size
+        scores_at = position + entries * 8
+
+        if order == ngram:
+            if np is not None:
+                codes = np.frombuffer(mapped, np.int64, entries, position)
+                scores = np.frombuffer(mapped, np.float32, entries, scores_at)
+            else:
+                view = memoryview(mapped)
+                codes = view[position:scores_at].cast("q")
+                scores = view[scores_at : scores_at + entries * 4].cast("f")
+
+            return NgramModel(characters, ngram, codes, scores, floor)
+
+        position = scores_at + aligned(entries * 4)
+
+    raise CipherError("{} has no {}-gram table".format(file_name, ngram))
+
+
+# Method to get the n-gram model of a corpus - loaded from a trained model file, or
+#  built from a plaintext file
+def corpus_model(file_name, characters=string.ascii_lowercase, ngram=QUADGRAM):
+    """Load or build the n-gram model of a corpus file"""
+    if is_ngram_model(file_name):
+        return load_ngram_model(file_name, characters, ngram)
+
+    return ngram_model(read_blocks(file_name, characters), characters, ngram)
+
+
+# Method to turn a 1-gram model into the expected frequency of each character
+def model_frequencies(model):
+    """Expected frequency of each character of a 1-gram model"""
+    scores = model.score_codes(list(range(len(model.characters))))
+    frequencies = [10 ** float(score) for score in scores]
+    total = sum(frequencies)
+
+    return [frequency / total for frequency in frequencies]
+
+
+# State shared by every restart of the substitution solver - set once per worker
+#  process by substitution_worker_init()
+SOLVER_STATE = None
+
+
+# Method run when each substitution solver worker process starts
+def substitution_worker_init(state):
+    """Store the state shared by every restart of the substitution solver"""
+    global SOLVER_STATE
+    SOLVER_STATE = state
+
+
+# Method to prepare the state shared by every restart of the substitution solver:
+#  the ciphertext as character indices, where each n-gram starts, which n-grams each
+#  ciphertext letter appears in, and a starting key that matches letter frequencies
+def substitution_solver_state(text, model):
+    """Prepare the state shared by every restart of the substitution solver"""
+    characters = model.characters
+    size = len(characters)
+    indices = character_indices(text, characters)
+    starts = ngram_codes(indices, size, model.ngram)[0]
+
+    if np is not None:
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+        windows = [[] for _ in range(size)]
+        for j in range(model.ngram):
+            letters = indices[starts + j]
+            for letter in np.unique(letters):
+                windows[letter].append(np.nonzero(letters == letter)[0])
+        windows = [
+            np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            for parts in windows
+        ]
+    else:
+        windows = [set() for _ in range(size)]
+        for window, start in enumerate(starts):
+            for j in range(model.ngram):
+                windows[indices[start + j]].add(window)
+        windows = [sorted(letter_windows) for letter_windows in windows]
+
+    # the most common ciphertext letter starts out as the most common English letter...
+    counts = character_counts(text, characters)
+    expected = english_frequencies(characters)
+    by_count = sorted(range(size), key=lambda letter: -counts[letter])
+    by_frequency = sorted(range(size), key=lambda letter: -expected[letter])
+    start_key = [0] * size
+    for cipher_letter, plain_letter in zip(by_count, by_frequency):
+        start_key[cipher_letter] = plain_letter
+
+    return {
+        "model": model,
+        "indices": indices,
+        "starts": starts,
+        "windows": windows,
+        "active": [letter for letter in range(size) if len(windows[letter])],
+        "start_key": start_key,
+    }
+
+
+# Method to calculate the n-gram codes of some windows of the decrypted text
+def window_codes(plain, starts, ngram, size):
+    """N-gram codes of the windows of decrypted text that begin at starts"""
+    if np is not None and isinstance(plain, np.ndarray):
+        codes = np.zeros(len(starts), dtype=np.int64)
+        for j in range(ngram):
+            codes = codes * size + plain[starts + j]
+        return codes
+
+    codes = []
+    for start in starts:
+        code = 0
+        for j in range(ngram):
+            code = code * size + plain[start + j]
+        codes.append(code)
+
+    return codes
+
+
+# Method to run one hill climb of the substitution solver. The key maps each ciphertext
+#  letter to a plaintext letter and the climb keeps swapping pairs of letters while the
+#  text scores better. A swap only changes the n-grams containing the two letters, so
+#  just those are rescored rather than the whole text, until the deadline (a time.time()
+#  value) passes. Returns (score, key)
+def climb_substitution(seed, deadline, state=None):
+    """One hill climb of the substitution solver from a randomised starting key"""
+    state = state or SOLVER_STATE
+    model = state["model"]
+    indices = state["indices"]
+    starts = state["starts"]
+    windows = state["windows"]
+    size = len(model.characters)
+    ngram = model.ngram
+    numpy_state = np is not None and isinstance(indices, np.ndarray)
+
+    # restart 0 climbs from the letter frequency key, the others from a shuffled copy
+    generator = random.Random(seed)
+    key = list(state["start_key"])
+    for _ in range(20 if seed else 0):
+        a, b = generator.randrange(size), generator.randrange(size)
+        key[a], key[b] = key[b], key[a]
+
+    if numpy_state:
+        key = np.array(key, dtype=np.int64)
+        plain = np.where(indices >= 0, key[indices], -1)
+        window_scores = model.score_codes(window_codes(plain, starts, ngram, size))
+        score = float(window_scores.sum())
+    else:
+        plain = [key[i] if i >= 0 else -1 for i in indices]
+        window_scores = model.score_codes(window_codes(plain, starts, ngram, size))
+        score = sum(window_scores)
+
+    improved = True
+    while improved and time.time() < deadline:
+        improved = False
+
+        for x in state["active"]:
+            for y in range(size):
+                if y == x or (y < x and len(windows[y])):
+                    continue
+
+                a, b = key[x], key[y]
+
+                if numpy_state:
+                    affected = np.union1d(windows[x], windows[y])
+                    codes = np.zeros(len(affected), dtype=np.int64)
+                    for j in range(ngram):
+                        letters = plain[starts[affected] + j]
+                        letters = np.where(
+                            letters == a, b, np.where(letters == b, a, letters)
+                        )
+                        codes = codes * size + letters
+                    new_scores = model.score_codes(codes)
+                    delta = float(new_scores.sum() - window_scores[affected].sum())
+                else:
+                    affected = sorted(set(windows[x]).union(windows[y]))
+                    codes = []
+                    for window in affected:
+                        code = 0
+                        for j in range(ngram):
+                            letter = plain[starts[window] + j]
+                            letter = b if letter == a else a if letter == b else letter
+                            code = code * size + letter
+                        codes.append(code)
+                    new_scores = model.score_codes(codes)
+                    delta = sum(new_scores) - sum(window_scores[w] for w in affected)
+
+                if delta <= 0:
+                    continue
+
+                # keep the swap - update the key, the decrypted text and the scores
+                key[x], key[y] = b, a
+                if numpy_state:
+                    plain = np.where(plain == a, b, np.where(plain == b, a, plain))
+                    window_scores[affected] = new_scores
+                else:
+                    plain = [
+                        b if letter == a else a if letter == b else letter
+                        for letter in plain
+                    ]
+                    for window, new_score in zip(affected, new_scores):
+                        window_scores[window] = new_score
+
+                score += delta
+                improved = True
+
+            if time.time() >= deadline:
+                break
+
+    return score, [int(letter) for letter in key]
+
+
+# Method to turn a solver key (ciphertext letter -> plaintext letter) into the cipher
+#  alphabet used by substitution_cipher()
+def key_to_cipher_alphabet(key, characters=string.ascii_lowercase):
+    """Convert a substitution solver key into a cipher alphabet"""
+    alphabet = [""] * len(characters)
+    for cipher_letter, plain_letter in enumerate(key):
+        alphabet[plain_letter] = characters[cipher_letter]
+
+    return "".join(alphabet)
+
+
+# Method to recover the key of a substitution Cipher from ciphertext blocks by hill
+#  climbing against an n-gram model. Restarts run in parallel across worker processes
+#  within a time budget, and stop early once several restarts agree on the best score.
+#  Returns the best few (cipher alphabet, score) pairs
+def crack_substitution(
+    blocks,
+    model,
+    top=5,
+    sample=SUBSTITUTION_SAMPLE,
+    restarts=SUBSTITUTION_RESTARTS,
+    workers=None,
+    time_limit=SUBSTITUTION_TIME_LIMIT,
+):
+    """Recover the most likely substitution Cipher alphabets from ciphertext"""
+    # the deadline is wall clock time, so the climbs in worker processes stop at it too
+    deadline = time.time() + time_limit
+
+    if isinstance(blocks, (str, bytes, bytearray)):
+        blocks = [blocks]
+
+    text = sample_blocks(blocks, sample)
+
+    state = substitution_solver_state(text, model)
+    results = []
+
+    def converged():
+        best = max(score for score, _ in results)
+        agree = sum(1 for score, _ in results if abs(score - best) < 1e-6)
+        return agree >= SUBSTITUTION_CONVERGED
+
+    if workers == 1:
+        for seed in range(restarts):
+            if time.time() >= deadline:
+                break
+            results.append(climb_substitution(seed, deadline, state))
+            if converged():
+                break
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=substitution_worker_init,
+            initargs=(state,),
+        )
+        try:
+            pending = {
+                pool.submit(climb_substitution, seed, deadline)
+                for seed in range(restarts)
+            }
+            while pending:
+                remaining = max(deadline - time.time(), 0)
+                done, pending = wait(pending, remaining, FIRST_COMPLETED)
+                results.extend(future.result() for future in done)
+                if results and converged():
+                    break
+
+                if time.time() >= deadline:
+                    # the restarts that haven't started are dropped, and the climbs
+                    #  still running stop at the deadline, so their keys are only a
+                    #  moment away
+                    for future in pending:
+                        future.cancel()
+                    results.extend(
+                        future.result()
+                        for future in wait(pending)[0]
+                        if not future.cancelled()
+                    )
+                    break
+        finally:
+            # a climb still running stops at the deadline, so this waits no longer
+            pool.shutdown(cancel_futures=True)
+
+    results.sort(key=lambda result: -result[0])
+
+    cracked = []
+    for score, key in results:
+        alphabet = key_to_cipher_alphabet(key, model.characters)
+        if alphabet not in [found for found, _ in cracked]:
+            cracked.append((alphabet, score))
+
+    return cracked[:top]
+
+
+# Method to display the results of cracking a cipher, with a preview of the text
+#  decrypted with each key
+def print_cracked_keys(results, preview_text, preview):
+    """Display the most likely keys along with a preview of the decrypted text"""
+    print("\nMost likely keys (best first):\n")
+
+    for key, score in results:
+        print("\tKey: {!r:<12} Score: {:>14.2f}".format(key, score))
+        print("\t\t{}".format(preview(preview_text, key)[:70]))
+
+
+# Number of ciphertext characters the candidate keys of a dictionary attack are scored on
+DICTIONARY_SAMPLE = 1 << 16
+
+# Number of words sent to a worker process at a time
+DICTIONARY_CHUNK = 1 << 15
+
+# Number of candidates with the best cheap (1-gram) score that are decrypted and
+#  scored again with the n-gram model
+DICTIONARY_RESCORE = 100
+
+# Seconds between the progress reports, and between the saves of the checkpoint
+DICTIONARY_PROGRESS_INTERVAL = 1.0
+DICTIONARY_CHECKPOINT_INTERVAL = 10.0
+
+# State shared by every chunk of words of a dictionary attack - set once per worker
+#  process by dictionary_worker_init()
+DICTIONARY_STATE = None
+
+
+# Method run when each dictionary attack worker process starts
+def dictionary_worker_init(state):
+    """Store the state shared by every chunk of words of a dictionary attack"""
+    global DICTIONARY_STATE
+    DICTIONARY_STATE = state
+
+
+# Method to prepare the state shared by every chunk of words: the ciphertext sample as
+#  character indices with the key position of each, plus the expected frequencies. The
+#  score tables for each key length are added to it as they are needed
+def dictionary_state(
+    text, characters, shift_type="right", per_line=True, expected=None
+):
+    """Prepare the state shared by every chunk of words of a dictionary attack"""
+    indices = character_indices(text, characters)
+    positions = key_positions(text, 0, per_line)[0]
+
+    if np is not None and isinstance(indices, np.ndarray):
+        positions = np.asarray(positions, dtype=np.int64)
+        valid = indices >= 0
+        indices = indices[valid].astype(np.int64)
+        positions = positions[valid]
+    else:
+        pairs = [(p, i) for p, i in zip(positions, indices) if i >= 0]
+        positions = [p for p, _ in pairs]
+        indices = [i for _, i in pairs]
+
+    return {
+        "characters": characters,
+        "shift_type": shift_type,
+        "indices": indices,
+        "positions": positions,
+        "expected": expected or english_frequencies(characters),
+        "tables": {},
+    }
+
+
+# Method to build the score table of a key length - the cost (negative log likelihood
+#  under the expected frequencies) of every column of the sample decrypted with every
+#  shift, so the cheap score of any key of that length is the sum of one table entry
+#  per key letter. Unlike a chi-squared test the cost of a rare character stays bounded,
+#  so text that isn't plain prose still scores its real key best
+def shift_score_table(state, length):
+    """Cost of every (column, shift) of the sample for one key length"""
+    size = len(state["characters"])
+    indices = state["indices"]
+    positions = state["positions"]
+    costs = [-math.log(max(frequency, 1e-12)) for frequency in state["expected"]]
+
+    if np is not None and isinstance(indices, np.ndarray):
+        codes = (positions % length) * size + indices
+        counts = np.bincount(codes, minlength=length * size).reshape(length, size)
+        # rotated[s, i] - the ciphertext character that plaintext character i becomes
+        rotated = (np.arange(size)[None, :] + np.arange(size)[:, None]) % size
+
+        return np.stack([counts[column][rotated] @ costs for column in range(length)])
+
+    counts = [[0] * size for _ in range(length)]
+    for position, index in zip(positions, indices):
+        counts[position % length][index] += 1
+
+    return [
+        [
+            sum(column[(i + shift) % size] * costs[i] for i in range(size))
+            for shift in range(size)
+        ]
+        for column in counts
+    ]
+
+
+# Method to give every word of a chunk of a wordlist its cheap score, returning how many
+#  words were tried and the best few (score, word) pairs. Words with characters outside
+#  the character set can't be keys and are skipped
+def score_words(lines, keep=DICTIONARY_RESCORE, state=None):
+    """Score a chunk of wordlist lines as Vigenere keys"""
+    state = state or DICTIONARY_STATE
+    characters = state["characters"]
+    size = len(characters)
+    index = character_index(characters)
+
+    by_length = collections.defaultdict(list)
+    for line in lines:
+        word = line.rstrip(b"\r\n").decode("utf-8", "replace")
+        try:
+            by_length[len(word)].append((word, [index[letter] for letter in word]))
+        except KeyError:
+            continue
+
+    best = []
+    for length, candidates in by_length.items():
+        if not length:
+            continue
+
+        table = state["tables"].get(length)
+        if table is None:
+            table = state["tables"][length] = shift_score_table(state, length)
+
+        words = [word for word, _ in candidates]
+        if np is not None:
+            table = np.asarray(table)
+            shifts = np.array([letters for _, letters in candidates], dtype=np.int64)
+            if state["shift_type"] == "left":
+                shifts = (length - shifts) % size
+            scores = table[np.arange(length), shifts].sum(axis=1)
+
+            if len(scores) > keep:
+                chosen = np.argpartition(scores, keep)[:keep]
+                words = [words[i] for i in chosen]
+                scores = scores[chosen]
+            best.extend(zip(scores.tolist(), words))
+        else:
+            for word, (_, letters) in zip(words, candidates):
+                if state["shift_type"] == "left":
+                    letters = [(length - letter) % size for letter in letters]
+                score = sum(table[column][s] for column, s in enumerate(letters))
+                best.append((score, word))
+
+    return len(lines), heapq.nsmallest(keep, best)
+
+
+# Method to read a wordlist in chunks of lines from a byte offset, yielding each chunk
+#  along with the offset just after it - which is where a resumed attack carries on
+def wordlist_chunks(file_name, offset=0, size=DICTIONARY_CHUNK):
+    """Read a wordlist in chunks of lines, with the offset after each chunk"""
+    with open_file(file_name, "rb") as file:
+        file.seek(offset)
+
+        while True:
+            lines = list(itertools.islice(file, size))
+            if not lines:
+                break
+
+            offset += sum(len(line) for line in lines)
+            yield lines, offset
+
+
+# Method to fingerprint an attack, so a checkpoint is only resumed by the same attack
+def attack_fingerprint(wordlist, text, characters, shift_type, per_line):
+    """Fingerprint of a dictionary attack"""
+    digest = hashlib.sha256()
+    for part in (os.path.abspath(wordlist), characters, shift_type, str(per_line)):
+        digest.update(part.encode("utf-8", "surrogateescape") + b"\0")
+    digest.update(text if isinstance(text, bytes) else text.encode("utf-8", "replace"))
+
+    return digest.hexdigest()
+
+
+# Method to load the checkpoint of a dictionary attack - None when there is none, or it
+#  belongs to a different attack
+def load_checkpoint(file_name, fingerprint):
+    """Load the checkpoint of a dictionary attack"""
+    try:
+        with open(file_name, "r") as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return None
+
+    if checkpoint.get("fingerprint") != fingerprint:
+        raise CipherError(
+            "{} is the checkpoint of a different attack - remove it to start again".format(
+                file_name
+            )
+        )
+
+    checkpoint["best"] = [tuple(item) for item in checkpoint["best"]]
+
+    return checkpoint
+
+
+# Method to save the checkpoint of a dictionary attack through a temporary file, so an
+#  interrupted save never leaves a broken checkpoint behind
+def save_checkpoint(file_name, checkpoint):
+    """Save the checkpoint of a dictionary attack"""
+    temp_name = file_name + ".tmp"
+
+    with open(temp_name, "w") as file:
+        json.dump(checkpoint, file)
+
+    os.replace(temp_name, file_name)
+
+
+# Method to run a dictionary attack on a Vigenere Cipher - every word of the wordlist is
+#  tried as the key. Chunks of words are scored on a pool of worker processes with the
+#  cheap 1-gram tables, keeping only the best DICTIONARY_RESCORE candidates, which
+#  are then decrypted and scored with the n-gram model (when one is provided). Progress
+#  is reported in candidates per second, and with a checkpoint file the attack can be
+#  interrupted and carries on where it stopped when run again
+def dictionary_attack(
+    wordlist,
+    blocks,
+    characters=string.ascii_lowercase,
+    shift_type="right",
+    per_line=True,
+    top=5,
+    workers=None,
+    model=None,
+    expected=None,
+    checkpoint_file=None,
+    sample=DICTIONARY_SAMPLE,
+    progress=sys.stderr,
+):
+    """Recover a Vigenere key by trying every word of a wordlist"""
+    if isinstance(blocks, (str, bytes, bytearray)):
+        blocks = [blocks]
+
+    text = sample_blocks(blocks, sample)
+
+    state = dictionary_state(text, characters, shift_type, per_line, expected)
+    fingerprint = attack_fingerprint(wordlist, text, characters, shift_type, per_line)
+
+    checkpoint = {"fingerprint": fingerprint, "offset": 0, "tested": 0, "best": []}
+    if checkpoint_file:
+        checkpoint = load_checkpoint(checkpoint_file, fingerprint) or checkpoint
+
+    workers = workers or os.cpu_count() or 1
+    chunks = wordlist_chunks(wordlist, checkpoint["offset"])
+    started = time.monotonic()
+    resumed = checkpoint["tested"]
+    reported = saved = started
+
+    def merge(result, offset):
+        nonlocal reported, saved
+        tested, best = result
+        checkpoint["tested"] += tested
+        checkpoint["offset"] = offset
+        # a word listed twice scores the same both times, so the set drops repeats
+        checkpoint["best"] = heapq.nsmallest(
+            DICTIONARY_RESCORE, set(checkpoint["best"] + best)
+        )
+
+        now = time.monotonic()
+        if progress and now - reported >= DICTIONARY_PROGRESS_INTERVAL:
+            rate = (checkpoint["tested"] - resumed) / (now - started)
+            progress.write(
+                "\r{:,} candidates tried, {:,.0f} candidates/s ".format(
+                    checkpoint["tested"], rate
+                )
+            )
+            progress.flush()
+            reported = now
+        if checkpoint_file and now - saved >= DICTIONARY_CHECKPOINT_INTERVAL:
+            save_checkpoint(checkpoint_file, checkpoint)
+            saved = now
+
+    try:
+        if workers == 1:
+            for lines, offset in chunks:
+                merge(score_words(lines, state=state), offset)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=dictionary_worker_init,
+                initargs=(state,),
+            ) as pool:
+                pending = collections.deque()
+                for lines, offset in itertools.chain(chunks, [(None, None)]):
+                    if lines is not None:
+                        pending.append((pool.submit(score_words, lines), offset))
+
+                    # chunks are merged in order, so the offset is always safe to resume
+                    while pending and (lines is None or len(pending) >= workers * 2):
+                        future, done = pending.popleft()
+                        merge(future.result(), done)
+    finally:
+        if checkpoint_file:
+            save_checkpoint(checkpoint_file, checkpoint)
+
+    if progress:
+        elapsed = max(time.monotonic() - started, 1e-9)
+        progress.write(
+            "\r{:,} candidates tried, {:,.0f} candidates/s \n".format(
+                checkpoint["tested"], (checkpoint["tested"] - resumed) / elapsed
+            )
+        )
+
+    if model is None:
+        return [(word, score) for score, word in checkpoint["best"][:top]]
+
+    # decrypt the sample with each promising candidate and score it with the model -
+    #  the log probability of the decrypted text, so the highest score is best. The
+    #  encryption tables are inverted, as vigenere_preview() does, since the Vigenere
+    #  decryption tables don't undo left shift encryption
+    results = []
+    for _, word in checkpoint["best"]:
+        tables = vigenere_tables(word, characters, False, shift_type)
+        cipher = Cipher(characters, tables, inverse_tables(tables, characters))
+        plain = translate_piece(cipher, text, True, 0, per_line)[0]
+        indices = character_indices(plain, characters)
+        codes = ngram_codes(indices, len(characters), model.ngram)[1]
+        results.append((word, float(sum(model.score_codes(codes)))))
+
+    results.sort(key=lambda result: -result[1])
+
+    return results[:top]
+
+
+# Number of key positions kept while the period of a Vigenere key is still unknown -
+#  keys up to half this long are found. Later positions are folded onto the period
+RECOVER_WINDOW = 1 << 16
+
+# Shown in place of the key letters the plaintext gave no evidence for
+RECOVER_UNKNOWN = "\ufffd"
+
+
+# Method to calculate the prefix function of a sequence (as used by the Knuth Morris
+#  Pratt search) - item i is the length of the longest proper prefix of sequence[:i+1]
+#  that is also a suffix of it
+def prefix_function(sequence):
+    """KMP prefix function of a sequence"""
+    prefix = [0] * len(sequence)
+
+    for i in range(1, len(sequence)):
+        k = prefix[i - 1]
+        while k and sequence[i] != sequence[k]:
+            k = prefix[k - 1]
+        if sequence[i] == sequence[k]:
+            k += 1
+        prefix[i] = k
+
+    return prefix
+
+
+# Method to find the shortest period of a sequence in O(n) with the prefix function -
+#  the sequence repeats every len(sequence) - prefix[-1] items
+def minimal_period(sequence):
+    """Shortest period of a sequence"""
+    if not sequence:
+        return 0
+
+    return len(sequence) - prefix_function(sequence)[-1]
+
+
+# Method to check that a sequence with gaps (None, or -1 in a NumPy array) repeats
+#  every period items
+def has_period(sequence, period):
+    """Check whether the known items of a sequence repeat every period items"""
+    if np is not None and isinstance(sequence, np.ndarray):
+        a, b = sequence[:-period], sequence[period:]
+        return bool(np.all((a < 0) | (b < 0) | (a == b)))
+
+    return all(
+        a is None or b is None or a == b
+        for a, b in zip(sequence, itertools.islice(sequence, period, None))
+    )
+
+
+# Method to find the period of a Vigenere key stream with gaps (None) where the
+#  plaintext held characters outside the character set. The longest run without gaps
+#  gives the period in linear time through the prefix function, which is then checked
+#  against the rest of the stream - only if that fails are the periods tried in turn
+def key_stream_period(stream):
+    """Period of a key stream that may have gaps"""
+    best_start, best_length, start = 0, 0, 0
+    for i, shift in enumerate(stream + [None]):
+        if shift is None:
+            if i - start > best_length:
+                best_start, best_length = start, i - start
+            start = i + 1
+
+    run = stream[best_start : best_start + best_length]
+    if np is not None:
+        stream = np.array([-1 if shift is None else shift for shift in stream])
+
+    period = minimal_period(run)
+    if period and period * 2 <= len(run) and has_period(stream, period):
+        return period
+
+    for period in range(1, len(stream) // 2 + 1):
+        if has_period(stream, period):
+            return period
+
+    # the stream never repeats, so the key is at least as long as the stream
+    return len(stream)
+
+
+# Method to work out the key position of every character of a block - the position in
+#  the file (starting from start), or with per_line the position in the line, as the
+#  key restarts on every line of a file translated line by line. Returns the positions
+#  and the key position of the character after the block
+def key_positions(text, start=0, per_line=True):
+    """Key position of every character of a block of text (str or bytes)"""
+    if not per_line:
+        if np is not None:
+            return np.arange(start, start + len(text)), start + len(text)
+        return range(start, start + len(text)), start + len(text)
+
+    if np is not None and isinstance(text, (bytes, bytearray)):
+        data = np.frombuffer(text, dtype=np.uint8)
+        order = np.arange(len(data))
+        # the start of the line of each character is just after the newline before it
+        starts = np.zeros(len(data), dtype=np.int64)
+        starts[1:] = np.maximum.accumulate(np.where(data == 10, order + 1, 0))[:-1]
+        positions = order - starts
+        positions[starts == 0] += start
+
+        following = 0 if text.endswith(b"\n") else int(positions[-1]) + 1
+        return positions, following if len(data) else start
 
+    newline = b"\n"[0] if isinstance(text, (bytes, bytearray)) else "\n"
+    positions = []
+    for character in text:
+        positions.append(start)
+        start = 0 if character == newline else start + 1
 
-# Method to Encrypt and/or Decrypt a File filled with text via a simple substitution (Caesar) Cipher
-def file_cipher(
-    file_name,
-    output_file_name,
-    key,
+    return positions, start
+
+
+# Method to tally how often each (key, value) pair appears in two aligned sequences,
+#  skipping pairs where either value is negative (outside the character set)
+def pair_tallies(keys, values, valid, size):
+    """Count the (key, value) pairs of two aligned sequences"""
+    if np is not None and isinstance(valid, np.ndarray):
+        codes = np.asarray(keys, dtype=np.int64)[valid] * size + values[valid]
+        if not len(codes):
+            return []
+        counts = np.bincount(codes)
+        found = np.flatnonzero(counts)
+        return zip(
+            (found // size).tolist(), (found % size).tolist(), counts[found].tolist()
+        )
+
+    tallies = collections.Counter(
+        (key, value) for key, value, ok in zip(keys, values, valid) if ok
+    )
+    return [(key, value, count) for (key, value), count in tallies.items()]
+
+
+# Method to recover the key of a cipher from aligned blocks of plaintext and ciphertext
+#  in a single streamed pass. Each character pair gives a vote for part of the key - the
+#  shift at its key position (Caesar, Vigenere) or the cipher letter of its plaintext
+#  letter (Substitution). The Vigenere key positions are kept until the period is found
+#  with the prefix function, then folded onto it, so memory stays bounded. Pairs that
+#  disagree with the winning vote are reported as conflicts
+def recover_key(
+    pairs,
     characters=string.ascii_lowercase,
-    decrypt=False,
-    shift_type="right",
     enc_type="Caesar",
+    shift_type="right",
+    per_line=True,
 ):
-    """Encrypt and/or Decrypt a File filled with text via a simple substitution (Caesar) Cipher"""
-    with open(file_name, "r") as f_in:
+    """Recover the key of a cipher from aligned plaintext and ciphertext"""
+    if enc_type not in ("Caesar", "Vigenere", "Substitution"):
+        raise CipherError("Key recovery is not supported for {}".format(enc_type))
+
+    size = len(characters)
+    votes = collections.defaultdict(collections.Counter)
+    period = None
+    position = 0
+    span = 0
+    total = 0
 
-        with open(output_file_name, "w") as f_out:
+    for plain, cipher in pairs:
+        if len(plain) != len(cipher):
+            raise CipherError("The plaintext and ciphertext have different lengths")
 
-            # iterate over each line in input file
-            for line in f_in:
+        plain_indices = character_indices(plain, characters)
+        cipher_indices = character_indices(cipher, characters)
 
-                # encrypt/decrypt the line
-                if enc_type == "Caesar":
-                    line_new = caesar_cipher(line, key, characters, decrypt, shift_type)
-                elif enc_type == "Vigenere":
-                    line_new = vigenere_cipher(
-                        line, key, characters, decrypt, shift_type
-                    )
-                elif enc_type == "Substitution":
-                    line_new = substitution_cipher(line, key, characters, decrypt)
+        if np is not None and isinstance(plain_indices, np.ndarray):
+            plain_indices = plain_indices.astype(np.int64)
+            cipher_indices = np.asarray(cipher_indices, dtype=np.int64)
+            valid = (plain_indices >= 0) & (cipher_indices >= 0)
+            shifts = (cipher_indices - plain_indices) % size
+        else:
+            valid = [p >= 0 and c >= 0 for p, c in zip(plain_indices, cipher_indices)]
+            shifts = [(c - p) % size for p, c in zip(plain_indices, cipher_indices)]
+
+        if enc_type == "Substitution":
+            keys, values = plain_indices, cipher_indices
+        elif enc_type == "Caesar":
+            keys, values = [0] * len(plain), shifts
+        else:
+            keys, position = key_positions(plain, position, per_line)
+            values = shifts
+            if np is not None:
+                keys = np.asarray(keys, dtype=np.int64)
+            if len(keys):
+                span = max(span, int(keys.max() if np is not None else max(keys)) + 1)
 
-                # write the new line to output file
-                f_out.write(line_new)
+            # fold the key positions onto the period once they outgrow the window - the
+            #  pairs of this block still inside the window vote first, so a block longer
+            #  than the window has its key stream looked at too
+            if period is None and span > RECOVER_WINDOW:
+                if np is not None:
+                    inside = valid & (keys < RECOVER_WINDOW)
+                    valid = valid & ~inside
+                else:
+                    inside = [ok and k < RECOVER_WINDOW for k, ok in zip(keys, valid)]
+                    valid = [ok and k >= RECOVER_WINDOW for k, ok in zip(keys, valid)]
+                for key, value, count in pair_tallies(keys, values, inside, size):
+                    votes[key][value] += count
+                    total += count
 
-    print(
-        "The file {} has been translated successfully and saved to {}".format(
-            file_name, output_file_name
+                period = key_stream_period(vote_winners(votes, RECOVER_WINDOW))
+                folded = collections.defaultdict(collections.Counter)
+                for key, counter in votes.items():
+                    folded[key % period].update(counter)
+                votes = folded
+
+            if period is not None:
+                keys = keys % period if np is not None else [k % period for k in keys]
+
+        for key, value, count in pair_tallies(keys, values, valid, size):
+            votes[key][value] += count
+            total += count
+
+    winners = vote_winners(votes, max(votes, default=-1) + 1)
+    conflicts = total - sum(max(counter.values()) for counter in votes.values())
+    result = {"type": enc_type, "characters": total, "conflicts": conflicts}
+
+    if enc_type == "Substitution":
+        # a single missing letter can only have the cipher letter nobody else uses
+        alphabet = winners + [None] * (size - len(winners))
+        missing = [i for i, letter in enumerate(alphabet) if letter is None]
+        unused = sorted(set(range(size)) - set(alphabet))
+        if len(missing) == 1 and len(unused) == 1:
+            alphabet[missing[0]] = unused[0]
+            missing = []
+
+        result["missing"] = "".join(characters[i] for i in missing)
+        result["key"] = "".join(
+            RECOVER_UNKNOWN if i is None else characters[i] for i in alphabet
         )
-    )
+        result["complete"] = not missing
 
+    elif enc_type == "Caesar":
+        result["key"] = None
+        if winners:
+            result["key"] = shift_to_caesar_key(winners[0], size, shift_type)
+        result["complete"] = bool(winners)
 
-# Method to read input from a specified file
-def input_from_file(file_name):
-    """reads input from a specified file"""
-    with open(file_name, "r") as file:
-        text = file.read().replace("\n", "")
+    else:
+        if period is None:
+            period = key_stream_period(winners)
+        stream = winners[:period]
+        # a short stream may miss some positions that later (folded) data covers
+        stream += [None] * (period - len(stream))
+        result["period"] = period
+        result["key"] = "".join(
+            (
+                RECOVER_UNKNOWN
+                if shift is None
+                else shift_to_vigenere_letter(shift, period, characters, shift_type)
+            )
+            for shift in stream
+        )
+        # without a repeat the key may be longer than the evidence
+        result["complete"] = None not in stream and period * 2 <= span
 
-    print("\nYour text has been retreived from: {}".format(file_name))
+    return result
 
-    return text
 
+# Method to pick the winning vote at each key position, None where there was no vote
+def vote_winners(votes, length):
+    """Most common value at each key position (None where unknown)"""
+    return [
+        votes[key].most_common(1)[0][0] if votes.get(key) else None
+        for key in range(length)
+    ]
 
-# Method to save output to a specified file
-def output_to_file(file_name, text):
-    """write output to a specified file"""
-    with open(file_name, "w") as file:
-        # write the new line to output file
-        file.write(text)
 
-    print("\nThe results have been saved to: {}".format(file_name))
+# Method to read aligned blocks of a plaintext file and a ciphertext file
+def aligned_blocks(plain_file, cipher_file, characters=string.ascii_lowercase):
+    """Read a plaintext file and a ciphertext file in aligned blocks"""
+    for plain, cipher in itertools.zip_longest(
+        read_blocks(plain_file, characters),
+        read_blocks(cipher_file, characters),
+        fillvalue=b"" if characters.isascii() else "",
+    ):
+        yield plain, cipher
 
 
-# Method to get KEY number from user and check to make sure it is valid
-def get_key(key_type):
-    """get KEY number from user and check to make sure it is valid"""
-    if key_type == "Caesar":
-        while True:
-            num = input("\nPlease enter an integer for Cipher to utilize as a key : ")
-            try:
-                key = int(num)
-                print("\nThank You!")
-                break
-            except ValueError:
-                print("\nERROR - Input", num, " is invalid!\n")
-                print("Please enter a valid integer!")
+# Method to display a recovered key
+def print_recovered_key(result):
+    """Display a key recovered from plaintext and ciphertext"""
+    print("\nRecovered {} key:\n".format(result["type"]))
+    print("\tKey: {!r}".format(result["key"]))
 
-    elif key_type == "Vigenere":
-        key = input(
-            "\nPlease enter word or phrase for the Cipher to utilize as a key : "
+    if "period" in result:
+        print("\tKey length: {}".format(result["period"]))
+    if result.get("missing"):
+        print(
+            "\tUnknown plaintext characters ({}): {!r}".format(
+                len(result["missing"]), result["missing"]
+            )
+        )
+    if not result["complete"]:
+        print(
+            "\tThe key is incomplete - {!r} marks parts with no evidence".format(
+                RECOVER_UNKNOWN
+            )
         )
 
-    return key
-
+    print(
+        "\n\t{:,} character pairs, {:,} in conflict with the key".format(
+            result["characters"], result["conflicts"]
+        )
+    )
 
 
 ###############################################################
@@ -372,7 +5624,7 @@ def main():
         "-i",
         "--inputfile",
         dest="inputfile",
-        help="Load text from the provided file name.",
+        help='Load text from the provided file name, or "-" to stream stdin to stdout.',
     )
     parser.add_argument(
         "-o",
@@ -385,16 +5637,291 @@ def main():
         "--shift",
         dest="shift",
         choices=["left", "right"],
-        default="right",
         help="Choose between 'right' or 'left' direction for key shift. Default = \"right\" ",
     )
     parser.add_argument(
         "-T",
         "--type",
         dest="type",
-        choices=["Caesar", "Substitution", "Vigenere"],
-        default="Caesar",
-        help='Choose between encryption methods. Default = "Caesar" ',
+        type=cipher_type,
+        metavar="TYPE",
+        help="Choose between encryption methods - Caesar, Substitution, Vigenere, "
+        "Columnar or RailFence - or chain them into a pipeline of Type:key stages such as "
+        "Caesar:3,Substitution:@alpha.txt,Vigenere:@key.txt (@ reads a key from a "
+        'file). Default = "Caesar" ',
+    )
+    parser.add_argument(
+        "--key",
+        dest="key",
+        help="Key for the cipher - an integer for Caesar, a word or phrase for Vigenere "
+        "or Columnar, the number of rails for RailFence or a cipher alphabet for "
+        "Substitution.",
+    )
+    parser.add_argument(
+        "--key-file",
+        dest="key_file",
+        help="Load the key for the cipher from the provided file name.",
+    )
+    parser.add_argument(
+        "--alphabet-file",
+        dest="alphabet_file",
+        help="Load the Substitution cipher alphabet from the provided file name.",
+    )
+    parser.add_argument(
+        "--keystore",
+        dest="keystore",
+        metavar="FILE",
+        help="Key store file for --key-id and --generate-keys, and for the key_id of "
+        "jobs and the X-Cipher-Key-Id header of service requests.",
+    )
+    parser.add_argument(
+        "--key-id",
+        dest="key_id",
+        type=int,
+        metavar="ID",
+        help="Use key ID of the --keystore, whose cipher type replaces -T.",
+    )
+    parser.add_argument(
+        "--generate-keys",
+        dest="generate_keys",
+        type=int,
+        metavar="COUNT",
+        help="Generate COUNT random -T Substitution or Vigenere keys with the secrets "
+        "module and add them to the --keystore.",
+    )
+    parser.add_argument(
+        "--key-length",
+        dest="key_length",
+        type=int,
+        default=KEY_LENGTH,
+        help="Length of the Vigenere keys made by --generate-keys. "
+        "Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--charset-file",
+        dest="charset_file",
+        help="Load the character set from the provided file name (UTF-8) instead of "
+        "the 95 character default - any alphabet of distinct characters can be used.",
+    )
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        help="Stream files in fixed size blocks instead of lines, "
+        "keeping the Vigenere key position across lines.",
+    )
+    parser.add_argument(
+        "--block-size",
+        dest="block_size",
+        type=int,
+        default=FILE_BLOCK_SIZE,
+        help="Number of characters read per block when streaming. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        help="Translate files in byte ranges across this many worker processes.",
+    )
+    parser.add_argument(
+        "--in-place",
+        dest="in_place",
+        action="store_true",
+        help="Translate the input file in place via a memory map instead of a new file.",
+    )
+    parser.add_argument(
+        "--fsync",
+        dest="fsync",
+        action="store_true",
+        help="Flush in place results to disk before finishing.",
+    )
+    parser.add_argument(
+        "--atomic",
+        dest="atomic",
+        action="store_true",
+        help="Translate in place via a temporary copy that replaces the original file.",
+    )
+    parser.add_argument(
+        "--range",
+        dest="range",
+        type=parse_range,
+        metavar="START:END",
+        help="Only translate the bytes from START to END of the input file, seeking "
+        "straight to START. Use --stream for files translated as one stream.",
+    )
+    parser.add_argument(
+        "--lines",
+        dest="lines",
+        type=parse_range,
+        metavar="START:END",
+        help="Only translate lines START to END (counted from 0) of the input file, "
+        "found through its .idx line index.",
+    )
+    parser.add_argument(
+        "--index",
+        dest="index",
+        action="store_true",
+        help="Build the .idx line index of the input file used by --range and --lines.",
+    )
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        help="Translate a directory tree (into the -o directory) or a manifest of "
+        "input<TAB>output file pairs.",
+    )
+    parser.add_argument(
+        "--processes",
+        dest="processes",
+        action="store_true",
+        help="Use worker processes rather than threads for --batch.",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        dest="skip_unchanged",
+        action="store_true",
+        help="Skip --batch files whose output is newer and the same size.",
+    )
+    parser.add_argument(
+        "--crack",
+        dest="crack",
+        action="store_true",
+        help="Recover the most likely keys for the ciphertext instead of decrypting it.",
+    )
+    parser.add_argument(
+        "--recover-key",
+        dest="recover_key",
+        metavar="PLAINFILE",
+        help="Recover the key from this plaintext and its ciphertext (-i), saving it to "
+        "-o when complete. Use --stream for files translated as one stream.",
+    )
+    parser.add_argument(
+        "--sample",
+        dest="sample",
+        type=int,
+        help="Only analyse the first SAMPLE characters of the input when cracking.",
+    )
+    parser.add_argument(
+        "--top",
+        dest="top",
+        type=int,
+        default=5,
+        help="Number of candidate keys to report when cracking. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--wordlist",
+        dest="wordlist",
+        help="Crack a Vigenere key by trying every word of this file as the key, "
+        "scored across --workers processes.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint",
+        metavar="FILE",
+        help="Save the progress of a --wordlist attack to FILE, and carry on from it "
+        "when the attack is run again.",
+    )
+    parser.add_argument(
+        "--max-key-length",
+        dest="max_key_length",
+        type=int,
+        default=VIGENERE_MAX_KEY_LENGTH,
+        help="Longest Vigenere key considered when cracking. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--corpus",
+        dest="corpus",
+        help="Plaintext file, or model file saved by --train, giving the language "
+        "statistics used when cracking - required for Substitution.",
+    )
+    parser.add_argument(
+        "--train",
+        dest="train",
+        metavar="CORPUS",
+        help="Count the 1 to 4-grams of a plaintext corpus and save them as a model "
+        "file (-o) for --corpus.",
+    )
+    parser.add_argument(
+        "--restarts",
+        dest="restarts",
+        type=int,
+        default=SUBSTITUTION_RESTARTS,
+        help="Number of hill climbs when cracking Substitution. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--time-limit",
+        dest="time_limit",
+        type=float,
+        default=SUBSTITUTION_TIME_LIMIT,
+        help="Seconds allowed for cracking Substitution. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--jobs",
+        dest="jobs",
+        metavar="PATH",
+        help='Run the JSON jobs in this file (or "-" for stdin), one per line, '
+        "writing a JSON result per line.",
+    )
+    parser.add_argument(
+        "--serve",
+        dest="serve",
+        metavar="[HOST:]PORT",
+        help="Run as an HTTP service on this address (localhost unless a HOST is given).",
+    )
+    parser.add_argument(
+        "--serve-timeout",
+        dest="serve_timeout",
+        type=float,
+        default=SERVE_TIMEOUT,
+        help="Seconds --serve waits for a client to send more of a request before "
+        "closing its connection. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--loadgen",
+        dest="loadgen",
+        metavar="[HOST:]PORT",
+        help="Measure the requests per second and latency of a running service.",
+    )
+    parser.add_argument(
+        "--requests",
+        dest="requests",
+        type=int,
+        default=1000,
+        help="Number of requests sent by --loadgen. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--concurrency",
+        dest="concurrency",
+        type=int,
+        default=16,
+        help="Number of connections used by --loadgen. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--payload-size",
+        dest="payload_size",
+        type=int,
+        default=1024,
+        help="Bytes in each --loadgen request body. Default = %(default)s ",
+    )
+    parser.add_argument(
+        "--stats",
+        dest="stats",
+        nargs="?",
+        const="text",
+        choices=["text", "json"],
+        help="Report the time, CPU, bytes and memory of each phase on stderr as "
+        'text or json. Default = "text" ',
+    )
+    parser.add_argument(
+        "--stats-profile",
+        dest="stats_profile",
+        help="With --stats, save a cProfile profile of the transform to this file name.",
+    )
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        choices=BACKENDS,
+        default="auto",
+        help='Choose how text is translated, "numpy" requires NumPy. Default = "auto" ',
     )
 
     ####
@@ -402,10 +5929,36 @@ def main():
     # Initialize command line arguments
     args = parser.parse_args()
 
+    # text loaded from files may hold bytes that aren't valid UTF-8 - show them escaped
+    #  rather than failing when the text is printed
+    sys.stdout.reconfigure(errors="backslashreplace")
+
+    # collect statistics about the run, reported on stderr when the program exits
+    if args.stats:
+        enable_stats(profile=args.stats_profile is not None)
+        atexit.register(finish_stats, args.stats, args.stats_profile)
+
+    # -S and -T are left as None when they aren't given, so the load generator can tell
+    #  which options to send to the service
     # assign SHIFT direction choice using either default value or user preferred option
-    SHIFT = args.shift
+    SHIFT = args.shift or "right"
     # assign encryption method choice using either default value or user preferred option
-    TYPE = args.type
+    TYPE = args.type or "Caesar"
+    TYPE = "Pipeline" if is_pipeline(TYPE) else TYPE
+    # assign translation backend using either default value or user preferred option
+    BACKEND = args.backend
+    # assign block size when files are streamed in blocks rather than lines
+    BLOCK_SIZE = args.block_size if args.stream else None
+    # assign number of worker processes used to translate files in parallel
+    WORKERS = args.workers
+    # assign whether files are translated in place, rather than saved to a new file
+    IN_PLACE = args.in_place
+
+    # --in-place overwrites the input file, so there is no output file to save to
+    if IN_PLACE and args.outputfile:
+        raise CipherError(
+            "--in-place overwrites the input file - it can't be used with --outputfile"
+        )
 
     # Create simple Lookup Table consisting of all lowercase and uppercase alphanumeric characters
     #  plus common punctuation and spaces:
@@ -420,6 +5973,352 @@ def main():
 
     # print("\nExtended character set:\n", character_set)
 
+    # a character set loaded from a file replaces the default, such as a Cyrillic or
+    #  CJK alphabet - it is checked for repeated characters up front
+    if args.charset_file:
+        character_set = key_from_file(args.charset_file)
+        if not character_set:
+            raise CipherError(
+                "Character set file {} is empty".format(args.charset_file)
+            )
+        character_index(character_set)
+
+    # Key generation mode: add a batch of secure random keys to the key store
+    if args.generate_keys is not None:
+        if not args.keystore:
+            raise CipherError("--generate-keys needs a --keystore to add the keys to")
+
+        with stats_phase("key"):
+            keys = generate_keys(
+                args.generate_keys, TYPE, character_set, args.key_length
+            )
+        key_ids = save_keys(args.keystore, keys, TYPE, character_set)
+
+        print(
+            "{:,} {} keys have been added to {} as key IDs {} to {}".format(
+                len(key_ids), TYPE, args.keystore, key_ids.start, key_ids.stop - 1
+            ),
+            file=sys.stderr,
+        )
+
+        return
+
+    # a key ID looks the key and its cipher type up in the key store
+    if args.key_id is not None:
+        if not args.keystore:
+            raise CipherError("--key-id needs the --keystore holding the key")
+
+        store = load_keystore(args.keystore)
+        if store.characters != character_set:
+            raise CipherError(
+                "{} holds keys for a different character set".format(args.keystore)
+            )
+        TYPE, args.key = store[args.key_id]
+
+    # Jobs mode: run many JSON jobs in this one process, the -T, --key, -S and -E/-D
+    #  options provide defaults for anything a job leaves out
+    if args.jobs:
+        defaults = {
+            "type": TYPE,
+            "key": args.key,
+            "shift": SHIFT,
+            "op": "decrypt" if args.decrypt else "encrypt",
+            "backend": BACKEND,
+            "block_size": BLOCK_SIZE,
+            "keystore": args.keystore,
+        }
+
+        f_in = sys.stdin if args.jobs == "-" else open_file(args.jobs, "r")
+        f_out = sys.stdout
+        if args.outputfile not in (None, "-"):
+            f_out = open_file(args.outputfile, "w")
+
+        try:
+            run_jobs(f_in, f_out, character_set, defaults, WORKERS)
+        finally:
+            if f_in is not sys.stdin:
+                f_in.close()
+            if f_out is not sys.stdout:
+                f_out.close()
+
+        return
+
+    # Service mode: translate the bodies of HTTP requests until interrupted
+    if args.serve:
+        host, port = parse_address(args.serve)
+        defaults = {
+            "type": TYPE,
+            "key": args.key,
+            "shift": SHIFT,
+            "op": "decrypt" if args.decrypt else "encrypt",
+            "backend": BACKEND,
+            "keystore": args.keystore,
+        }
+        if args.key is None and (args.key_file or args.alphabet_file):
+            defaults["key"] = resolve_key(args, TYPE, character_set, interactive=False)
+
+        try:
+            asyncio.run(serve(host, port, character_set, defaults, args.serve_timeout))
+        except KeyboardInterrupt:
+            pass
+
+        return
+
+    # Load generator: measure a running service with the -T, --key, -S and -E/-D options -
+    #  only the options given are sent, so the service's own defaults cover the rest
+    if args.loadgen:
+        host, port = parse_address(args.loadgen)
+        headers = {}
+        if args.type is not None:
+            headers["X-Cipher-Type"] = args.type
+        if args.key is not None:
+            headers["X-Cipher-Key"] = args.key
+        if args.shift is not None:
+            headers["X-Cipher-Shift"] = args.shift
+        if args.decrypt or args.encrypt:
+            headers["X-Cipher-Op"] = "decrypt" if args.decrypt else "encrypt"
+
+        asyncio.run(
+            load_generator(
+                host,
+                port,
+                args.requests,
+                args.concurrency,
+                args.payload_size,
+                headers,
+            )
+        )
+
+        return
+
+    # Train mode: stream a plaintext corpus into a model file for --corpus
+    if args.train:
+        if not args.outputfile:
+            raise CipherError("--train needs an --outputfile for the model")
+
+        with stats_phase("transform"):
+            tables = count_ngrams(read_blocks(args.train, character_set), character_set)
+        save_ngram_model(args.outputfile, tables, character_set)
+
+        print(
+            "The model of {} has been saved to {}".format(args.train, args.outputfile),
+            file=sys.stderr,
+        )
+
+        return
+
+    # Recover key mode: derive the key from a plaintext file and its ciphertext
+    if args.recover_key:
+        if args.inputfile in (None, "-"):
+            raise CipherError("--recover-key needs the ciphertext as --inputfile")
+
+        result = recover_key(
+            aligned_blocks(args.recover_key, args.inputfile, character_set),
+            character_set,
+            TYPE,
+            SHIFT,
+            per_line=not args.stream,
+        )
+        print_recovered_key(result)
+
+        if args.outputfile and result["complete"]:
+            output_to_file(args.outputfile, str(result["key"]))
+
+        return
+
+    # Crack mode: recover the key from ciphertext rather than decrypting with a known key
+    if args.crack:
+        # the ciphertext is streamed through the solvers in blocks - only the start of
+        #  it is kept, for the preview of each key
+        if args.inputfile:
+            blocks = read_blocks(args.inputfile, character_set, args.sample)
+        else:
+            blocks = iter([input("\nPlease enter text to crack\n\t:")[: args.sample]])
+
+        first = next(blocks, "")
+        preview_text = first[:200]
+        blocks = itertools.chain([first], blocks)
+        if isinstance(preview_text, bytes):
+            preview_text = preview_text.decode("latin-1")
+
+        # the character frequencies of a corpus replace the built in English ones
+        expected = None
+        if args.corpus and TYPE in ("Caesar", "Vigenere"):
+            expected = model_frequencies(corpus_model(args.corpus, character_set, 1))
+
+        if args.wordlist:
+            if TYPE != "Vigenere":
+                raise CipherError("--wordlist only cracks Vigenere keys")
+
+            model = corpus_model(args.corpus, character_set) if args.corpus else None
+            try:
+                results = dictionary_attack(
+                    args.wordlist,
+                    blocks,
+                    character_set,
+                    SHIFT,
+                    not args.stream,
+                    args.top,
+                    WORKERS,
+                    model,
+                    expected,
+                    args.checkpoint,
+                    args.sample or DICTIONARY_SAMPLE,
+                )
+            except KeyboardInterrupt:
+                if not args.checkpoint:
+                    raise
+                print("\nInterrupted - progress saved to {}".format(args.checkpoint))
+                return
+            preview = lambda text, key: vigenere_preview(
+                text, key, character_set, SHIFT
+            )
+        elif TYPE == "Caesar":
+            results = crack_caesar(blocks, character_set, SHIFT, args.top, expected)
+            preview = lambda text, key: caesar_cipher(
+                text, key, character_set, True, SHIFT
+            )
+        elif TYPE == "Vigenere":
+            results = crack_vigenere(
+                blocks,
+                character_set,
+                SHIFT,
+                args.top,
+                args.max_key_length,
+                expected,
+                not args.stream,
+            )
+            preview = lambda text, key: vigenere_preview(
+                text, key, character_set, SHIFT
+            )
+        elif TYPE == "Substitution":
+            if not args.corpus:
+                raise CipherError("Cracking Substitution needs a --corpus of plaintext")
+
+            model = corpus_model(args.corpus, character_set)
+            results = crack_substitution(
+                blocks,
+                model,
+                args.top,
+                args.sample or SUBSTITUTION_SAMPLE,
+                args.restarts,
+                WORKERS,
+                args.time_limit,
+            )
+            preview = lambda text, key: substitution_cipher(
+                text, key, character_set, True
+            )
+        else:
+            raise CipherError("Cracking is not supported for {} yet".format(TYPE))
+
+        print_cracked_keys(results, preview_text, preview)
+
+        return
+
+    # Range mode: translate part of a file, seeking straight to it rather than reading
+    #  everything before it - the .idx line index finds lines and key positions at once
+    if args.range or args.lines or args.index:
+        if args.inputfile in (None, "-"):
+            raise CipherError("--range, --lines and --index need an --inputfile")
+
+        if args.index:
+            index_name = build_line_index(args.inputfile)
+            print(
+                "The line index of {} has been saved to {}".format(
+                    args.inputfile, index_name
+                ),
+                file=sys.stderr,
+            )
+
+            if not (args.range or args.lines):
+                return
+
+        index = load_line_index(args.inputfile, build=bool(args.lines))
+        start, end = args.range or index.line_range(*args.lines)
+        KEY = resolve_key(args, TYPE, character_set)
+
+        f_out = sys.stdout.buffer
+        if args.outputfile not in (None, "-"):
+            f_out = open_file(args.outputfile, "wb")
+
+        blocks = file_range_cipher(
+            args.inputfile,
+            KEY,
+            character_set,
+            decrypt=not args.encrypt,
+            shift_type=SHIFT,
+            enc_type=TYPE,
+            backend=BACKEND,
+            start=start,
+            end=end,
+            per_line=not args.stream,
+            index=index,
+        )
+
+        try:
+            stats_out = stats_file(f_out)
+            for block in blocks:
+                stats_out.write(block)
+        finally:
+            if f_out is not sys.stdout.buffer:
+                f_out.close()
+
+        return
+
+    # Batch mode: translate many files with one set of cipher tables
+    if args.batch:
+        DECRYPT = args.decrypt
+        KEY = resolve_key(args, TYPE, character_set)
+
+        batch_file_cipher(
+            batch_pairs(args.batch, args.outputfile),
+            KEY,
+            character_set,
+            decrypt=DECRYPT,
+            shift_type=SHIFT,
+            enc_type=TYPE,
+            backend=BACKEND,
+            block_size=BLOCK_SIZE,
+            workers=WORKERS,
+            processes=args.processes,
+            skip_unchanged=args.skip_unchanged,
+        )
+
+        return
+
+    # When the input is "-", or data is piped in while the key comes from the command line,
+    #  run as a filter: stream stdin (or the input file) to stdout (or the output file)
+    #  with no prompts and nothing but the results written to stdout
+    has_key = (
+        args.key is not None
+        or args.key_file
+        or args.alphabet_file
+        or TYPE == "Pipeline"
+    )
+    if args.inputfile == "-" or (
+        args.inputfile is None and has_key and not sys.stdin.isatty()
+    ):
+        KEY = resolve_key(args, TYPE, character_set, interactive=False)
+        cipher = compile_cipher(KEY, character_set, SHIFT, TYPE, BACKEND)
+
+        f_in = sys.stdin
+        if args.inputfile not in (None, "-"):
+            f_in = open_file(args.inputfile, "r")
+
+        f_out = sys.stdout
+        if args.outputfile not in (None, "-"):
+            f_out = open_file(args.outputfile, "w")
+
+        try:
+            stream_cipher(f_in, f_out, cipher, args.decrypt, args.block_size)
+        finally:
+            if f_in is not sys.stdin:
+                f_in.close()
+            if f_out is not sys.stdout:
+                f_out.close()
+
+        return
+
     if args.encrypt:
         DECRYPT = False
 
@@ -432,13 +6331,12 @@ def main():
 
             if args.outputfile:
                 outfile = args.outputfile
+            elif IN_PLACE:
+                outfile = infile
             else:
                 outfile = input("\nPlease enter path for output file\n\t:")
 
-            if TYPE == "Substitution":
-                KEY = get_cipher_alphabet(character_set)
-            else:
-                KEY = get_key(TYPE)
+            KEY = resolve_key(args, TYPE, character_set)
 
             print("\n\t**** ENCRYPTING ****\n")
             file_cipher(
@@ -449,6 +6347,12 @@ def main():
                 decrypt=DECRYPT,
                 shift_type=SHIFT,
                 enc_type=TYPE,
+                backend=BACKEND,
+                block_size=BLOCK_SIZE,
+                workers=WORKERS,
+                in_place=IN_PLACE,
+                sync=args.fsync,
+                atomic=args.atomic,
             )
 
         else:
@@ -460,26 +6364,45 @@ def main():
                 plain_text = input("\nPlease enter text to encrypt\n\t:")
                 # plain_text = "We ATTACK at Dawn. Rendezvous at 95th street and bring supplies!"
 
-            if TYPE == "Substitution":
-                KEY = get_cipher_alphabet(character_set)
-            else:
-                KEY = get_key(TYPE)
+            KEY = resolve_key(args, TYPE, character_set)
 
             print("\n\t**** ENCRYPTING ****\n")
             print("\nPlain text:\n", plain_text)
 
             if TYPE == "Caesar":
                 encrypted = caesar_cipher(
-                    plain_text, KEY, character_set, decrypt=DECRYPT, shift_type=SHIFT
+                    plain_text,
+                    KEY,
+                    character_set,
+                    decrypt=DECRYPT,
+                    shift_type=SHIFT,
+                    backend=BACKEND,
                 )
             elif TYPE == "Vigenere":
                 encrypted = vigenere_cipher(
-                    plain_text, KEY, character_set, decrypt=DECRYPT, shift_type=SHIFT
+                    plain_text,
+                    KEY,
+                    character_set,
+                    decrypt=DECRYPT,
+                    shift_type=SHIFT,
+                    backend=BACKEND,
                 )
             elif TYPE == "Substitution":
                 encrypted = substitution_cipher(
-                    plain_text, KEY, character_set, decrypt=DECRYPT
+                    plain_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
+                )
+            elif TYPE == "Columnar":
+                encrypted = columnar_cipher(
+                    plain_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
                 )
+            elif TYPE == "RailFence":
+                encrypted = rail_fence_cipher(
+                    plain_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
+                )
+            else:
+                encrypted = compile_cipher(
+                    KEY, character_set, SHIFT, TYPE, BACKEND
+                ).translate(plain_text, DECRYPT)
 
             print("\n\t**** SUCCESS! ****\n")
             print("\nEncrypted text:\n", encrypted)
@@ -501,13 +6424,12 @@ def main():
 
             if args.outputfile:
                 outfile = args.outputfile
+            elif IN_PLACE:
+                outfile = infile
             else:
                 outfile = input("\nPlease enter path for output file\n\t:")
 
-            if TYPE == "Substitution":
-                KEY = get_cipher_alphabet(character_set)
-            else:
-                KEY = get_key(TYPE)
+            KEY = resolve_key(args, TYPE, character_set)
 
             print("\n\t**** DECRYPTING ****\n")
             file_cipher(
@@ -518,6 +6440,12 @@ def main():
                 decrypt=DECRYPT,
                 shift_type=SHIFT,
                 enc_type=TYPE,
+                backend=BACKEND,
+                block_size=BLOCK_SIZE,
+                workers=WORKERS,
+                in_place=IN_PLACE,
+                sync=args.fsync,
+                atomic=args.atomic,
             )
 
         else:
@@ -528,26 +6456,45 @@ def main():
             else:
                 cipher_text = input("\nPlease enter text to decrypt\n\t:")
 
-            if TYPE == "Substitution":
-                KEY = get_cipher_alphabet(character_set)
-            else:
-                KEY = get_key(TYPE)
+            KEY = resolve_key(args, TYPE, character_set)
 
             print("\n\t**** DECRYPTING ****\n")
             print("\ncipher text:\n", cipher_text)
 
             if TYPE == "Caesar":
                 decrypted = caesar_cipher(
-                    cipher_text, KEY, character_set, decrypt=DECRYPT, shift_type=SHIFT
+                    cipher_text,
+                    KEY,
+                    character_set,
+                    decrypt=DECRYPT,
+                    shift_type=SHIFT,
+                    backend=BACKEND,
                 )
             elif TYPE == "Vigenere":
                 decrypted = vigenere_cipher(
-                    cipher_text, KEY, character_set, decrypt=DECRYPT, shift_type=SHIFT
+                    cipher_text,
+                    KEY,
+                    character_set,
+                    decrypt=DECRYPT,
+                    shift_type=SHIFT,
+                    backend=BACKEND,
                 )
             elif TYPE == "Substitution":
                 decrypted = substitution_cipher(
-                    cipher_text, KEY, character_set, decrypt=DECRYPT
+                    cipher_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
                 )
+            elif TYPE == "Columnar":
+                decrypted = columnar_cipher(
+                    cipher_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
+                )
+            elif TYPE == "RailFence":
+                decrypted = rail_fence_cipher(
+                    cipher_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
+                )
+            else:
+                decrypted = compile_cipher(
+                    KEY, character_set, SHIFT, TYPE, BACKEND
+                ).translate(cipher_text, DECRYPT)
 
             print("\n\t**** SUCCESS! ****\n")
             print("\nDecrypted text:\n", decrypted)
@@ -570,13 +6517,12 @@ def main():
 
             if args.outputfile:
                 outfile = args.outputfile
+            elif IN_PLACE:
+                outfile = infile
             else:
                 outfile = input("\nPlease enter path for output file\n\t:")
 
-            if TYPE == "Substitution":
-                KEY = get_cipher_alphabet(character_set)
-            else:
-                KEY = get_key(TYPE)
+            KEY = resolve_key(args, TYPE, character_set)
 
             print("\n\t**** ENCRYPTING ****\n")
             file_cipher(
@@ -587,6 +6533,12 @@ def main():
                 decrypt=DECRYPT,
                 shift_type=SHIFT,
                 enc_type=TYPE,
+                backend=BACKEND,
+                block_size=BLOCK_SIZE,
+                workers=WORKERS,
+                in_place=IN_PLACE,
+                sync=args.fsync,
+                atomic=args.atomic,
             )
 
         else:
@@ -598,26 +6550,45 @@ def main():
                 plain_text = input("\nPlease enter text to encrypt\n\t:")
                 # plain_text = "We ATTACK at Dawn. Rendezvous at 95th street and bring supplies!"
 
-            if TYPE == "Substitution":
-                KEY = get_cipher_alphabet(character_set)
-            else:
-                KEY = get_key(TYPE)
+            KEY = resolve_key(args, TYPE, character_set)
 
             print("\n\t**** ENCRYPTING ****\n")
             print("\nPlain text:\n", plain_text)
 
             if TYPE == "Caesar":
                 encrypted = caesar_cipher(
-                    plain_text, KEY, character_set, decrypt=DECRYPT, shift_type=SHIFT
+                    plain_text,
+                    KEY,
+                    character_set,
+                    decrypt=DECRYPT,
+                    shift_type=SHIFT,
+                    backend=BACKEND,
                 )
             elif TYPE == "Vigenere":
                 encrypted = vigenere_cipher(
-                    plain_text, KEY, character_set, decrypt=DECRYPT, shift_type=SHIFT
+                    plain_text,
+                    KEY,
+                    character_set,
+                    decrypt=DECRYPT,
+                    shift_type=SHIFT,
+                    backend=BACKEND,
                 )
             elif TYPE == "Substitution":
                 encrypted = substitution_cipher(
-                    plain_text, KEY, character_set, decrypt=DECRYPT
+                    plain_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
+                )
+            elif TYPE == "Columnar":
+                encrypted = columnar_cipher(
+                    plain_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
                 )
+            elif TYPE == "RailFence":
+                encrypted = rail_fence_cipher(
+                    plain_text, KEY, character_set, decrypt=DECRYPT, backend=BACKEND
+                )
+            else:
+                encrypted = compile_cipher(
+                    KEY, character_set, SHIFT, TYPE, BACKEND
+                ).translate(plain_text, DECRYPT)
 
             print("\n\t**** SUCCESS! ****\n")
             print("\nEncrypted text:\n", encrypted)
@@ -634,4 +6605,7 @@ def main():
 if __name__ == "__main__":
 
     # Call main function
-    main()
+    try:
+        main()
+    except CipherError as error:
+        sys.exit("\nERROR - {}\n".format(error))
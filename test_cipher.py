@@ -0,0 +1,734 @@
+#!/usr/bin/env python3
+"""Regression tests for cipher.py"""
+
+# -*- coding: utf-8 -*-
+#
+# Cipher Tests
+# Copyright (c) 2020 Peter Robards
+#
+##########################################################################################
+#
+# Checks that the faster paths of cipher.py (raw bytes, streaming, ranges, worker
+#  processes, in place) give exactly the same results as translating the text in memory.
+#
+#   python3 -m unittest test_cipher
+#
+##########################################################################################
+
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import string
+import tempfile
+import unittest
+
+import cipher
+
+# Same 95 character set used by cipher.py
+CHARACTER_SET = (
+    string.ascii_lowercase
+    + string.ascii_uppercase
+    + string.digits
+    + " "
+    + string.punctuation
+)
+
+# Text with multi-byte UTF-8 characters spread through its lines
+UTF8_TEXT = "héllo wörld… naïve café\nsecond line ünïcödé ✓ done\n" * 40 + "tail ✓"
+
+# English prose, long enough for the letter frequencies and n-grams to stand out
+ENGLISH_TEXT = (
+    "It was a bright cold morning in the early spring, and the clocks in the old "
+    "town were striking nine as the carrier came down the hill with the letters. "
+    "Nobody in the village could remember a time when he had been late, and the "
+    "children who waited for him at the corner of the market square would count "
+    "the strokes of the church bell and cheer when he appeared on the last one. "
+    "He carried a leather bag that had belonged to his father, and before that to "
+    "his grandfather, and he liked to say that the bag knew the way better than he "
+    "did. The letters that morning were the usual mixture of bills, postcards from "
+    "people who had gone to the sea, and parcels that were too large for the bag "
+    "and had to be tied to the back of his bicycle with a length of string. There "
+    "was one letter, however, that was quite unlike the others. It was written on "
+    "thick paper the colour of cream, sealed with red wax, and addressed in a hand "
+    "so careful and so small that he had to hold it close to his eyes to read the "
+    "name. It was for the woman who lived alone in the house by the river, who "
+    "never received any letters at all, and who was said by some of the older "
+    "people in the village to have been a famous singer in the capital long ago. "
+    "He thought about the letter all the way along the river path, turning it over "
+    "in his mind as he turned it over in his hands, and wondering what news could "
+    "be important enough to be sealed with wax in these days of quick messages "
+    "and telephones. When he knocked on her door she opened it at once, as if she "
+    "had been standing just behind it waiting for him, and when she saw the letter "
+    "her face changed in a way that he would remember for the rest of his life. "
+)
+
+# Bytes that aren't UTF-8 - stray continuation bytes and truncated characters among
+#  the newlines and whole characters
+BINARY_DATA = random.Random(4).randbytes(20000)
+
+# Cipher alphabet of the substitution tests
+ALPHABET = "qwertyuiopasdfghjklzxcvbnm"
+
+
+# Files written by the tests are kept in a temporary directory
+class FileTestCase(unittest.TestCase):
+    """Test case with a temporary directory for its files"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def path(self, name):
+        """Path of a file in the temporary directory"""
+        return os.path.join(self.directory, name)
+
+    def write(self, name, text):
+        """Write UTF-8 text to a file, returning its path"""
+        with open(self.path(name), "w", encoding="utf-8", newline="") as file:
+            file.write(text)
+
+        return self.path(name)
+
+    def read(self, name):
+        """Read a UTF-8 file"""
+        with open(self.path(name), "r", encoding="utf-8", newline="") as file:
+            return file.read()
+
+    def write_bytes(self, name, data):
+        """Write bytes to a file, returning its path"""
+        with open(self.path(name), "wb") as file:
+            file.write(data)
+
+        return self.path(name)
+
+    def read_bytes(self, name):
+        """Read a file as bytes"""
+        with open(self.path(name), "rb") as file:
+            return file.read()
+
+
+# The Vigenere key moves once per character on the raw bytes path, as it does for text
+class Utf8FileTests(FileTestCase):
+    """Files with multi-byte characters match the text translated in memory"""
+
+    def test_lines_match_vigenere_cipher(self):
+        source = self.write("plain.txt", UTF8_TEXT)
+        cipher.file_cipher(
+            source,
+            self.path("enc.txt"),
+            "key",
+            CHARACTER_SET,
+            enc_type="Vigenere",
+            verbose=False,
+        )
+
+        expected = "".join(
+            cipher.vigenere_cipher(line, "key", CHARACTER_SET)
+            for line in UTF8_TEXT.splitlines(True)
+        )
+        self.assertEqual(self.read("enc.txt"), expected)
+
+        cipher.file_cipher(
+            self.path("enc.txt"),
+            self.path("dec.txt"),
+            "key",
+            CHARACTER_SET,
+            True,
+            enc_type="Vigenere",
+            verbose=False,
+        )
+        self.assertEqual(self.read("dec.txt"), UTF8_TEXT)
+
+    def test_stream_matches_vigenere_cipher(self):
+        source = self.write("plain.txt", UTF8_TEXT)
+        expected = cipher.vigenere_cipher(UTF8_TEXT, "key", CHARACTER_SET)
+
+        # block sizes that split the multi-byte characters between blocks
+        for block_size in (1, 7, 1 << 16):
+            cipher.file_cipher(
+                source,
+                self.path("enc.txt"),
+                "key",
+                CHARACTER_SET,
+                enc_type="Vigenere",
+                block_size=block_size,
+                verbose=False,
+            )
+            self.assertEqual(self.read("enc.txt"), expected)
+            self.assertEqual(
+                cipher.vigenere_cipher(expected, "key", CHARACTER_SET, True), UTF8_TEXT
+            )
+
+
+# Files translated in byte ranges by worker processes match a single process run
+class WorkerFileTests(FileTestCase):
+    """--workers output is byte for byte that of a single process"""
+
+    def assertSameOutput(self, source, key, enc_type, block_size=None):
+        cipher.file_cipher(
+            source,
+            self.path("one.txt"),
+            key,
+            CHARACTER_SET,
+            enc_type=enc_type,
+            block_size=block_size,
+            verbose=False,
+        )
+        # small ranges, so lines and characters are split between them
+        cipher.parallel_file_cipher(
+            source,
+            self.path("parallel.txt"),
+            key,
+            CHARACTER_SET,
+            enc_type=enc_type,
+            workers=2,
+            block_size=100,
+            verbose=False,
+            per_line=block_size is None,
+        )
+        self.assertEqual(self.read_bytes("parallel.txt"), self.read_bytes("one.txt"))
+
+    def test_key_restarts_on_every_line(self):
+        source = self.write("plain.txt", "hello\nsecond line here\n" * 50)
+        self.assertSameOutput(source, "keys", "Vigenere")
+
+    def test_multi_byte_characters(self):
+        source = self.write("plain.txt", UTF8_TEXT)
+        for enc_type, key in (("Vigenere", "keys"), ("Caesar", 3)):
+            self.assertSameOutput(source, key, enc_type)
+            self.assertSameOutput(source, key, enc_type, block_size=64)
+
+    def test_bytes_that_are_not_utf8(self):
+        source = self.write_bytes("plain.bin", BINARY_DATA)
+        self.assertSameOutput(source, "lemonade", "Vigenere")
+        self.assertSameOutput(source, "lemonade", "Vigenere", block_size=64)
+
+        # a long run of continuation bytes at the start of a range
+        source = self.write_bytes("plain.bin", b"\x80" * 300 + b"ab\xe2\x82\xac\n" * 80)
+        self.assertSameOutput(source, "lemonade", "Vigenere")
+        self.assertSameOutput(source, "lemonade", "Vigenere", block_size=64)
+
+
+# Byte ranges decrypted with --range match the same bytes of the file encrypted by -f
+class RangeFileTests(FileTestCase):
+    """--range output is the matching range of the plain text"""
+
+    def assertRangesMatch(self, plain, block_size=None, index=False):
+        source = self.write_bytes("plain.bin", plain)
+        cipher.file_cipher(
+            source,
+            self.path("enc.bin"),
+            "lemonade",
+            CHARACTER_SET,
+            enc_type="Vigenere",
+            block_size=block_size,
+            verbose=False,
+        )
+        line_index = None
+        if index:
+            line_index = cipher.load_line_index(self.path("enc.bin"), build=True)
+
+        for start in range(0, len(plain), 37):
+            end = min(start + 50, len(plain))
+            data = b"".join(
+                cipher.file_range_cipher(
+                    self.path("enc.bin"),
+                    "lemonade",
+                    CHARACTER_SET,
+                    enc_type="Vigenere",
+                    start=start,
+                    end=end,
+                    per_line=block_size is None,
+                    index=line_index,
+                    block_size=16,
+                )
+            )
+            # a range starting part way through a character begins at its first byte
+            self.assertLessEqual(len(data) - (end - start), 3)
+            self.assertEqual(data, plain[end - len(data) : end])
+
+    def test_utf8_text(self):
+        plain = UTF8_TEXT.encode("utf-8")
+        for index in (False, True):
+            self.assertRangesMatch(plain, index=index)
+            self.assertRangesMatch(plain, block_size=64, index=index)
+
+    def test_bytes_that_are_not_utf8(self):
+        for index in (False, True):
+            self.assertRangesMatch(BINARY_DATA[:4000], index=index)
+            self.assertRangesMatch(BINARY_DATA[:4000], block_size=64, index=index)
+
+
+# Files translated in place match the files written by -f, in both directions
+class InPlaceFileTests(FileTestCase):
+    """--in-place output is byte for byte that of -f"""
+
+    def test_in_place_matches_file_cipher(self):
+        source = self.write("plain.txt", UTF8_TEXT)
+        in_place = self.path("in_place.txt")
+
+        for block_size in (None, 100):
+            cipher.file_cipher(
+                source,
+                self.path("enc.txt"),
+                "keys",
+                CHARACTER_SET,
+                enc_type="Vigenere",
+                block_size=block_size,
+                verbose=False,
+            )
+            shutil.copy(source, in_place)
+            cipher.file_cipher(
+                in_place,
+                in_place,
+                "keys",
+                CHARACTER_SET,
+                enc_type="Vigenere",
+                block_size=block_size,
+                in_place=True,
+                verbose=False,
+            )
+            self.assertEqual(self.read("in_place.txt"), self.read("enc.txt"))
+
+            # a file encrypted by -f decrypts in place
+            shutil.copy(self.path("enc.txt"), in_place)
+            cipher.file_cipher(
+                in_place,
+                in_place,
+                "keys",
+                CHARACTER_SET,
+                True,
+                enc_type="Vigenere",
+                block_size=block_size,
+                in_place=True,
+                verbose=False,
+            )
+            self.assertEqual(self.read("in_place.txt"), UTF8_TEXT)
+
+
+# Messages transposed in chunks match the whole message transposed at once
+class TranspositionTests(unittest.TestCase):
+    """Columnar and RailFence blocks span the chunks of a message"""
+
+    def test_chunks_match_whole_message(self):
+        generator = random.Random(2)
+        text = "".join(generator.choice("ab. \n") for _ in range(200000))
+        # a long stretch without the character set, so a block spans many chunks
+        text = "a" * 100 + "." * 200000 + text
+
+        for enc_type, key in (("Columnar", "zebra"), ("RailFence", 3)):
+            compiled = cipher.compile_cipher(key, "ab", "right", enc_type)
+            expected = compiled.translate(text)
+
+            chunks = (text[i : i + 4096] for i in range(0, len(text), 4096))
+            self.assertEqual("".join(compiled.encrypt_iter(chunks)), expected)
+
+            chunks = (expected[i : i + 4096] for i in range(0, len(expected), 4096))
+            self.assertEqual("".join(compiled.encrypt_iter(chunks, True)), text)
+
+    def test_known_answers(self):
+        text = "wearediscoveredfleeatonce"
+        columnar = cipher.compile_cipher("zebras", enc_type="Columnar")
+        self.assertEqual(columnar.encrypt(text), "evlnacdtesearofodeecwiree")
+        rail_fence = cipher.compile_cipher(3, enc_type="RailFence")
+        self.assertEqual(rail_fence.encrypt(text), "wecrlteerdsoeefeaocaivden")
+
+    def test_round_trip(self):
+        for enc_type, key in (("Columnar", "zebras"), ("RailFence", 3)):
+            compiled = cipher.compile_cipher(key, CHARACTER_SET, enc_type=enc_type)
+            encrypted = compiled.encrypt(UTF8_TEXT)
+            self.assertNotEqual(encrypted, UTF8_TEXT)
+            self.assertEqual(compiled.decrypt(encrypted), UTF8_TEXT)
+
+            # characters outside the character set stay where they are
+            for plain, moved in zip(UTF8_TEXT, encrypted):
+                if plain not in CHARACTER_SET:
+                    self.assertEqual(moved, plain)
+
+
+# Pipelines run their stages in order and undo them in reverse
+class PipelineTests(unittest.TestCase):
+    """Pipelines match their stages applied one after another"""
+
+    def assertRoundTrip(self, stages):
+        pipeline = cipher.PipelineCipher(stages, CHARACTER_SET)
+        expected = UTF8_TEXT
+        for enc_type, key in stages:
+            expected = cipher.compile_cipher(
+                key, CHARACTER_SET, enc_type=enc_type
+            ).encrypt(expected)
+
+        encrypted = pipeline.encrypt(UTF8_TEXT)
+        self.assertEqual(encrypted, expected)
+        self.assertEqual(pipeline.decrypt(encrypted), UTF8_TEXT)
+
+        # a message in chunks goes through the same passes
+        chunks = (UTF8_TEXT[i : i + 100] for i in range(0, len(UTF8_TEXT), 100))
+        self.assertEqual("".join(pipeline.encrypt_iter(chunks)), expected)
+
+        return pipeline
+
+    def test_fused_tables(self):
+        alphabet = CHARACTER_SET[::-1]
+        pipeline = self.assertRoundTrip(
+            (("Caesar", 3), ("Vigenere", "lemon"), ("Substitution", alphabet))
+        )
+        # the three stages fuse into a single pass with the period of the Vigenere key
+        self.assertEqual(len(pipeline.passes), 1)
+        self.assertEqual(pipeline.period, 5)
+
+    def test_transposition_stages(self):
+        pipeline = self.assertRoundTrip(
+            (("Vigenere", "lemon"), ("Columnar", "zebras"), ("RailFence", 3))
+        )
+        self.assertEqual(len(pipeline.passes), 3)
+        self.assertEqual(
+            cipher.PipelineCipher(
+                "Vigenere:lemon,Columnar:zebras,RailFence:3", CHARACTER_SET
+            ).encrypt(UTF8_TEXT),
+            pipeline.encrypt(UTF8_TEXT),
+        )
+
+        with self.assertRaises(cipher.CipherError):
+            pipeline.byte_tables()
+
+
+# Files translated through a pipeline come back unchanged
+class PipelineFileTests(FileTestCase):
+    """-f and --stream round trip a file through a pipeline"""
+
+    def test_round_trip(self):
+        self.write("plain.txt", UTF8_TEXT)
+        stages = (("Vigenere", "lemon"), ("Columnar", "zebras"), ("RailFence", 3))
+
+        for block_size in (None, 100):
+            for source, output, decrypt in (
+                ("plain.txt", "enc.txt", False),
+                ("enc.txt", "dec.txt", True),
+            ):
+                cipher.file_cipher(
+                    self.path(source),
+                    self.path(output),
+                    stages,
+                    CHARACTER_SET,
+                    decrypt,
+                    enc_type="Pipeline",
+                    block_size=block_size,
+                    verbose=False,
+                )
+            self.assertNotEqual(self.read("enc.txt"), UTF8_TEXT)
+            self.assertEqual(self.read("dec.txt"), UTF8_TEXT)
+
+
+# Jobs files give one result line per job, in order, whatever the job holds
+class JobTests(FileTestCase):
+    """run_jobs() runs good jobs and reports bad ones without stopping"""
+
+    defaults = {"type": "Caesar", "key": None, "shift": "right", "op": "encrypt"}
+
+    def run_jobs(self, jobs, workers=None):
+        """Run JSON jobs, returning their results"""
+        f_in = io.StringIO("".join(json.dumps(job) + "\n" for job in jobs))
+        f_out = io.StringIO()
+        cipher.run_jobs(f_in, f_out, CHARACTER_SET, self.defaults, workers)
+
+        return [json.loads(line) for line in f_out.getvalue().splitlines()]
+
+    def test_bad_option_types(self):
+        jobs = [
+            {"type": "Vigenere", "key": 5, "text": "hello"},
+            {"type": "Columnar", "key": 5, "text": "hello"},
+            {"type": "Substitution", "key": ["a"], "text": "hello"},
+            {"type": "Caesar", "key": 3.5, "text": "hello"},
+            {"type": "Caesar", "key": True, "text": "hello"},
+            {"type": "Caesar", "key": [1], "text": "hello"},
+            {"type": 5, "key": "3", "text": "hello"},
+            {"type": "Caesar", "key": 3, "text": 7},
+            {"type": "Caesar", "key": 3, "input": 5, "output": "x"},
+            {"type": "Caesar", "key": 3, "shift": "up", "text": "hello"},
+            ["not", "an", "object"],
+        ]
+        # every bad job is reported and the good job after them still runs
+        jobs.append({"id": "last", "type": "Vigenere", "key": "lemon", "text": "hi"})
+
+        for workers in (None, 2):
+            results = self.run_jobs(jobs, workers)
+            self.assertEqual([result["line"] for result in results], list(range(1, 13)))
+            for result in results[:-1]:
+                self.assertFalse(result["ok"])
+                self.assertIn("error", result)
+
+            self.assertTrue(results[-1]["ok"])
+            self.assertEqual(results[-1]["id"], "last")
+            self.assertEqual(
+                results[-1]["text"],
+                cipher.vigenere_cipher("hi", "lemon", CHARACTER_SET),
+            )
+
+    def test_pipeline_file_job(self):
+        self.write("plain.txt", UTF8_TEXT)
+        job = {"type": "Vigenere:lemon,Columnar:zebras,RailFence:3"}
+        results = self.run_jobs(
+            [
+                dict(job, input=self.path("plain.txt"), output=self.path("enc.txt")),
+                dict(
+                    job,
+                    input=self.path("enc.txt"),
+                    output=self.path("dec.txt"),
+                    op="decrypt",
+                ),
+            ]
+        )
+        self.assertEqual([result["ok"] for result in results], [True, True])
+        self.assertEqual(self.read("dec.txt"), UTF8_TEXT)
+
+
+# Keys are cracked from ciphertext alone
+class CrackTests(unittest.TestCase):
+    """The crackers find the key English text was encrypted with"""
+
+    def test_caesar(self):
+        encrypted = cipher.caesar_cipher(ENGLISH_TEXT, 17, CHARACTER_SET)
+        self.assertEqual(cipher.crack_caesar(encrypted, CHARACTER_SET)[0][0], 17)
+
+        # the histogram is built over every block, as bytes or text
+        blocks = [encrypted[:500].encode(), encrypted[500:].encode()]
+        self.assertEqual(cipher.crack_caesar(blocks, CHARACTER_SET)[0][0], 17)
+
+        encrypted = cipher.caesar_cipher(ENGLISH_TEXT, 17, CHARACTER_SET, False, "left")
+        results = cipher.crack_caesar(encrypted, CHARACTER_SET, "left")
+        self.assertEqual(results[0][0], 17)
+
+    def test_vigenere(self):
+        text = ENGLISH_TEXT.replace(". ", ".\n")
+
+        # -f restarts the key on every line, --stream runs it on through them
+        encrypted = "".join(
+            cipher.vigenere_cipher(line, "lemon", CHARACTER_SET)
+            for line in text.splitlines(True)
+        )
+        results = cipher.crack_vigenere(encrypted, CHARACTER_SET)
+        self.assertEqual(results[0][0], "lemon")
+
+        encrypted = cipher.vigenere_cipher(text, "lemon", CHARACTER_SET)
+        results = cipher.crack_vigenere(encrypted, CHARACTER_SET, per_line=False)
+        self.assertEqual(results[0][0], "lemon")
+
+    def test_substitution(self):
+        text = ENGLISH_TEXT.lower()
+        characters = string.ascii_lowercase
+        encrypted = cipher.substitution_cipher(text, ALPHABET, characters)
+        model = cipher.ngram_model(text, characters)
+
+        for workers in (1, 2):
+            results = cipher.crack_substitution(
+                encrypted, model, workers=workers, time_limit=10
+            )
+            # letters missing from the text can't be told apart, so check the text
+            self.assertEqual(
+                cipher.substitution_cipher(encrypted, results[0][0], characters, True),
+                text,
+            )
+
+
+# Trained n-gram models match the models built straight from the text
+class NgramModelTests(FileTestCase):
+    """count_ngrams() and the model files give back the n-grams of a corpus"""
+
+    def test_save_and_load(self):
+        text = ENGLISH_TEXT.lower()
+        characters = string.ascii_lowercase
+
+        # blocks that split n-grams between them count the same as the whole text
+        blocks = (text[i : i + 101] for i in range(0, len(text), 101))
+        tables = cipher.count_ngrams(blocks, characters)
+        for (codes, counts), (whole_codes, whole_counts) in zip(
+            tables, cipher.count_ngrams([text], characters)
+        ):
+            self.assertEqual(list(codes), list(whole_codes))
+            self.assertEqual(list(counts), list(whole_counts))
+
+        model_file = cipher.save_ngram_model(self.path("model.bin"), tables, characters)
+        self.assertTrue(cipher.is_ngram_model(model_file))
+
+        for ngram in range(1, cipher.TRAIN_ORDERS + 1):
+            loaded = cipher.load_ngram_model(model_file, characters, ngram)
+            built = cipher.ngram_model(text, characters, ngram)
+            codes = [int(code) for code in loaded.codes]
+            self.assertEqual(len(codes), len(tables[ngram - 1][0]))
+            for score, expected in zip(loaded.scores, built.score_codes(codes)):
+                self.assertAlmostEqual(float(score), float(expected), places=5)
+            self.assertAlmostEqual(loaded.floor, built.floor)
+
+        with self.assertRaises(cipher.CipherError):
+            cipher.load_ngram_model(model_file, characters + " ")
+        with self.assertRaises(cipher.CipherError):
+            cipher.load_ngram_model(model_file, characters, cipher.TRAIN_ORDERS + 1)
+
+
+# Keys saved to a key store are looked up by the IDs they were given
+class KeyStoreTests(FileTestCase):
+    """save_keys() records come back from KeyStore and keystore_cipher()"""
+
+    def test_keys_of_every_length(self):
+        store_file = self.path("keys.bin")
+        short = ["abcd", "wxyz"]
+        self.assertEqual(list(cipher.save_keys(store_file, short)), [0, 1])
+
+        # a store started with short keys still holds full length keys and alphabets
+        long = cipher.generate_keys(3, "Vigenere", length=cipher.KEY_LENGTH)
+        alphabets = cipher.generate_keys(2, "Substitution")
+        self.assertEqual(list(cipher.save_keys(store_file, long)), [2, 3, 4])
+        self.assertEqual(
+            list(cipher.save_keys(store_file, alphabets, "Substitution")), [5, 6]
+        )
+
+        store = cipher.KeyStore(store_file)
+        self.assertEqual(len(store), 7)
+        expected = [("Vigenere", key) for key in short + long]
+        expected += [("Substitution", alphabet) for alphabet in alphabets]
+        self.assertEqual([store[key_id] for key_id in range(7)], expected)
+
+        for key_id, (enc_type, key) in enumerate(expected):
+            self.assertEqual(
+                cipher.keystore_cipher(store_file, key_id).encrypt("hello world"),
+                cipher.compile_cipher(key, enc_type=enc_type).encrypt("hello world"),
+            )
+
+        with self.assertRaises(cipher.CipherError):
+            store[7]
+        with self.assertRaises(cipher.CipherError):
+            cipher.save_keys(store_file, ["a" * (store.width + 1)])
+        with self.assertRaises(cipher.CipherError):
+            cipher.save_keys(store_file, ["abcd"], characters=CHARACTER_SET)
+
+    def test_not_a_key_store(self):
+        with self.assertRaises(cipher.CipherError):
+            cipher.KeyStore(self.write("plain.txt", UTF8_TEXT))
+
+
+# Requests sent to the service come back translated, and stalled clients are dropped
+class ServiceTests(unittest.IsolatedAsyncioTestCase):
+    """The service translates request bodies and closes stalled connections"""
+
+    async def asyncSetUp(self):
+        defaults = {"type": "Vigenere", "key": "lemon", "shift": "right"}
+        defaults.update(op="encrypt", backend="auto")
+        server = await asyncio.start_server(
+            lambda reader, writer: cipher.handle_connection(
+                reader, writer, CHARACTER_SET, defaults, 0.2
+            ),
+            "127.0.0.1",
+            0,
+        )
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def request(self, data):
+        """Send raw request bytes, returning everything read back until closed"""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(data)
+        try:
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+
+    async def test_chunked_body(self):
+        response = await self.request(
+            b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+        )
+        head, _, rest = response.partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 OK"))
+
+        body = b""
+        while True:
+            size, _, rest = rest.partition(b"\r\n")
+            if not int(size, 16):
+                break
+            body += rest[: int(size, 16)]
+            rest = rest[int(size, 16) + 2 :]
+
+        expected = cipher.vigenere_cipher("hello world", "lemon", CHARACTER_SET)
+        self.assertEqual(body, expected.encode())
+
+    async def test_stalled_body_is_closed(self):
+        # the client stops part way through a chunk and never sends the rest
+        response = await self.request(
+            b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\na\r\nhello"
+        )
+        self.assertFalse(response.endswith(b"0\r\n\r\n"))
+
+        response = await self.request(
+            b"POST / HTTP/1.1\r\nContent-Length: 100\r\n\r\nhello"
+        )
+        self.assertFalse(response.endswith(b"0\r\n\r\n"))
+
+
+# Keys are recovered from aligned plaintext and ciphertext
+class RecoverKeyTests(unittest.TestCase):
+    """recover_key() finds the key a text was encrypted with"""
+
+    def test_stream_longer_than_window(self):
+        # one block longer than the window the period is looked for in, as --stream
+        #  reads 1 MiB blocks
+        generator = random.Random(1)
+        text = "".join(
+            generator.choice(CHARACTER_SET) for _ in range(cipher.RECOVER_WINDOW + 5000)
+        )
+        encrypted = cipher.vigenere_cipher(text, "lemonade", CHARACTER_SET)
+
+        result = cipher.recover_key(
+            [(text, encrypted)], CHARACTER_SET, "Vigenere", per_line=False
+        )
+        self.assertEqual(result["key"], "lemonade")
+        self.assertEqual(result["conflicts"], 0)
+
+    def test_caesar(self):
+        for shift_type in ("right", "left"):
+            encrypted = cipher.caesar_cipher(
+                ENGLISH_TEXT, 17, CHARACTER_SET, False, shift_type
+            )
+            result = cipher.recover_key(
+                [(ENGLISH_TEXT, encrypted)], CHARACTER_SET, "Caesar", shift_type
+            )
+            self.assertEqual(result["key"], 17)
+            self.assertEqual(result["conflicts"], 0)
+
+    def test_vigenere_per_line(self):
+        pairs = [
+            (line, cipher.vigenere_cipher(line, "lemon", CHARACTER_SET))
+            for line in ENGLISH_TEXT.replace(". ", ".\n").splitlines(True)
+        ]
+        result = cipher.recover_key(pairs, CHARACTER_SET, "Vigenere")
+        self.assertEqual((result["key"], result["period"]), ("lemon", 5))
+        self.assertTrue(result["complete"])
+
+    def test_substitution(self):
+        characters = string.ascii_lowercase
+        text = ENGLISH_TEXT.lower()
+        encrypted = cipher.substitution_cipher(text, ALPHABET, characters)
+
+        result = cipher.recover_key([(text, encrypted)], characters, "Substitution")
+        self.assertEqual(result["key"], ALPHABET)
+        self.assertTrue(result["complete"])
+
+        # letters the text doesn't use are left unknown
+        result = cipher.recover_key(
+            [(text[:40], encrypted[:40])], characters, "Substitution"
+        )
+        self.assertFalse(result["complete"])
+        for letter in result["missing"]:
+            self.assertNotIn(letter, text[:40])
+            self.assertEqual(
+                result["key"][characters.index(letter)], cipher.RECOVER_UNKNOWN
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()